@@ -84,11 +84,14 @@ plt.close()
 # PLOT 4: Positional Error
 plt.figure()
 
-plt.plot(df_pos["timestamp"], df_pos["positional_error"])
+for pid in df_pos["client_id"].unique():
+    sub = df_pos[df_pos["client_id"] == pid]
+    plt.plot(sub["timestamp"], sub["positional_error"], label=f"Client {pid}")
 
 plt.xlabel("Timestamp (ms)")
 plt.ylabel("Positional Error")
 plt.title("Positional Error Over Time")
+plt.legend()
 
 plt.savefig("positional_error_plot.png")
 plt.close()
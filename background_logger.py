@@ -0,0 +1,183 @@
+"""
+Background batched logging for the server.
+
+The tick only calls BackgroundLogger.log(), which appends one record to a
+bounded in-memory ring and returns immediately. A daemon writer thread
+drains the ring every flush_interval seconds and writes the records in
+batches to files that are opened once.
+
+The ring is bounded by record count and by bytes (callers pass the size of
+big records, e.g. a copy of the grid). If either is used up the new record
+is dropped (and counted) instead of blocking, so disk stalls can never
+delay a snapshot or eat the server's memory.
+"""
+
+import csv
+import os
+import threading
+from collections import deque
+
+# queued by remove_sink(): close the sink once everything before it is written
+_CLOSE_SINK = object()
+
+
+class CsvSink:
+    """
+    One CSV file, opened once in append mode.
+    format_row(record) turns a queued record into a CSV row, so the
+    expensive formatting happens on the writer thread.
+    """
+
+    def __init__(self, path, header=None, format_row=None):
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        self.path = path
+        self.file = open(path, "a", newline="")
+        self.writer = csv.writer(self.file)
+        self.format_row = format_row
+
+        if header is not None and is_new:
+            self.writer.writerow(header)
+
+    def write_batch(self, records):
+        if self.format_row is not None:
+            records = map(self.format_row, records)
+        self.writer.writerows(records)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BackgroundLogger:
+
+    def __init__(self, capacity=8192, flush_interval=0.5, max_bytes=None):
+        """
+        capacity: records queued before dropping.
+        max_bytes: bytes queued (as passed to log()) before dropping, None = no limit.
+        """
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+
+        # (sink_name, record, size); deque append/popleft are atomic, no lock needed
+        self.ring = deque()
+        self.sinks = {}
+
+        # bytes queued = bytes_in - bytes_out; each is only written by one
+        # thread (log() / the writer), so no lock here either
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        # counters
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def add_sink(self, name, sink):
+        self.sinks[name] = sink
+
+    def remove_sink(self, name):
+        """
+        Close sink name on the writer thread after the records already
+        queued for it are written. Used when several servers share one
+        logger and one of them shuts down.
+        """
+        # bypasses the capacity check, a dropped close would leak the file
+        self.ring.append((name, _CLOSE_SINK, 0))
+
+    def queued_bytes(self):
+        return self.bytes_in - self.bytes_out
+
+    def log(self, name, record, size=0):
+        """
+        Queue one record for sink name. Never blocks.
+        size: bytes the record holds, counted against max_bytes (a record
+        bigger than max_bytes still fits into an otherwise empty ring).
+        Returns False if the ring was full and the record was dropped.
+        """
+        queued = self.bytes_in - self.bytes_out
+        if len(self.ring) >= self.capacity or (
+            self.max_bytes is not None and queued and queued + size > self.max_bytes
+        ):
+            self.dropped += 1
+            return False
+
+        self.ring.append((name, record, size))
+        self.bytes_in += size
+        self.logged += 1
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """
+        Stop the writer thread, flush what is left and close every sink.
+        """
+        if self._stopping:
+            return
+
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self._flush()
+        for sink in self.sinks.values():
+            sink.close()
+
+        if self.dropped:
+            print(f"[LOG] dropped {self.dropped} records (ring full)")
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._flush()
+
+    def _flush(self):
+        # only drain what is queued now, so a fast producer can't starve us
+        count = len(self.ring)
+        if count == 0:
+            return
+
+        batches = {}
+        closing = []
+        drained = 0
+        for _ in range(count):
+            name, record, size = self.ring.popleft()
+            drained += size
+            if record is _CLOSE_SINK:
+                closing.append(name)
+                continue
+            batches.setdefault(name, []).append(record)
+
+        for name, records in batches.items():
+            sink = self.sinks.get(name)
+            if sink is None:
+                continue
+            try:
+                sink.write_batch(records)
+                sink.flush()
+            except OSError as e:
+                print(f"[LOG] Error writing {name}:", e)
+                continue
+            self.written += len(records)
+
+        for name in closing:
+            sink = self.sinks.pop(name, None)
+            if sink is not None:
+                sink.close()
+
+        # only now are the records gone from memory
+        self.bytes_out += drained
+        self.batches += 1
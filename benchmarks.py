@@ -0,0 +1,444 @@
+"""
+GridClash microbenchmarks for the protocol and simulation hot paths.
+
+Every benchmark builds a fresh workload of `ops` operations, times running
+it (best of --repeat runs) and reports the cost per operation:
+
+header_pack         protocol.pack_header / PacketBuffer.message
+header_unpack       protocol.unpack_header
+snapshot_build      one GameServer.send_snapshots() tick (delta or full)
+decode_snapshot     client.decode_snapshot, whole board and 32x32 view
+update_grid         GridUI.update_grid diffing against a fake canvas
+event_handling      GameServer.handle_event on EVENT batches + the tick's apply_events
+game_over           GameServer.send_game_over scoring + packing
+
+Server and UI benchmarks run for every --grid-sizes x --players
+combination. Nothing goes on the wire: the server gets a fake transport
+and the UI a fake canvas and recording.
+
+Results are JSON (--output, default stdout) so runs on different commits
+can be compared: --compare old.json prints the ratio per benchmark and
+exits with 1 if anything got slower than --threshold.
+
+Run with: python benchmarks.py --output bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from array import array
+
+from protocol import (
+    MsgType, ALL_CODECS_MASK, EventType,
+    PacketBuffer, pack_header, unpack_header,
+)
+from server import GameServer
+from client import GridUI, decode_snapshot
+from snapshot_codec import decode_cells
+
+
+DEFAULT_GRID_SIZES = [20, 64, 256]
+DEFAULT_PLAYERS = [1, 8, 64]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.2     # --compare: slower than 1.2x = regression
+
+UI_VIEW_SIZE = 32           # as client.VIEW_SIZE
+UI_CHANGED_CELLS = 16       # cells differing between two update_grid calls
+EVENT_BATCH_SIZES = [1, 16]
+
+
+# ---------------------------------------------------------
+# Harness
+# ---------------------------------------------------------
+
+def measure(setup, run, repeat):
+    """
+    Best time of `repeat` runs of run(setup()), seconds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def result(name, params, ops, seconds, unit="op"):
+    return {
+        "name": name,
+        "params": params,
+        "ops": ops,
+        "unit": unit,
+        "best_s": seconds,
+        "per_op_us": seconds / ops * 1e6,
+        "ops_per_s": ops / seconds if seconds else 0.0,
+    }
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.datagrams = 0
+        self.bytes = 0
+
+    def sendto(self, packet, addr):
+        self.datagrams += 1
+        self.bytes += len(packet)
+
+    def close(self):
+        pass
+
+
+class FakeCanvas:
+
+    def __init__(self):
+        self.updates = 0
+
+    def itemconfig(self, item, **options):
+        self.updates += 1
+
+
+class NullRecording:
+
+    def write(self, *args):
+        pass
+
+
+def make_server(grid_size, players, view=None):
+    """
+    GameServer with `players` joined + ready clients (through the normal
+    JOIN / READY / VIEWPORT handlers) and a fake transport.
+    """
+    server = GameServer("127.0.0.1", 0, grid_size=grid_size, metrics_file=None, positions_file=None)
+    server.transport = FakeTransport()
+    out = PacketBuffer()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(players):
+            addr = ("127.0.0.1", 20000 + i)
+            server.datagram_received(bytes(out.message(MsgType.JOIN, ALL_CODECS_MASK, 0)), addr)
+            server.datagram_received(bytes(out.message(MsgType.READY)), addr)
+            if view is not None and view < grid_size:
+                row0 = (i * 7) % (grid_size - view + 1)
+                server.datagram_received(bytes(out.message(MsgType.VIEWPORT, row0, row0, view, view)), addr)
+
+    # the colors were "sent", nobody will ack them
+    server.reliable.pending.clear()
+    for session in server.sessions.live:
+        session.reliable_keys.clear()
+    return server
+
+
+def make_ui(view, grid_size):
+    ui = GridUI.__new__(GridUI)
+    ui.rows = ui.cols = view
+    ui.grid_size = grid_size
+    ui.view_row = ui.view_col = 0
+    ui.view_changed = False
+    ui.viewport_callback = None
+    ui.click_callback = None
+    ui.last_snapshot = None
+    ui.canvas = FakeCanvas()
+    ui.recording = NullRecording()
+    ui.cells = [[r * view + c for c in range(view)] for r in range(view)]
+    return ui
+
+
+# ---------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------
+
+def bench_header(ops, repeat):
+    results = []
+
+    def run_pack(_):
+        for i in range(ops):
+            pack_header(MsgType.SNAPSHOT, i, i, 1700000000000, 512)
+    results.append(result("header_pack", {"api": "pack_header"}, ops, measure(lambda: None, run_pack, repeat)))
+
+    out = PacketBuffer()
+
+    def run_buffer(_):
+        for i in range(ops):
+            out.message(MsgType.SNAPSHOT_ACK, i, snapshot_id=i, timestamp_ms=1700000000000)
+    results.append(result("header_pack", {"api": "PacketBuffer.message"}, ops, measure(lambda: None, run_buffer, repeat)))
+
+    packet = pack_header(MsgType.SNAPSHOT, 1, 1, 1700000000000, 512) + bytes(512)
+
+    def run_unpack(_):
+        for _ in range(ops):
+            unpack_header(packet)
+    results.append(result("header_unpack", {"api": "unpack_header"}, ops, measure(lambda: None, run_unpack, repeat)))
+    return results
+
+
+def bench_snapshot_build(grid_size, players, ticks, repeat):
+    results = []
+    changes_per_tick = max(1, players)
+
+    for mode in ("delta", "full"):
+        def setup():
+            server = make_server(grid_size, players)
+            rng = random.Random(1)
+            cells = [rng.randrange(grid_size * grid_size) for _ in range(ticks * changes_per_tick)]
+            return server, cells
+
+        def run(state):
+            server, cells = state
+            seqs = {}
+            sessions = list(server.sessions.live)
+            for tick in range(ticks):
+                for i in range(changes_per_tick):
+                    session = sessions[i % len(sessions)]
+                    seq = seqs.get(session, 0)
+                    seqs[session] = seq + 1
+                    server.accept_event(session, seq, cells[tick * changes_per_tick + i])
+
+                server.send_snapshots()
+
+                if mode == "delta":
+                    # every client acks right away, as on a good link
+                    for session in sessions:
+                        session.acked_snapshot = server.snapshot_id - 1
+
+        results.append(result(
+            "snapshot_build",
+            {"grid_size": grid_size, "players": players, "mode": mode},
+            ticks, measure(setup, run, repeat), unit="tick",
+        ))
+    return results
+
+
+def bench_decode_snapshot(grid_size, ops, repeat):
+    rng = random.Random(1)
+    cells = array("H", [rng.randrange(8) for _ in range(grid_size * grid_size)])
+    view = min(UI_VIEW_SIZE, grid_size)
+
+    results = []
+    for window, args in (("board", ()), ("view", (0, 0, view, view))):
+        def run(_):
+            for _ in range(ops):
+                decode_snapshot(cells, grid_size, *args)
+        results.append(result(
+            "decode_snapshot", {"grid_size": grid_size, "window": window},
+            ops, measure(lambda: None, run, repeat),
+        ))
+
+    # tile decode as the assembler does it (RAW body of one 16x16 tile)
+    body = bytes(512)
+
+    def run_tile(_):
+        for _ in range(ops):
+            decode_cells(0, memoryview(body), 256)
+    results.append(result("decode_snapshot", {"grid_size": grid_size, "window": "raw_tile"},
+                          ops, measure(lambda: None, run_tile, repeat)))
+    return results
+
+
+def bench_update_grid(grid_size, players, ops, repeat):
+    view = min(UI_VIEW_SIZE, grid_size)
+    rng = random.Random(1)
+
+    # two frames differing in UI_CHANGED_CELLS cells, drawn alternately
+    frame_a = [[rng.randrange(players + 1) for _ in range(view)] for _ in range(view)]
+    frame_b = [row[:] for row in frame_a]
+    for _ in range(UI_CHANGED_CELLS):
+        r, c = rng.randrange(view), rng.randrange(view)
+        frame_b[r][c] = (frame_b[r][c] + 1) % (players + 1)
+    frames = (frame_a, frame_b)
+
+    def setup():
+        ui = make_ui(view, grid_size)
+        ui.update_grid(frame_a)
+        return ui
+
+    def run(ui):
+        for i in range(ops):
+            ui.update_grid(frames[(i + 1) % 2])
+
+    return [result(
+        "update_grid", {"grid_size": grid_size, "players": players, "view": view},
+        ops, measure(setup, run, repeat), unit="frame",
+    )]
+
+
+def bench_event_handling(grid_size, players, batches, repeat):
+    results = []
+    for batch_size in EVENT_BATCH_SIZES:
+        def setup():
+            server = make_server(grid_size, players)
+            pids = [session.player_id for session in server.sessions.live]
+            addrs = {session.player_id: session.addr for session in server.sessions.live}
+
+            out = PacketBuffer()
+            rng = random.Random(1)
+            seqs = dict.fromkeys(pids, 0)
+            packets = []
+            for i in range(batches):
+                pid = pids[i % len(pids)]
+                events = []
+                for _ in range(batch_size):
+                    events.append((seqs[pid] % 65536, EventType.CLICK, rng.randrange(grid_size * grid_size), 0))
+                    seqs[pid] += 1
+                packets.append((bytes(out.event_batch(pid, events)), addrs[pid]))
+            return server, packets
+
+        def run(state):
+            server, packets = state
+            with contextlib.redirect_stdout(io.StringIO()):
+                for data, addr in packets:
+                    server.datagram_received(data, addr)
+                server.apply_events()
+
+        seconds = measure(setup, run, repeat)
+        results.append(result(
+            "event_handling",
+            {"grid_size": grid_size, "players": players, "batch_size": batch_size},
+            batches * batch_size, seconds, unit="event",
+        ))
+    return results
+
+
+def bench_game_over(grid_size, players, ops, repeat):
+    def setup():
+        server = make_server(grid_size, players)
+        pids = [session.player_id for session in server.sessions.live]
+        for cell in range(grid_size * grid_size):
+            server.state.claim(cell, pids[cell % len(pids)])
+        return server
+
+    def run(server):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(ops):
+                server.send_game_over()
+
+    return [result(
+        "game_over", {"grid_size": grid_size, "players": players},
+        ops, measure(setup, run, repeat),
+    )]
+
+
+# ---------------------------------------------------------
+# Main
+# ---------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(grid_sizes, player_counts, repeat, scale, only=None):
+    def wanted(name):
+        return only is None or any(o in name for o in only)
+
+    results = []
+    if wanted("header"):
+        results += bench_header(int(100000 * scale), repeat)
+
+    for grid_size in grid_sizes:
+        if wanted("decode_snapshot"):
+            results += bench_decode_snapshot(grid_size, max(1, int(2000 * scale * 64 / grid_size)), repeat)
+
+        for players in player_counts:
+            if wanted("snapshot_build"):
+                results += bench_snapshot_build(grid_size, players, max(1, int(100 * scale)), repeat)
+            if wanted("update_grid"):
+                results += bench_update_grid(grid_size, players, max(1, int(2000 * scale)), repeat)
+            if wanted("event_handling"):
+                results += bench_event_handling(grid_size, players, max(1, int(5000 * scale)), repeat)
+            if wanted("game_over"):
+                results += bench_game_over(grid_size, players, max(1, int(200 * scale)), repeat)
+
+        print(f"[BENCH] grid {grid_size} done", file=sys.stderr)
+
+    return results
+
+
+def result_key(entry):
+    return entry["name"], json.dumps(entry["params"], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print new / old time per benchmark; returns the regressions.
+    """
+    old = {result_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+
+    for entry in results:
+        before = old.get(result_key(entry))
+        if before is None:
+            continue
+        ratio = entry["per_op_us"] / before["per_op_us"] if before["per_op_us"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  <-- REGRESSION"
+            regressions.append(entry)
+        print(
+            f"{entry['name']:<16} {json.dumps(entry['params'], sort_keys=True):<60} "
+            f"{before['per_op_us']:>10.2f} -> {entry['per_op_us']:>10.2f} us  x{ratio:.2f}{flag}",
+            file=sys.stderr,
+        )
+    return regressions
+
+
+def parse_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GridClash microbenchmarks")
+    parser.add_argument("--grid-sizes", type=parse_list, default=DEFAULT_GRID_SIZES)
+    parser.add_argument("--players", type=parse_list, default=DEFAULT_PLAYERS)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--quick", action="store_true", help="10x smaller workloads")
+    parser.add_argument("--only", nargs="*", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    results = run_all(args.grid_sizes, args.players, args.repeat, 0.1 if args.quick else 1.0, args.only)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "quick": args.quick,
+        },
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+GridClash headless bot swarm (load generator).
+
+Runs many simulated players from one process on one asyncio loop, no
+window. Every bot is a full protocol client with its own UDP socket:
+JOIN / JOIN_ACK, READY, PLAYER_COLOR_ACK, clicks sent as batched EVENTs
+(event_batch.EventBatcher, same timeouts as client.py), acks from SNAPSHOT
+chunk headers and EVENT_ACK, SNAPSHOT_ACK (client.SnapshotAssembler),
+HEARTBEAT, optional VIEWPORT and GAME_OVER_ACK.
+
+Clicks follow a per-bot rate and one of CLICK_DISTRIBUTIONS. At the end it
+writes one row per bot to BOT_CSV (snapshot latency and EVENT ack RTT
+percentiles, clicks, retransmits, ...) and prints the swarm-wide summary.
+
+Latency is recv time - server timestamp of the SNAPSHOT (run the swarm on
+the server's machine or with synced clocks). ACK RTT is the time from an
+event's first transmission to the ack that covers it.
+
+Run with: python bot_swarm.py --bots 1000 --rate 2 --dist poisson --duration 60
+(a thousand bots need a thousand sockets; the soft open-file limit is raised
+to the hard limit at startup)
+"""
+
+import argparse
+import asyncio
+import csv
+import random
+import time
+
+from client import (
+    SnapshotAssembler,
+    SERVER_IP, SERVER_PORT, ROOM_ID,
+    EVENT_TIMEOUT_MS, MAX_EVENT_RETRIES, EVENT_SEND_INTERVAL_MS,
+)
+from event_batch import EventBatcher
+from server_stats import percentiles
+from protocol import (
+    MsgType, PROTOCOL_ID, VERSION,
+    ALL_CODECS_MASK, EventType,
+    PacketBuffer,
+    unpack_header, unpack_payload, unpack_snapshot_header,
+)
+
+BOT_CSV = "bot_metrics.csv"
+
+HEARTBEAT_INTERVAL = 1.0    # seconds, as client.send_heartbeat
+JOIN_TIMEOUT = 1.0          # seconds per JOIN attempt
+JOIN_RETRIES = 10
+READY_COPIES = 3            # READY is unreliable, client.py sends it 3 times
+
+BURST_SIZE = 5              # clicks per burst for the "burst" distribution
+BURST_GAP = 0.02            # seconds between clicks inside a burst
+
+
+# ---------------------------------------------------------
+# Click-rate distributions
+# ---------------------------------------------------------
+# gap(rate, rng, clicks_so_far) -> seconds until the next click, for a mean
+# of `rate` clicks per second
+
+def gap_constant(rate, rng, n):
+    return 1.0 / rate
+
+
+def gap_uniform(rate, rng, n):
+    return rng.uniform(0.0, 2.0 / rate)
+
+
+def gap_poisson(rate, rng, n):
+    return rng.expovariate(rate)
+
+
+def gap_burst(rate, rng, n):
+    # BURST_SIZE quick clicks, then a pause so the mean rate still holds
+    if (n + 1) % BURST_SIZE:
+        return BURST_GAP
+    return rng.expovariate(rate / BURST_SIZE)
+
+
+CLICK_DISTRIBUTIONS = {
+    "constant": gap_constant,
+    "uniform": gap_uniform,
+    "poisson": gap_poisson,
+    "burst": gap_burst,
+}
+
+
+# ---------------------------------------------------------
+# One bot
+# ---------------------------------------------------------
+
+class Bot(asyncio.DatagramProtocol):
+
+    def __init__(self, index, addr, out, rng, view=0, room_id=ROOM_ID):
+        self.index = index
+        self.addr = addr            # switches to the room's address after JOIN_ACK
+        self.out = out              # shared by every bot, the loop is single-threaded
+        self.rng = rng
+        self.view = view
+        self.room_id = room_id
+
+        self.transport = None
+        self.joined = None
+
+        self.player_id = None
+        self.grid_size = None
+        self.assembler = None
+        self.events = None
+        self.viewport = None
+        self.game_over = False
+
+        # metrics
+        self.latencies = []         # ms, one per snapshot
+        self.ack_rtts = []          # ms, one per acked event
+        self.last_snapshot_id = -1
+        self.clicks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.started_at = None
+
+    # ----- asyncio.DatagramProtocol -----
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        pass
+
+    def datagram_received(self, data, addr):
+        self.bytes_in += len(data)
+
+        header = unpack_header(data)
+        if header is None:
+            return
+        prot_id, ver, msg_type, snapshot_id, _seq, timestamp_ms, _plen = header
+        if prot_id != PROTOCOL_ID or ver != VERSION:
+            return
+
+        if msg_type == MsgType.JOIN_ACK:
+            self.on_join_ack(data, addr)
+        elif msg_type == MsgType.JOIN_NACK:
+            if self.joined is not None and not self.joined.done():
+                self.joined.set_result(False)
+        elif self.events is None:
+            return
+        elif msg_type == MsgType.SNAPSHOT:
+            self.on_snapshot(data, snapshot_id, timestamp_ms)
+        elif msg_type == MsgType.EVENT_ACK:
+            event_acks = unpack_payload(MsgType.EVENT_ACK, data)
+            if event_acks is not None:
+                self.events.ack(*event_acks, now_ms=int(time.time() * 1000))
+        elif msg_type == MsgType.PLAYER_COLOR:
+            color = unpack_payload(MsgType.PLAYER_COLOR, data)
+            if color is not None:
+                self.send(MsgType.PLAYER_COLOR_ACK, color[0])
+        elif msg_type == MsgType.GAME_OVER:
+            self.game_over = True
+            self.send(MsgType.GAME_OVER_ACK, self.player_id)
+
+    # ----- incoming -----
+
+    def on_join_ack(self, data, addr):
+        join_ack = unpack_payload(MsgType.JOIN_ACK, data)
+        if join_ack is None or self.joined is None or self.joined.done():
+            return
+
+        # bots never join the multicast group, they stay on unicast
+        player_id, grid_size, _tick_rate, _r, _g, _b, _codecs, tile_size, _room_id, _group, _group_port = join_ack
+        self.addr = addr
+        self.player_id = player_id
+        self.grid_size = grid_size
+        self.assembler = SnapshotAssembler(grid_size, tile_size)
+        self.events = EventBatcher(
+            self.send_event_batch,
+            player_id,
+            timeout_ms=EVENT_TIMEOUT_MS,
+            max_retries=MAX_EVENT_RETRIES,
+            on_acked=lambda seq, rtt_ms: self.ack_rtts.append(rtt_ms),
+        )
+        self.joined.set_result(True)
+
+    def on_snapshot(self, data, snapshot_id, timestamp_ms):
+        now_ms = int(time.time() * 1000)
+
+        snapshot_header = unpack_snapshot_header(data)
+        if snapshot_header is not None:
+            self.events.ack(*snapshot_header[-2:], now_ms=now_ms)
+
+        _applied, complete = self.assembler.apply_chunk(snapshot_id, data)
+        if complete:
+            self.send(MsgType.SNAPSHOT_ACK, snapshot_id, snapshot_id=snapshot_id)
+
+        # once per snapshot, on its first chunk (as client.py)
+        if snapshot_id > self.last_snapshot_id:
+            self.last_snapshot_id = snapshot_id
+            self.latencies.append(max(0, now_ms - timestamp_ms))
+
+    # ----- outgoing -----
+
+    def send(self, msg_type, *fields, snapshot_id=0, seq_num=0):
+        packet = self.out.message(
+            msg_type, *fields,
+            snapshot_id=snapshot_id,
+            seq_num=seq_num,
+            timestamp_ms=int(time.time() * 1000),
+        )
+        self.bytes_out += len(packet)
+        self.transport.sendto(packet, self.addr)
+
+    def send_event_batch(self, packet, first_seq):
+        self.bytes_out += len(packet)
+        self.transport.sendto(packet, self.addr)
+
+    def send_viewport(self):
+        size = min(self.view, self.grid_size)
+        row0 = self.rng.randrange(self.grid_size - size + 1)
+        col0 = self.rng.randrange(self.grid_size - size + 1)
+        self.viewport = (row0, col0, size, size)
+        self.send(MsgType.VIEWPORT, *self.viewport)
+
+    # ----- lifecycle -----
+
+    async def join(self):
+        """
+        JOIN until JOIN_ACK, then READY. Returns False if the server never
+        answered or refused the JOIN (JOIN_NACK).
+        """
+        self.joined = asyncio.get_running_loop().create_future()
+        for _ in range(JOIN_RETRIES):
+            self.send(MsgType.JOIN, ALL_CODECS_MASK, self.room_id)
+            try:
+                if not await asyncio.wait_for(asyncio.shield(self.joined), JOIN_TIMEOUT):
+                    return False
+                break
+            except asyncio.TimeoutError:
+                continue
+        else:
+            return False
+
+        for _ in range(READY_COPIES):
+            self.send(MsgType.READY)
+
+        if 0 < self.view < self.grid_size:
+            self.send_viewport()
+
+        self.started_at = time.time()
+        return True
+
+    async def click_loop(self, rate, gap, until):
+        while not self.game_over:
+            await asyncio.sleep(gap(rate, self.rng, self.clicks))
+            if time.time() >= until:
+                return
+
+            if self.viewport is None:
+                row, col = self.rng.randrange(self.grid_size), self.rng.randrange(self.grid_size)
+            else:
+                row0, col0, rows, cols = self.viewport
+                row, col = row0 + self.rng.randrange(rows), col0 + self.rng.randrange(cols)
+
+            self.events.add(EventType.CLICK, row * self.grid_size + col, int(time.time() * 1000))
+            self.clicks += 1
+
+    def heartbeat(self):
+        self.send(MsgType.HEARTBEAT)
+        # VIEWPORT is unreliable, repeat it like client.py does
+        if self.viewport is not None:
+            self.send(MsgType.VIEWPORT, *self.viewport)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def summary(self):
+        elapsed = time.time() - self.started_at if self.started_at else 0
+        latency = percentiles(self.latencies, (50, 95, 99))
+        rtt = percentiles(self.ack_rtts, (50, 95, 99))
+        return {
+            "bot": self.index,
+            "player_id": self.player_id,
+            "snapshots": len(self.latencies),
+            "latency_ms_p50": latency["p50"],
+            "latency_ms_p95": latency["p95"],
+            "latency_ms_p99": latency["p99"],
+            "ack_rtt_ms_p50": rtt["p50"],
+            "ack_rtt_ms_p95": rtt["p95"],
+            "ack_rtt_ms_p99": rtt["p99"],
+            "clicks": self.clicks,
+            "acked": len(self.ack_rtts),
+            "batches": self.events.batches if self.events else 0,
+            "retransmits": self.events.retransmits if self.events else 0,
+            "give_ups": self.events.give_ups if self.events else 0,
+            "pending": len(self.events) if self.events else 0,
+            "kbps_in": self.bytes_in * 8 / 1000 / elapsed if elapsed else 0,
+            "kbps_out": self.bytes_out * 8 / 1000 / elapsed if elapsed else 0,
+        }
+
+
+# ---------------------------------------------------------
+# Swarm
+# ---------------------------------------------------------
+
+def raise_open_file_limit():
+    try:
+        import resource
+    except ImportError:
+        return  # Windows
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def pump(bots, until):
+    """
+    One task for the whole swarm (not one per bot): EVENT batches every
+    EVENT_SEND_INTERVAL_MS and heartbeats every HEARTBEAT_INTERVAL.
+    """
+    next_heartbeat = 0.0
+    while time.time() < until:
+        now = time.time()
+        now_ms = int(now * 1000)
+        for bot in bots:
+            if bot.events is not None:
+                bot.events.poll(now_ms)
+
+        if now >= next_heartbeat:
+            for bot in bots:
+                if bot.events is not None:
+                    bot.heartbeat()
+            next_heartbeat = now + HEARTBEAT_INTERVAL
+
+        await asyncio.sleep(EVENT_SEND_INTERVAL_MS / 1000)
+
+
+async def start_bot(bot, rate, gap, until, delay):
+    await asyncio.sleep(delay)
+    if not await bot.join():
+        print(f"[SWARM] Bot {bot.index} was not let in, giving up")
+        return
+    await bot.click_loop(rate, gap, until)
+
+
+async def run_swarm(host, port, num_bots, duration, rate, dist, ramp, view, seed, csv_file):
+    loop = asyncio.get_running_loop()
+    raise_open_file_limit()
+
+    rng = random.Random(seed)
+    gap = CLICK_DISTRIBUTIONS[dist]
+    out = PacketBuffer()
+
+    bots = []
+    for i in range(num_bots):
+        bot = Bot(i, (host, port), out, random.Random(rng.random()), view=view)
+        await loop.create_datagram_endpoint(lambda bot=bot: bot, local_addr=("0.0.0.0", 0))
+        bots.append(bot)
+
+    print(f"[SWARM] {num_bots} bots -> {(host, port)}, {rate} clicks/s each ({dist}), {duration}s")
+    until = time.time() + ramp + duration
+    tasks = [
+        loop.create_task(start_bot(bot, rate, gap, until, ramp * i / num_bots))
+        for i, bot in enumerate(bots)
+    ]
+    pump_task = loop.create_task(pump(bots, until))
+
+    await asyncio.gather(*tasks)
+    await pump_task
+
+    # let the last batches get acked
+    await asyncio.sleep(EVENT_TIMEOUT_MS / 1000)
+    for bot in bots:
+        bot.close()
+
+    report(bots, csv_file)
+
+
+def report(bots, csv_file):
+    rows = [bot.summary() for bot in bots]
+
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    joined = [bot for bot in bots if bot.player_id is not None]
+    latency = percentiles([ms for bot in bots for ms in bot.latencies], (50, 95, 99))
+    rtt = percentiles([ms for bot in bots for ms in bot.ack_rtts], (50, 95, 99))
+
+    print(f"[SWARM] {len(joined)}/{len(bots)} bots joined")
+    print(f"[SWARM] snapshots: {sum(r['snapshots'] for r in rows)} | "
+          f"latency ms p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+    print(f"[SWARM] clicks: {sum(r['clicks'] for r in rows)}, acked {sum(r['acked'] for r in rows)}, "
+          f"retransmits {sum(r['retransmits'] for r in rows)}, give-ups {sum(r['give_ups'] for r in rows)} | "
+          f"ack RTT ms p50={rtt['p50']} p95={rtt['p95']} p99={rtt['p99']}")
+    print(f"[SWARM] per-bot results in {csv_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GridClash headless bot swarm")
+    parser.add_argument("--host", default=SERVER_IP)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--bots", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of clicking after the ramp")
+    parser.add_argument("--rate", type=float, default=2.0, help="mean clicks per second per bot")
+    parser.add_argument("--dist", choices=sorted(CLICK_DISTRIBUTIONS), default="poisson")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which bots join")
+    parser.add_argument("--view", type=int, default=0, help="viewport size to announce (0 = whole board)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--csv", default=BOT_CSV)
+    args = parser.parse_args()
+    if args.bots < 1:
+        parser.error("--bots must be at least 1")
+    if args.rate <= 0:
+        parser.error("--rate must be more than 0 clicks per second")
+
+    try:
+        asyncio.run(run_swarm(
+            args.host, args.port, args.bots, args.duration, args.rate,
+            args.dist, args.ramp, args.view, args.seed, args.csv,
+        ))
+    except KeyboardInterrupt:
+        print("\n[SWARM] Interrupted")
+
+
+if __name__ == "__main__":
+    main()
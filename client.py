@@ -1,25 +1,29 @@
+import select
 import socket
 import time
-import struct
 import csv
 import os
-import tkinter as tk
-from threading import Thread , Lock
+from array import array
+from threading import Thread , Lock, local
 from queue import SimpleQueue
 
+from event_batch import EventBatcher
+from recording import RecordingWriter, UNKNOWN_CELL
+from snapshot_codec import decode_cells
+from grid_tiles import TileLayout
+
 from protocol import (
-    HEADER_FORMAT,
     HEADER_SIZE,
     MsgType,
     PROTOCOL_ID,
     VERSION,
-    GRID_SIZE,
-    SNAPSHOT_SIZE,
+    SnapshotKind,
+    ALL_CODECS_MASK,
+    SNAPSHOT_HEADER_SIZE,
     EventType,
-    EVENT_FORMAT,
-    EVENT_SIZE,
-    PLAYER_COLOR_ACK_FORMAT, PLAYER_COLOR_ACK_SIZE,
-    PLAYER_COLOR_FORMAT
+    NO_MULTICAST_GROUP,
+    PacketBuffer,
+    unpack_header, unpack_payload, unpack_snapshot_header, unpack_game_over,
 )
 
 # ==========================
@@ -29,24 +33,29 @@ from protocol import (
 snapshot_queue = SimpleQueue()
 FRAME_TIME_MS = 50      # UI refresh ~20 FPS (match TICK_RATE=20)
 MAX_QUEUE = 3           # don't let queue grow too large
+FRAME_HISTORY = 32      # incomplete snapshots we keep collecting chunks for
 
 # Event Handling
-pending_events = {}   
 pending_lock = Lock()
 MAX_EVENT_RETRIES = 6
 EVENT_TIMEOUT_MS = 300
+EVENT_SEND_INTERVAL_MS = 10    # clicks in the same interval share one EVENT datagram
 
 # ==========================
 # CSV Metrics
 # ==========================
 
 CSV_FILE = "client_metrics.csv"
+POSITIONS_FILE = "client_positions.bin"   # binary recording, see recording.py
 last_recv_time = None
 bytes_received_this_second = 0
 last_bandwidth_time = int(time.time())
 current_bandwidth_kbps = 0
 
-if not os.path.exists(CSV_FILE):
+
+def init_metrics_csv():
+    if os.path.exists(CSV_FILE):
+        return
     with open(CSV_FILE, "w", newline="") as f:
         writer = csv.writer(f)
         writer.writerow([
@@ -60,11 +69,17 @@ if not os.path.exists(CSV_FILE):
             "bandwidth_per_client_kbps",
         ])
 
+
 # ==========================
 # Grid / UI settings
 # ==========================
+# tkinter is only imported where a window is built, so the networking
+# parts of this file also work headless (see bot_swarm.py)
 
 CELL_SIZE = 20
+VIEW_SIZE = 32          # cells shown per side, bigger boards are panned
+PAN_STEP = 8            # cells per arrow key press
+MINIMAP_SIZE = 160      # pixels, only shown when the board doesn't fit the view
 player_colors = {}
 click_enabled = True
 
@@ -94,10 +109,22 @@ def get_color_for_player(pid):
 
 
 class GridUI:
-    def __init__(self, root, rows, cols):
+    """
+    Shows a rows x cols window of a grid_size x grid_size board, starting
+    at (view_row, view_col). pan() moves the window.
+    """
+
+    def __init__(self, root, rows, cols, grid_size=None):
         self.rows = rows
         self.cols = cols
+        self.grid_size = rows if grid_size is None else grid_size
+
+        self.view_row = 0
+        self.view_col = 0
+        self.view_changed = False
+        self.viewport_callback = None
 
+        import tkinter as tk
         self.canvas = tk.Canvas(
             root,
             width=cols * CELL_SIZE,
@@ -110,6 +137,9 @@ class GridUI:
         self.click_callback = None
         self.last_snapshot = None
 
+        # whole local grid, shared by all clients in the working directory
+        self.recording = RecordingWriter(POSITIONS_FILE, self.grid_size)
+
         # Create rectangles for all cells
         self.cells = []
         for r in range(rows):
@@ -134,12 +164,32 @@ class GridUI:
         row = event.y // CELL_SIZE
 
         if 0 <= row < self.rows and 0 <= col < self.cols:
-            self.click_callback(row, col)
+            self.click_callback(self.view_row + row, self.view_col + col)
 
     def set_click_callback(self, callback):
         self.click_callback = callback
 
-    def update_grid(self, snapshot, force_full_render=False):
+    def set_viewport_callback(self, callback):
+        self.viewport_callback = callback
+        callback(self.viewport())
+
+    def viewport(self):
+        return self.view_row, self.view_col, self.rows, self.cols
+
+    def pan(self, d_row, d_col):
+        view_row = min(max(self.view_row + d_row, 0), self.grid_size - self.rows)
+        view_col = min(max(self.view_col + d_col, 0), self.grid_size - self.cols)
+        if (view_row, view_col) == (self.view_row, self.view_col):
+            return
+
+        self.view_row, self.view_col = view_row, view_col
+        self.last_snapshot = None    # every visible cell changes
+        self.view_changed = True
+
+        if self.viewport_callback is not None:
+            self.viewport_callback(self.viewport())
+
+    def update_grid(self, snapshot, force_full_render=False, snapshot_id=0, record_cells=None):
         if len(snapshot) != self.rows or any(len(r) != self.cols for r in snapshot):
             print("[UI] malformed snapshot received, ignoring")
             return
@@ -151,32 +201,72 @@ class GridUI:
                     val = int(snapshot[r][c])
                     color = get_color_for_player(val)
                     self.canvas.itemconfig(self.cells[r][c], fill=color)
-            self.last_snapshot = snapshot
-            return
-
-        # Incremental updates
-        for r in range(self.rows):
-            for c in range(self.cols):
-                if snapshot[r][c] != self.last_snapshot[r][c]:
-                    val = int(snapshot[r][c])
-                    color = get_color_for_player(val)
-                    self.canvas.itemconfig(self.cells[r][c], fill=color)
+        else:
+            # Incremental updates
+            for r in range(self.rows):
+                for c in range(self.cols):
+                    if snapshot[r][c] != self.last_snapshot[r][c]:
+                        val = int(snapshot[r][c])
+                        color = get_color_for_player(val)
+                        self.canvas.itemconfig(self.cells[r][c], fill=color)
 
         self.last_snapshot = snapshot
 
-        # Optional logging of visible grid
+        # Optional logging of the grid (record_cells = whole board, when
+        # the snapshot is only the visible window, see viewport_cells)
         try:
-            flat = [cell for row in snapshot for cell in row]
+            if record_cells is None:
+                record_cells = [cell for row in snapshot for cell in row]
             now_ms = int(time.time() * 1000)
-            with open("client_positions.csv", "a", newline="") as f:
-                writer = csv.writer(f)
-                writer.writerow([player_id_global, now_ms] + flat)
+            self.recording.write(snapshot_id, now_ms, player_id_global, record_cells)
         except Exception as e:
             print("[CLIENT] Error logging displayed grid:", e)
 
 
+class Minimap:
+    """
+    Whole board at one pixel block per tile, from OVERVIEW snapshots,
+    with the visible window outlined.
+    """
+
+    def __init__(self, root, size):
+        self.size = size
+        self.cell = max(1, MINIMAP_SIZE // size)
+
+        import tkinter as tk
+        self.canvas = tk.Canvas(root, width=size * self.cell, height=size * self.cell, bg="white")
+        self.canvas.pack(pady=(0, 10))
+
+        self.last = [0] * (size * size)
+        self.cells = [
+            self.canvas.create_rectangle(
+                c * self.cell, r * self.cell,
+                (c + 1) * self.cell, (r + 1) * self.cell,
+                width=0, fill="white",
+            )
+            for r in range(size) for c in range(size)
+        ]
+        self.view_rect = self.canvas.create_rectangle(0, 0, 0, 0, outline="black")
+
+    def update_map(self, overview, tile_size, viewport):
+        for i, val in enumerate(overview):
+            if val != self.last[i]:
+                self.canvas.itemconfig(self.cells[i], fill=get_color_for_player(val))
+                self.last[i] = val
+
+        row0, col0, rows, cols = viewport
+        scale = self.cell / tile_size
+        self.canvas.coords(
+            self.view_rect,
+            col0 * scale, row0 * scale,
+            (col0 + cols) * scale, (row0 + rows) * scale,
+        )
+        self.canvas.tag_raise(self.view_rect)
+
+
 class ColorLegend:
     def __init__(self, root):
+        import tkinter as tk
         self.frame = tk.Frame(root, padx=10, pady=10)
         self.frame.pack(side="right", fill="y")
 
@@ -186,6 +276,7 @@ class ColorLegend:
         self.entries = {}  # pid → (color_box, label)
 
     def update_legend(self):
+        import tkinter as tk
         for pid, (r, g, b) in list(player_colors.items()):
             color_hex = f"#{r:02x}{g:02x}{b:02x}"
 
@@ -209,43 +300,127 @@ class ColorLegend:
 # Networking helpers
 # ==========================
 
-def pack_header(msg_type, snapshot_id, seq_num, timestamp_ms, payload_len):
-    return struct.pack(
-        HEADER_FORMAT,
-        PROTOCOL_ID,
-        VERSION,
-        msg_type,
-        snapshot_id,
-        seq_num,
-        timestamp_ms,
-        payload_len,
-    )
-
+# change if your server runs on another IP; run_all_tests.sh points these at
+# netem_proxy.py through the environment
+SERVER_IP = os.environ.get("GRIDCLASH_SERVER_IP", "192.168.1.3")
+SERVER_PORT = int(os.environ.get("GRIDCLASH_SERVER_PORT", 5005))
+ADDR = (SERVER_IP, SERVER_PORT)   # switched to the room's address after JOIN_ACK
 
-SERVER_IP = "192.168.1.3"   # change if your server runs on another IP
-SERVER_PORT = 5005
-ADDR = (SERVER_IP, SERVER_PORT)
+ROOM_ID = 0     # room to join on a room_server.py deployment, 0 = any free seat
 
 player_id_global = None
-client_seq_num = 0
+grid_size_global = None
+
+# local copy of the grid, built from SNAPSHOT chunks (created after JOIN_ACK)
+assembler = None
+
+# (row0, col0, rows, cols) we told the server we're looking at
+viewport = None
+
+RECV_BUFFER_SIZE = 65535     # largest UDP datagram, big tile_size chunks exceed the MTU
 
 client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 client.settimeout(1)
 
+# Multicast SNAPSHOTs: if JOIN_ACK announces a group we join it and tell the
+# server (MULTICAST 1, repeated with the heartbeat). If nothing arrives from
+# the group for MULTICAST_SILENCE_MS we leave it and ask for unicast again
+# (MULTICAST 0). GRIDCLASH_MULTICAST=0 never joins.
+MULTICAST_ENABLED = os.environ.get("GRIDCLASH_MULTICAST", "1") != "0"
+MULTICAST_SILENCE_MS = 3000
+multicast_sock = None       # only the listener thread touches it after JOIN
+multicast_state = None      # what we last told the server, None = nothing
+last_multicast_ms = 0
+
+# UI, listener and heartbeat threads all send -> one packet buffer each
+_out = local()
+
+
+def out_buffer():
+    buf = getattr(_out, "buf", None)
+    if buf is None:
+        buf = _out.buf = PacketBuffer()
+    return buf
+
+
+def send_message(msg_type, *fields, snapshot_id=0, seq_num=0):
+    packet = out_buffer().message(
+        msg_type, *fields,
+        snapshot_id=snapshot_id,
+        seq_num=seq_num,
+        timestamp_ms=int(time.time() * 1000),
+    )
+    client.sendto(packet, ADDR)
+
+
+def local_ip_towards(addr):
+    """
+    Address of the interface we reach addr through (no packet is sent).
+    """
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect(addr)
+        return probe.getsockname()[0]
+    finally:
+        probe.close()
+
+
+def join_multicast(group, port):
+    """
+    Listen on the SNAPSHOT group from JOIN_ACK. Returns False if this
+    machine / network won't let us (-> stay on unicast).
+    """
+    global multicast_sock, multicast_state, last_multicast_ms
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # every client on this machine listens on the same port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Windows can't bind to a group address
+        sock.bind(("" if os.name == "nt" else socket.inet_ntoa(group), port))
+        membership = group + socket.inet_aton(local_ip_towards(ADDR))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    except OSError as e:
+        print(f"[CLIENT] Can't join multicast group {socket.inet_ntoa(group)}:{port}: {e} -> unicast")
+        sock.close()
+        return False
+
+    multicast_sock = sock
+    multicast_state = 1
+    last_multicast_ms = int(time.time() * 1000)
+    send_message(MsgType.MULTICAST, 1)
+    print(f"[CLIENT] Joined multicast group {socket.inet_ntoa(group)}:{port}")
+    return True
+
+
+def leave_multicast():
+    global multicast_sock, multicast_state
+
+    print(f"[CLIENT] No SNAPSHOT from the multicast group for {MULTICAST_SILENCE_MS} ms -> unicast")
+    multicast_sock.close()      # drops the membership too
+    multicast_sock = None
+    multicast_state = 0
+    send_message(MsgType.MULTICAST, 0)
+
+
+def on_event_give_up(seq):
+    print(f"[CLIENT] Event seq={seq} reached max retries -> giving up")
+
+
+def send_event_batch(packet, first_seq):
+    client.sendto(packet, ADDR)
+
+
+# unacknowledged click events (created after JOIN_ACK)
+# shared by UI / listener / sender threads -> always hold pending_lock
+events = None
+
 
 def intialize_client():
-    global player_id_global
+    global player_id_global, grid_size_global, assembler, events, ADDR
 
     print("[CLIENT] Sending JOIN ...")
 
-    join_header = pack_header(
-        MsgType.JOIN,
-        0,
-        0,
-        int(time.time() * 1000),
-        0,
-    )
-
     client.settimeout(1)
 
     # -------------------------
@@ -253,12 +428,14 @@ def intialize_client():
     # -------------------------
     while True:
         try:
-            client.sendto(join_header, ADDR)
+            # announce every snapshot codec we can decode
+            send_message(MsgType.JOIN, ALL_CODECS_MASK, ROOM_ID)
             print("[CLIENT] JOIN sent, waiting for JOIN_ACK...")
 
-            packet, addr = client.recvfrom(1024)
+            packet, addr = client.recvfrom(RECV_BUFFER_SIZE)
 
-            if len(packet) < HEADER_SIZE:
+            header = unpack_header(packet)
+            if header is None:
                 print("[CLIENT] Short packet received, ignoring")
                 continue
 
@@ -270,13 +447,19 @@ def intialize_client():
                 seq_num,
                 timestamp_ms,
                 payload_len,
-            ) = struct.unpack(HEADER_FORMAT, packet[:HEADER_SIZE])
+            ) = header
 
             # Validate
             if protocol_id != PROTOCOL_ID or version != VERSION:
                 print("[CLIENT] Invalid protocol/version, ignoring packet")
                 continue
 
+            if msg_type == MsgType.JOIN_NACK:
+                nack = unpack_payload(MsgType.JOIN_NACK, packet)
+                room = nack[0] if nack is not None else "?"
+                print(f"[CLIENT] JOIN refused: room {room} could not be opened")
+                raise SystemExit(1)
+
             if msg_type != MsgType.JOIN_ACK:
                 print(f"[CLIENT] Unexpected packet while waiting JOIN_ACK: {msg_type}")
                 continue
@@ -291,13 +474,13 @@ def intialize_client():
     # -------------------------
     # DECODE JOIN_ACK PAYLOAD
     # -------------------------
-    payload = packet[HEADER_SIZE:]
+    join_ack = unpack_payload(MsgType.JOIN_ACK, packet)
 
-    if len(payload) < 6:
+    if join_ack is None:
         print("[CLIENT] JOIN_ACK payload too short")
         return
 
-    player_id, grid_size, tick_rate, r, g, b = struct.unpack("!HBBBBB", payload)
+    player_id, grid_size, tick_rate, r, g, b, codecs, tile_size, room_id, group, group_port = join_ack
 
     player_colors[player_id] = (r, g, b)
 
@@ -306,37 +489,178 @@ def intialize_client():
     print(f"  grid_size = {grid_size}")
     print(f"  tick_rate = {tick_rate}")
     print(f"  player_color = {player_colors[player_id]}")
+    print(f"  codecs = {codecs:#04x}")
+    print(f"  tile_size = {tile_size}")
+    print(f"  room_id = {room_id} at {addr}")
+    if group != NO_MULTICAST_GROUP:
+        print(f"  multicast = {socket.inet_ntoa(group)}:{group_port}")
+
+    # a room server answers from the room's own socket, talk to it from now on
+    ADDR = addr
 
     player_id_global = player_id
+    grid_size_global = grid_size
+    assembler = SnapshotAssembler(grid_size, tile_size)
+    events = EventBatcher(
+        send_event_batch,
+        player_id,
+        timeout_ms=EVENT_TIMEOUT_MS,
+        max_retries=MAX_EVENT_RETRIES,
+        on_give_up=on_event_give_up,
+    )
 
     # -------------------------
     # SEND READY (MULTIPLE TIMES FOR RELIABILITY)
     # -------------------------
-    ready_header = pack_header(
-        MsgType.READY,
-        0,
-        0,
-        int(time.time() * 1000),
-        0,
-    )
-
     for i in range(3):
-        client.sendto(ready_header, ADDR)
+        send_message(MsgType.READY)
         print(f"[CLIENT] READY sent ({i+1}/3)")
         time.sleep(0.1)
 
     print("[CLIENT] READY PHASE COMPLETE")
 
-def decode_snapshot(snapshot_bytes):
-    grid = []
-    index = 0
-    for _ in range(GRID_SIZE):
-        row = []
-        for _ in range(GRID_SIZE):
-            row.append(snapshot_bytes[index])
-            index += 1
-        grid.append(row)
-    return grid
+    if MULTICAST_ENABLED and group != NO_MULTICAST_GROUP and group_port:
+        join_multicast(group, group_port)
+
+class SnapshotAssembler:
+    """
+    Local copy of the grid, rebuilt from SNAPSHOT chunks.
+
+    Every chunk carries one tile and is applied as soon as it arrives (unless
+    we already hold a newer version of that tile). A snapshot is complete once
+    all of its chunks arrived; only then do we ack it, because only then does
+    the local grid match the server's grid at that snapshot_id.
+
+    Tiles outside our viewport are not kept up to date by the server; OVERVIEW
+    chunks go into the separate coarse `overview` grid instead.
+    """
+
+    def __init__(self, grid_size, tile_size):
+        self.grid_size = grid_size
+        self.layout = TileLayout(grid_size, tile_size)
+
+        self.cells = array("H", bytes(2 * grid_size * grid_size))
+
+        # key = tile_index, value = snapshot_id of the version we hold
+        self.tile_snapshot = [-1] * self.layout.tile_count
+
+        # newest snapshot we hold completely (the only valid delta baselines
+        # are at or below this)
+        self.last_complete_id = -1
+
+        # key = snapshot_id, value = chunk indices received so far
+        self.frames = {}
+
+        # one cell per tile: most common owner
+        self.overview_layout = TileLayout(self.layout.tiles_per_side, tile_size)
+        self.overview = array("H", bytes(2 * self.layout.tile_count))
+        self.overview_snapshot = [-1] * self.overview_layout.tile_count
+        self.overview_changed = False
+
+    def apply_chunk(self, snapshot_id, packet):
+        """
+        Apply one SNAPSHOT packet (any bytes-like, a memoryview avoids copies).
+        Returns (applied, complete): whether the grid changed and whether
+        snapshot_id just became complete (-> ack it).
+        """
+        header = unpack_snapshot_header(packet)
+        if header is None:
+            return False, False
+
+        kind, codec, baseline_id, chunk_index, chunk_count, tile, _ack_seq, _ack_bits = header
+        body = packet[HEADER_SIZE + SNAPSHOT_HEADER_SIZE:]
+
+        if kind == SnapshotKind.OVERVIEW:
+            return self.apply_overview_chunk(snapshot_id, codec, chunk_count, tile, body), False
+        if kind not in (SnapshotKind.FULL, SnapshotKind.DELTA):
+            return False, False
+        if kind == SnapshotKind.DELTA and baseline_id > self.last_complete_id:
+            # based on a snapshot we never completed (e.g. we just rejoined)
+            return False, False
+
+        applied = False
+        if chunk_count > 0:
+            if tile >= self.layout.tile_count or chunk_index >= chunk_count:
+                return False, False
+
+            if snapshot_id > self.tile_snapshot[tile]:
+                values = decode_cells(codec, body, self.layout.cell_count(tile))
+                if values is None:
+                    return False, False
+                self.layout.store(self.cells, tile, values)
+                self.tile_snapshot[tile] = snapshot_id
+                applied = True
+
+        if snapshot_id <= self.last_complete_id:
+            return applied, False
+
+        received = self.frames.setdefault(snapshot_id, set())
+        received.add(chunk_index)
+        if len(received) < chunk_count:
+            # forget frames that are too old to ever complete
+            for old_id in [sid for sid in self.frames if sid < snapshot_id - FRAME_HISTORY]:
+                del self.frames[old_id]
+            return applied, False
+
+        # complete: older partial frames are superseded
+        self.last_complete_id = snapshot_id
+        for old_id in [sid for sid in self.frames if sid <= snapshot_id]:
+            del self.frames[old_id]
+        return applied, True
+
+    def apply_overview_chunk(self, snapshot_id, codec, chunk_count, tile, body):
+        if chunk_count == 0 or tile >= self.overview_layout.tile_count:
+            return False
+        if snapshot_id <= self.overview_snapshot[tile]:
+            return False
+
+        values = decode_cells(codec, body, self.overview_layout.cell_count(tile))
+        if values is None:
+            return False
+
+        self.overview_layout.store(self.overview, tile, values)
+        self.overview_snapshot[tile] = snapshot_id
+        self.overview_changed = True
+        return True
+
+
+def ack_events(ack_seq, ack_bits):
+    """
+    Stop retransmitting every pending EVENT covered by (ack_seq, ack_bits),
+    from a SNAPSHOT chunk header or a standalone EVENT_ACK.
+    """
+    with pending_lock:
+        events.ack(ack_seq, ack_bits)
+
+
+def send_snapshot_ack(snapshot_id):
+    send_message(MsgType.SNAPSHOT_ACK, snapshot_id, snapshot_id=snapshot_id)
+
+
+def send_viewport(rect):
+    global viewport
+    viewport = rect
+    send_message(MsgType.VIEWPORT, *rect)
+
+
+def decode_snapshot(cells, grid_size, row0=0, col0=0, rows=None, cols=None):
+    # flat grid -> list of rows (of the rows x cols window at row0, col0)
+    rows = grid_size if rows is None else rows
+    cols = grid_size if cols is None else cols
+    return [
+        cells[r * grid_size + col0:r * grid_size + col0 + cols].tolist()
+        for r in range(row0, row0 + rows)
+    ]
+
+
+def viewport_cells(cells, grid_size, row0, col0, rows, cols):
+    # flat grid with everything outside the viewport set to UNKNOWN_CELL:
+    # the server doesn't keep those tiles up to date for us
+    out = array("H", [UNKNOWN_CELL]) * (grid_size * grid_size)
+    for r in range(row0, row0 + rows):
+        start = r * grid_size + col0
+        out[start:start + cols] = cells[start:start + cols]
+    return out
 
 
 # ============================================================
@@ -350,25 +674,49 @@ def listen_for_messages(ui):
 
     last_snapshot_id = -1
     last_logged_snapshot = -1
+    last_event_acks = None
     LOG_EVERY_N = 10
 
     TICK_RATE = 20
     TICK_INTERVAL = 1.0 / TICK_RATE
 
+    global last_multicast_ms
+
+    # every datagram is received into the same buffer and parsed in place
+    recv_buf = bytearray(RECV_BUFFER_SIZE)
+    recv_view = memoryview(recv_buf)
+    turn = 0
+
     while True:
         try:
-            packet, addr = client.recvfrom(1500)
+            if multicast_sock is not None and int(time.time() * 1000) - last_multicast_ms > MULTICAST_SILENCE_MS:
+                leave_multicast()
+
+            if multicast_sock is None:
+                sock = client
+            else:
+                ready, _, _ = select.select([client, multicast_sock], [], [], 1)
+                if not ready:
+                    continue
+                # take turns, so a busy socket can't starve the other one
+                sock = ready[turn % len(ready)]
+                turn += 1
+            from_group = sock is multicast_sock
+
+            nbytes, addr = sock.recvfrom_into(recv_buf)
+            packet = recv_view[:nbytes]
             recv_time_ms = int(time.time() * 1000)
 
             # -------- bandwidth -------------
-            bytes_received_this_second += len(packet)
+            bytes_received_this_second += nbytes
             now_sec = int(time.time())
             if now_sec > last_bandwidth_time:
                 current_bandwidth_kbps = (bytes_received_this_second * 8) / 1000.0
                 bytes_received_this_second = 0
                 last_bandwidth_time = now_sec
 
-            if len(packet) < HEADER_SIZE:
+            header = unpack_header(packet)
+            if header is None:
                 continue
 
             (
@@ -379,42 +727,28 @@ def listen_for_messages(ui):
                 seq_num,
                 timestamp_ms,
                 payload_len,
-            ) = struct.unpack(HEADER_FORMAT, packet[:HEADER_SIZE])
+            ) = header
 
             if protocol_id != PROTOCOL_ID or version != VERSION:
                 continue
 
+            # the group only carries SNAPSHOTs, and their acks aren't ours
+            if from_group:
+                if msg_type != MsgType.SNAPSHOT:
+                    continue
+                last_multicast_ms = recv_time_ms
+
             # ------------- GAME_OVER -------------------
             if msg_type == MsgType.GAME_OVER:
-                payload = packet[HEADER_SIZE:]
-                if len(payload) < 3:
+                game_over = unpack_game_over(packet)
+                if game_over is None:
                     print("[CLIENT] Bad GAME_OVER payload")
                     continue
 
-                winner_id, num_players = struct.unpack("!HB", payload[:3])
-                offset = 3
-                scores = {}
-
-                for _ in range(num_players):
-                    if offset + 4 > len(payload):
-                        break
-                    pid, score = struct.unpack("!HH", payload[offset:offset + 4])
-                    scores[pid] = score
-                    offset += 4
-
+                winner_id, scores = game_over
 
                 # Send Game Over ACK
-                ack_payload = struct.pack("!H", player_id_global)
-
-                ack_header = pack_header(
-                    MsgType.GAME_OVER_ACK,
-                    0,       
-                    0,               
-                    int(time.time() * 1000),
-                    len(ack_payload)
-                )
-
-                client.sendto(ack_header + ack_payload, ADDR)
+                send_message(MsgType.GAME_OVER_ACK, player_id_global)
                 print(f"[CLIENT] Sent GAME_OVER_ACK for player {player_id_global}")
 
                 ui.canvas.after(0, show_game_over_ui, winner_id, scores)
@@ -422,19 +756,19 @@ def listen_for_messages(ui):
                 continue
 
             if msg_type == MsgType.EVENT_ACK:
-                ack_seq = struct.unpack("!H", packet[HEADER_SIZE:])[0]
-                with pending_lock:
-                    if ack_seq in pending_events:
-                        del pending_events[ack_seq]
+                event_acks = unpack_payload(MsgType.EVENT_ACK, packet)
+                if event_acks is None:
+                    continue
+                ack_events(*event_acks)
                 continue
 
             if msg_type == MsgType.PLAYER_COLOR:
-                if payload_len != 5:
+                color = unpack_payload(MsgType.PLAYER_COLOR, packet)
+                if color is None:
                     print("[CLIENT] Bad PLAYER_COLOR payload")
                     continue
 
-                payload = packet[HEADER_SIZE:]
-                pid, r, g, b = struct.unpack("!HBBB", payload)
+                pid, r, g, b = color
                 player_colors[pid] = (r, g, b)
 
                 # update legend on UI thread
@@ -443,41 +777,35 @@ def listen_for_messages(ui):
                 print(f"[CLIENT] Player {pid} color updated -> {player_colors[pid]}")
 
                 # ---- send ACK (rdt3.0 style) ----
-                ack_payload = struct.pack(PLAYER_COLOR_ACK_FORMAT, pid)
-                ack_header = struct.pack(
-                    HEADER_FORMAT,
-                    PROTOCOL_ID,
-                    VERSION,
-                    MsgType.PLAYER_COLOR_ACK,
-                    0,                 # snapshot_id not used
-                    0,                 # seq_num not used for this simple ACK
-                    int(time.time() * 1000),
-                    len(ack_payload)
-                )
-                client.sendto(ack_header + ack_payload, ADDR)
+                send_message(MsgType.PLAYER_COLOR_ACK, pid)
 
             # ------------- SNAPSHOT --------------------
             if msg_type != MsgType.SNAPSHOT:
                 # ignore others here
                 continue
 
-            if snapshot_id <= last_snapshot_id:
-                # drop older snapshots
-                continue
+            # every unicast chunk carries our EVENT acks
+            snapshot_header = unpack_snapshot_header(packet)
+            if snapshot_header is not None and not from_group:
+                event_acks = snapshot_header[-2:]
+                if event_acks != last_event_acks:
+                    ack_events(*event_acks)
+                    last_event_acks = event_acks
 
-            payload = packet[HEADER_SIZE:]
-            if len(payload) != SNAPSHOT_SIZE * 2:
-                continue
+            applied, complete = assembler.apply_chunk(snapshot_id, packet)
+            if complete:
+                send_snapshot_ack(snapshot_id)
 
-            # we only use the new snapshot for low latency
-            new_bytes = payload[:SNAPSHOT_SIZE]
-            decoded_new = decode_snapshot(new_bytes)
+            if applied:
+                # keep queue small – the UI always draws the current grid
+                while snapshot_queue.qsize() >= MAX_QUEUE:
+                    snapshot_queue.get()
 
-            # keep queue small – always show latest few frames
-            while snapshot_queue.qsize() >= MAX_QUEUE:
-                snapshot_queue.get()
+                snapshot_queue.put((snapshot_id, timestamp_ms, seq_num, recv_time_ms))
 
-            snapshot_queue.put((snapshot_id, timestamp_ms, seq_num, decoded_new, recv_time_ms))
+            # metrics once per snapshot, on its first chunk
+            if snapshot_id <= last_snapshot_id:
+                continue
             last_snapshot_id = snapshot_id
 
             # --------- latency / jitter metrics -------
@@ -532,9 +860,23 @@ def listen_for_messages(ui):
 
 def ui_render_loop(ui):
     try:
-        if not snapshot_queue.empty():
-            snapshot_id, ts, seq_num, grid, recv_time_ms = snapshot_queue.get()
-            ui.update_grid(grid)
+        view_changed = ui.view_changed
+        ui.view_changed = False
+
+        if not snapshot_queue.empty() or view_changed:
+            snapshot_id = assembler.last_complete_id
+            while not snapshot_queue.empty():
+                snapshot_id, ts, seq_num, recv_time_ms = snapshot_queue.get()
+
+            grid = decode_snapshot(assembler.cells, assembler.grid_size, *ui.viewport())
+            record_cells = assembler.cells
+            if ui.viewport_callback is not None:
+                record_cells = viewport_cells(assembler.cells, assembler.grid_size, *ui.viewport())
+            ui.update_grid(grid, snapshot_id=snapshot_id, record_cells=record_cells)
+
+        if ui.minimap is not None and (assembler.overview_changed or view_changed):
+            assembler.overview_changed = False
+            ui.minimap.update_map(assembler.overview, assembler.layout.tile_size, ui.viewport())
 
         ui.canvas.after(FRAME_TIME_MS, ui_render_loop, ui)
     except RuntimeError:
@@ -543,76 +885,38 @@ def ui_render_loop(ui):
 
 
 def send_click_event(row, col, player_id):
-    global click_enabled, client_seq_num
-
     if not click_enabled:
         print("[CLIENT] Click Disabled. Game Over")
         return
 
-    cell_index = row * GRID_SIZE + col
+    cell_index = row * grid_size_global + col
     now_ms = int(time.time() * 1000)
 
-    payload = struct.pack(
-        EVENT_FORMAT,
-        player_id,
-        client_seq_num,
-        EventType.CLICK,
-        cell_index,
-        now_ms,
-    )
-
-    header = pack_header(
-        MsgType.EVENT,
-        0,
-        client_seq_num,
-        now_ms,
-        len(payload),
-    )
-
-    packet = header + payload
-    client.sendto(packet, ADDR)
-    print(f"[CLIENT] CLICK event sent seq={client_seq_num} (row={row}, col={col}, cell={cell_index})")
-
+    # goes out with the next batch (event_retransmit_worker)
     with pending_lock:
-        pending_events[client_seq_num] = {
-            "packet": packet,
-            "last_send": now_ms,
-            "tries": 1
-        }
-
-    client_seq_num += 1
+        seq = events.add(EventType.CLICK, cell_index, now_ms)
+    print(f"[CLIENT] CLICK event queued seq={seq} (row={row}, col={col}, cell={cell_index})")
 
 def event_retransmit_worker():
+    # sends new clicks and retransmits timed out ones, one datagram per interval
     while True:
         now = int(time.time() * 1000)
-        to_remove = []
-        with pending_lock:
-            for seq, info in list(pending_events.items()):
-                if now - info["last_send"] >= EVENT_TIMEOUT_MS:
-                    if info["tries"] >= MAX_EVENT_RETRIES:
-                        print(f"[CLIENT] Event seq={seq} reached max retries -> giving up")
-                        to_remove.append(seq)
-                        continue
-                    client.sendto(info["packet"], ADDR)
-                    info["last_send"] = now
-                    info["tries"] += 1
         with pending_lock:
-            for seq in to_remove:
-                del pending_events[seq]
-        time.sleep(0.05)
+            events.poll(now)
+        time.sleep(EVENT_SEND_INTERVAL_MS / 1000)
 
 def send_heartbeat():
     while True:
         try:
-            now_ms = int(time.time() * 1000)
-            header = pack_header(
-                MsgType.HEARTBEAT,
-                0,
-                0,
-                now_ms,
-                0,
-            )
-            client.sendto(header, ADDR)
+            send_message(MsgType.HEARTBEAT)
+
+            # VIEWPORT and MULTICAST are unreliable, repeat them so a lost
+            # one gets fixed
+            if viewport is not None:
+                send_viewport(viewport)
+            if multicast_state is not None:
+                send_message(MsgType.MULTICAST, multicast_state)
+
             time.sleep(1)
         except Exception as e:
             print("[CLIENT] Heartbeat stopped:", e)
@@ -620,6 +924,7 @@ def send_heartbeat():
 
 
 def start_ui():
+    import tkinter as tk
     root = tk.Tk()
     root.title("Grid")
 
@@ -632,11 +937,25 @@ def start_ui():
     right_frame = tk.Frame(main_frame)
     right_frame.pack(side="right", anchor="n", padx=10, pady=10)
 
-    ui = GridUI(left_frame, GRID_SIZE, GRID_SIZE)
+    view_size = min(VIEW_SIZE, grid_size_global)
+    ui = GridUI(left_frame, view_size, view_size, grid_size_global)
+
+    # board bigger than the view: pan with the arrow keys, minimap shows the rest
+    ui.minimap = None
+    if view_size < grid_size_global:
+        ui.minimap = Minimap(right_frame, assembler.layout.tiles_per_side)
+        root.bind("<Up>", lambda e: ui.pan(-PAN_STEP, 0))
+        root.bind("<Down>", lambda e: ui.pan(PAN_STEP, 0))
+        root.bind("<Left>", lambda e: ui.pan(0, -PAN_STEP))
+        root.bind("<Right>", lambda e: ui.pan(0, PAN_STEP))
+
     ui.legend = ColorLegend(right_frame)
     ui.legend.update_legend()
 
     ui.set_click_callback(lambda r, c: send_click_event(r, c, player_id_global))
+    if view_size < grid_size_global:
+        # the server sends the whole board unless told otherwise
+        ui.set_viewport_callback(send_viewport)
 
     Thread(target=event_retransmit_worker, daemon=True).start()
 
@@ -653,6 +972,7 @@ def start_ui():
 
 
 if __name__ == "__main__":
+    init_metrics_csv()
     intialize_client()
     start_ui()
 
@@ -1,124 +1,109 @@
-import csv
 import numpy as np
 import pandas as pd
 
-SERVER_FILE = "server_positions.csv"
-CLIENT_FILE = "client_positions.csv"
-OUTPUT_FILE = "position_error_results.csv"
-
-GRID_SIZE = 20
-CELL_COUNT = GRID_SIZE * GRID_SIZE
-
-
-def load_server_positions():
-    timestamps = []
-    grids = []
+from recording import load_recording, UNKNOWN_CELL
 
-    with open(SERVER_FILE, "r") as f:
-        reader = csv.reader(f)
-
-        for row in reader:
-            if not row:
-                continue
-
-            if row[0].lower().startswith("snapshot") or not row[0].isdigit():
-                continue
+SERVER_FILE = "server_positions.bin"
+CLIENT_FILE = "client_positions.bin"
+OUTPUT_FILE = "position_error_results.csv"
 
-            if len(row) != CELL_COUNT + 2:
-                print("[WARN] Skipping bad server row:", len(row))
-                continue
 
-            ts = int(row[1])
-            grid_values = list(map(int, row[2:]))
+# rows compared per numpy call, bounds memory for multi-million row runs
+CHUNK_ROWS = 65536
 
-            timestamps.append(ts)
-            grids.append(grid_values)
 
-    return np.array(timestamps), np.array(grids)
+def load_server_positions():
+    # memory-mapped, no parsing: timestamps and grids are views into the file
+    records = load_recording(SERVER_FILE)
+    return records["timestamp_ms"], records["cells"]
 
 
 def load_client_positions():
-    timestamps = []
-    grids = []
+    # all clients append to the same file -> keep player_id to split them
+    records = load_recording(CLIENT_FILE)
+    return records["player_id"], records["timestamp_ms"], records["cells"]
 
-    with open(CLIENT_FILE, "r") as f:
-        reader = csv.reader(f)
 
-        for row in reader:
-            if not row:
-                continue
+def compute_positional_error(server_grids, client_grids):
+    """
+    Number of mismatching cells per row (works on 1-D grids or 2-D stacks).
+    Cells the client recorded as UNKNOWN_CELL (outside its viewport) don't count.
+    """
+    return np.count_nonzero((server_grids != client_grids) & (client_grids != UNKNOWN_CELL), axis=-1)
 
-            if row[0].lower().startswith("player") or not row[0].isdigit():
-                continue
 
-            if len(row) != CELL_COUNT + 2:
-                print("[WARN] Skipping bad client row:", len(row))
-                continue
+def match_timestamps(server_ts, client_ts):
+    """
+    For every server row, the index of the first client row displayed at or
+    after it (client_ts must be sorted). Returns (server_rows, client_rows).
+    """
+    client_idx = np.searchsorted(client_ts, server_ts, side="left")
+    server_idx = np.nonzero(client_idx < len(client_ts))[0]
+    return server_idx, client_idx[server_idx]
 
-            ts = int(row[1])
-            grid_values = list(map(int, row[2:]))
 
-            timestamps.append(ts)
-            grids.append(grid_values)
+def errors_for_client(server_ts, server_grids, client_ts, client_grids):
+    server_idx, client_idx = match_timestamps(server_ts, client_ts)
 
-    return np.array(timestamps), np.array(grids)
+    errors = np.empty(len(server_idx), dtype=np.int64)
+    for start in range(0, len(server_idx), CHUNK_ROWS):
+        end = start + CHUNK_ROWS
+        errors[start:end] = compute_positional_error(
+            server_grids[server_idx[start:end]],
+            client_grids[client_idx[start:end]],
+        )
 
-
-def compute_positional_error(server_grid, client_grid):
-
-    diffs = (server_grid != client_grid).astype(int)
-    return diffs.sum()
+    return server_ts[server_idx], errors
 
 
 def main():
     print("[INFO] Loading logs...")
     server_ts, server_grids = load_server_positions()
-    client_ts, client_grids = load_client_positions()
-
-    errors = []
-    matched_times = []
-
-    si = 0
-    ci = 0
+    client_ids, client_ts, client_grids = load_client_positions()
 
     print("[INFO] Matching timestamps and computing error...")
 
-    while si < len(server_ts) and ci < len(client_ts):
+    results = []
+    for client_id in np.unique(client_ids):
+        rows = np.nonzero(client_ids == client_id)[0]
+        # clients append concurrently, make sure each one is time ordered
+        rows = rows[np.argsort(client_ts[rows], kind="stable")]
 
-        if client_ts[ci] < server_ts[si]:
-            ci += 1
+        matched_times, errors = errors_for_client(
+            server_ts, server_grids, client_ts[rows], client_grids[rows]
+        )
+        if len(errors) == 0:
             continue
 
-        error = compute_positional_error(server_grids[si], client_grids[ci])
-        errors.append(error)
-        matched_times.append(server_ts[si])
+        results.append(pd.DataFrame({
+            "timestamp": matched_times,
+            "client_id": client_id,
+            "positional_error": errors,
+        }))
 
-        si += 1
-
-    errors = np.array(errors)
-
-    if len(errors) == 0:
+    if not results:
         print("[ERROR] No matched timestamps. Check your logs.")
         return
 
+    df = pd.concat(results, ignore_index=True)
+    errors = df["positional_error"].to_numpy()
+
     mean_error = float(np.mean(errors))
     p95_error = float(np.percentile(errors, 95))
 
     print("\n===== POSITION ERROR RESULTS =====")
     print(f"Mean Error: {mean_error}")
     print(f"95th Percentile Error: {p95_error}")
+    for client_id, sub in df.groupby("client_id"):
+        print(f"  Client {client_id}: mean={sub['positional_error'].mean():.3f} "
+              f"p95={sub['positional_error'].quantile(0.95):.1f} rows={len(sub)}")
     print("=================================\n")
 
     # Save results to CSV for plotting
-    with open(OUTPUT_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-
-        writer.writerow(["timestamp", "positional_error"])
-        for ts, err in zip(matched_times, errors):
-            writer.writerow([ts, err])
+    df.to_csv(OUTPUT_FILE, index=False)
 
     print(f"[INFO] Saved detailed error results to {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
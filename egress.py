@@ -0,0 +1,260 @@
+"""
+Egress pacing for the server's socket.
+Used by the server (GameServer.sendto / send_snapshot).
+
+Without it a tick writes every client's snapshot chunks back to back, and
+retransmissions go out whenever the timer wheel fires, so the NIC sees
+bursts of hundreds of datagrams that small switch / NIC queues drop.
+
+TokenBucket: `rate` bytes per second, up to `burst` bytes saved up. A
+packet may go while the bucket is not in debt, and then takes its full size
+(so packets bigger than the burst still go out, the bucket just goes
+negative).
+
+EgressScheduler queues outgoing packets in two classes:
+
+- control (PLAYER_COLOR, EVENT_ACK, GAME_OVER, retransmissions, ...):
+  sent right away while the overall bucket allows, otherwise queued in
+  front of every snapshot. They only wait for the overall bucket, but
+  still take tokens from the client's own bucket.
+- snapshots: queued per destination and sent round robin, one packet per
+  destination at a time, each within its own bucket and the overall one.
+  begin_tick() spreads what is queued evenly over `spread` seconds in
+  `slot`-second steps instead of sending it all at once.
+
+Queued snapshot packets are copied into SNAPSHOT_ARENA_SIZE arenas and
+queued as views of them, instead of one new bytes object per packet. An
+arena is never reused or resized, it goes away with the last view into it.
+
+pump(now) sends what is allowed and returns how long to wait before the
+next call. Not thread-safe, like the rest of the server it runs on one loop.
+"""
+
+import math
+from collections import deque
+
+SNAPSHOT_ARENA_SIZE = 64 * 1024
+
+
+class TokenBucket:
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        """
+        rate: bytes per second, None = unlimited.
+        """
+        self.rate = rate
+        self.burst = math.inf if rate is None else burst
+        self.tokens = self.burst
+        self.updated = now
+
+    def refill(self, now):
+        if self.rate is None:
+            return
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready(self):
+        return self.tokens > 0
+
+    def take(self, size):
+        if self.rate is not None:
+            self.tokens -= size
+
+    def wait(self):
+        """
+        Seconds until the bucket is out of debt again.
+        """
+        if self.rate is None or self.tokens > 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SnapshotQueue:
+
+    __slots__ = ("addr", "bucket", "packets", "bytes", "ready")
+
+    def __init__(self, addr, bucket):
+        self.addr = addr
+        self.bucket = bucket
+        self.packets = deque()
+        self.bytes = 0
+        self.ready = False      # in EgressScheduler.ready
+
+
+class EgressScheduler:
+
+    def __init__(self, send, now, rate=None, client_rate=None, burst_s=0.01,
+                 spread=0.025, slot=0.002):
+        """
+        send(packet, addr) puts a datagram on the wire.
+        rate / client_rate: bytes per second overall / per destination,
+        None = unlimited. Buckets hold burst_s seconds worth of their rate.
+        """
+        self.send = send
+        self.client_rate = client_rate
+        self.client_burst = None if client_rate is None else max(1, client_rate * burst_s)
+        self.total = TokenBucket(rate, None if rate is None else max(1, rate * burst_s), now)
+        self.spread = spread
+        self.slot = slot
+
+        self.control = deque()      # (packet, addr), before any snapshot
+        self.queues = {}            # addr -> SnapshotQueue
+        self.ready = deque()        # SnapshotQueues with packets, round robin
+        self.queued_bytes = 0       # snapshot bytes in all queues
+
+        # where queue_snapshot copies packets to (see store())
+        self.arena = memoryview(bytearray(SNAPSHOT_ARENA_SIZE))
+        self.arena_used = 0
+
+        # snapshot bytes we may still send in the current slot
+        self.allowance = math.inf
+        self.slot_bytes = math.inf
+        self.slot_ends = now
+
+        self.control_sent = 0
+        self.control_delayed = 0
+        self.snapshots_sent = 0
+        self.throttled = 0          # pumps that stopped on an empty bucket
+
+    def __bool__(self):
+        return bool(self.control) or bool(self.ready)
+
+    def queue_for(self, addr, now):
+        queue = self.queues.get(addr)
+        if queue is None:
+            queue = SnapshotQueue(addr, TokenBucket(self.client_rate, self.client_burst, now))
+            self.queues[addr] = queue
+        return queue
+
+    def forget(self, addr):
+        """
+        Drop a destination's queued snapshots and its bucket.
+        """
+        queue = self.queues.pop(addr, None)
+        if queue is None:
+            return
+        self.queued_bytes -= queue.bytes
+        queue.packets.clear()
+        queue.bytes = 0
+        if queue.ready:
+            self.ready.remove(queue)
+            queue.ready = False
+
+    def backlog(self, addr):
+        """
+        Snapshot bytes still queued for addr.
+        """
+        queue = self.queues.get(addr)
+        return 0 if queue is None else queue.bytes
+
+    def send_control(self, packet, addr, now):
+        """
+        Send now if nothing is ahead of it, otherwise queue it (copied, the
+        caller may reuse its buffer). Returns True if it was queued.
+        """
+        total = self.total
+        total.refill(now)
+        if not self.control and total.ready():
+            self.transmit(packet, addr, now)
+            self.control_sent += 1
+            return False
+
+        self.control.append((bytes(packet), addr))
+        self.control_delayed += 1
+        return True
+
+    def store(self, packet):
+        """
+        Copy of packet in the current arena (the caller may reuse its buffer).
+        """
+        size = len(packet)
+        start = self.arena_used
+        if start + size > len(self.arena):
+            self.arena = memoryview(bytearray(max(SNAPSHOT_ARENA_SIZE, size)))
+            start = 0
+        end = start + size
+        self.arena[start:end] = packet
+        self.arena_used = end
+        return self.arena[start:end]
+
+    def queue_snapshot(self, packet, addr, now):
+        queue = self.queue_for(addr, now)
+        queue.packets.append(self.store(packet))
+        queue.bytes += len(packet)
+        self.queued_bytes += len(packet)
+        if not queue.ready:
+            queue.ready = True
+            self.ready.append(queue)
+
+    def begin_tick(self, now):
+        """
+        Everything queued so far goes out over the next `spread` seconds.
+        """
+        slots = max(1, round(self.spread / self.slot))
+        self.slot_bytes = max(1, -(-self.queued_bytes // slots))
+        self.allowance = self.slot_bytes
+        self.slot_ends = now + self.slot
+
+    def transmit(self, packet, addr, now):
+        size = len(packet)
+        self.total.take(size)
+        queue = self.queues.get(addr)
+        if queue is not None:
+            queue.bucket.refill(now)
+            queue.bucket.take(size)
+        self.send(packet, addr)
+
+    def pump(self, now):
+        """
+        Send what the buckets and the current slot allow.
+        Returns seconds until the next pump is due (0 = nothing queued).
+        """
+        total = self.total
+        total.refill(now)
+
+        control = self.control
+        while control and total.ready():
+            packet, addr = control.popleft()
+            self.transmit(packet, addr, now)
+            self.control_sent += 1
+        if control:
+            self.throttled += 1
+            return max(total.wait(), self.slot)
+
+        if now >= self.slot_ends:
+            self.allowance = self.slot_bytes
+            self.slot_ends = now + self.slot
+
+        ready = self.ready
+        blocked = 0
+        while ready and self.allowance > 0 and total.ready() and blocked < len(ready):
+            queue = ready[0]
+            queue.bucket.refill(now)
+            if not queue.bucket.ready():
+                # out of tokens: let the others have their turn
+                ready.rotate(-1)
+                blocked += 1
+                continue
+
+            blocked = 0
+            packet = queue.packets.popleft()
+            size = len(packet)
+            queue.bytes -= size
+            self.queued_bytes -= size
+            self.allowance -= size
+            self.transmit(packet, queue.addr, now)
+            self.snapshots_sent += 1
+
+            if queue.packets:
+                ready.rotate(-1)
+            else:
+                ready.popleft()
+                queue.ready = False
+
+        if not ready:
+            return 0.0
+        if blocked or not total.ready():
+            self.throttled += 1
+        return max(self.slot_ends - now, total.wait(), 0.0005)
@@ -0,0 +1,164 @@
+"""
+Batched, reliable EVENT sending (client side).
+
+Events are queued with add() and go out in EVENT datagrams built by poll():
+whenever there is a new event or a pending one timed out, ONE datagram is
+sent carrying every unacknowledged event (oldest first, up to what fits).
+So a burst of clicks costs one packet per poll interval instead of one per
+click, and a lost packet is repaired by the next batch.
+
+ack(ack_seq, ack_bits) removes what the server acknowledged (piggybacked on
+SNAPSHOT or a standalone EVENT_ACK, see protocol.py). An event that timed
+out max_retries times is given up; every batch names the oldest pending seq
+(header seq_num), so the server's ack window moves past it too.
+
+Retransmit timeouts run on a TimerWheel (see timer_wheel.py): poll() only
+touches the events that timed out and the ones inside the send window, not
+everything pending.
+
+Not thread-safe; callers that share one between threads must hold their
+own lock.
+"""
+
+from collections import OrderedDict
+
+from protocol import (
+    EVENT_ACK_BITS, EVENT_SEQ_MOD, MAX_EVENTS_PER_BATCH,
+    PacketBuffer, event_acked,
+)
+from timer_wheel import TimerWheel
+
+TIMER_TICK_MS = 10
+
+
+class EventBatcher:
+
+    def __init__(self, send, player_id, timeout_ms=300, max_retries=6,
+                 max_events=MAX_EVENTS_PER_BATCH, on_give_up=None, on_acked=None):
+        """
+        send(packet, first_seq) puts one EVENT datagram (a memoryview,
+        only valid during the call) on the wire.
+        on_give_up(seq) is called when an event runs out of retries.
+        on_acked(seq, rtt_ms) is called for every acked event when ack() is
+        given now_ms; rtt_ms counts from the event's first transmission.
+        """
+        self.send_packet = send
+        self.player_id = player_id
+        self.timeout_ms = timeout_ms
+        self.max_retries = max_retries
+        self.max_events = max_events
+        self.on_give_up = on_give_up
+        self.on_acked = on_acked
+
+        self.next_seq = 0
+        self.out = PacketBuffer()
+
+        # seq -> [(seq, type, cell, ts), last sent ms (None = never), retries,
+        #         first sent ms], oldest first
+        self.pending = OrderedDict()
+        self.has_new = False
+        # pending events never sent yet (they didn't fit the window)
+        self.unsent = 0
+
+        # seq -> retransmit timeout
+        self.timers = TimerWheel(tick_ms=TIMER_TICK_MS)
+
+        # counters
+        self.batches = 0
+        self.events_sent = 0
+        self.retransmits = 0
+        self.give_ups = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, event_type, cell_index, timestamp_ms):
+        """
+        Queue one event, it goes out with the next poll(). Returns its seq.
+        """
+        seq = self.next_seq
+        self.next_seq = (seq + 1) % EVENT_SEQ_MOD
+
+        self.pending[seq] = [(seq, event_type, cell_index, timestamp_ms), None, 0, None]
+        self.has_new = True
+        self.unsent += 1
+        return seq
+
+    def ack(self, ack_seq, ack_bits, now_ms=None):
+        """
+        Forget every pending event covered by (ack_seq, ack_bits).
+        Returns how many were acknowledged.
+        """
+        acked = []
+        for seq in self.pending:
+            # pending is in seq order: past the ack bits nothing is acked
+            offset = (seq - ack_seq) % EVENT_SEQ_MOD
+            if EVENT_ACK_BITS < offset < EVENT_SEQ_MOD // 2:
+                break
+            if event_acked(seq, ack_seq, ack_bits):
+                acked.append(seq)
+
+        for seq in acked:
+            entry = self.pending.pop(seq)
+            self.timers.cancel(seq)
+            if entry[3] is None:
+                self.unsent -= 1
+            elif self.on_acked is not None and now_ms is not None:
+                self.on_acked(seq, now_ms - entry[3])
+
+        # the window moved, events that didn't fit before can go now
+        if acked and self.unsent:
+            self.has_new = True
+        return len(acked)
+
+    def poll(self, now_ms):
+        """
+        Send one batch if anything is new or timed out.
+        Returns True if a datagram was sent.
+        """
+        if not self.pending:
+            return False
+
+        due = self.has_new
+        for seq in self.timers.advance(now_ms):
+            entry = self.pending.get(seq)
+            if entry is None:
+                continue
+
+            if self.max_retries is not None and entry[2] >= self.max_retries:
+                del self.pending[seq]
+                self.give_ups += 1
+                if self.on_give_up is not None:
+                    self.on_give_up(seq)
+                # the window moved, events that didn't fit before can go now
+                if self.unsent:
+                    due = True
+                continue
+
+            entry[2] += 1
+            self.retransmits += 1
+            due = True
+
+        if not due or not self.pending:
+            return False
+
+        # the server's window starts at our oldest pending seq (it moves
+        # up to first_seq) and is EVENT_ACK_BITS wide, later events wait
+        first_seq = next(iter(self.pending))
+        records = []
+        for seq, entry in self.pending.items():
+            if len(records) == self.max_events or (seq - first_seq) % EVENT_SEQ_MOD >= EVENT_ACK_BITS:
+                break
+            records.append(entry[0])
+            entry[1] = now_ms
+            self.timers.arm(seq, self.timeout_ms, now_ms)
+            if entry[3] is None:
+                entry[3] = now_ms
+                self.unsent -= 1
+
+        self.send_packet(self.out.event_batch(self.player_id, records, seq_num=first_seq, timestamp_ms=now_ms), first_seq)
+
+        self.has_new = False
+        self.batches += 1
+        self.events_sent += len(records)
+        return True
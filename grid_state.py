@@ -0,0 +1,54 @@
+"""
+GridClash board state (server side).
+
+GridState owns the flat grid of 16-bit owners (0 = unclaimed) and keeps
+running counters next to it, so the event path never has to scan the board:
+
+- free_cells     number of unclaimed cells
+- scores         player_id -> number of cells owned
+
+Both are updated in O(1) by claim(); game-over detection and the GAME_OVER
+scoreboard read them directly.
+"""
+
+from array import array
+
+
+class GridState:
+
+    def __init__(self, grid_size):
+        self.grid_size = grid_size
+        self.cells = array("H", bytes(2 * grid_size * grid_size))
+
+        self.free_cells = len(self.cells)
+
+        # key = player_id, value = cells owned
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def is_full(self):
+        return self.free_cells == 0
+
+    def claim(self, cell_index, player_id):
+        """
+        Give an unclaimed cell to player_id.
+        Returns False if the cell is already owned.
+        Raises IndexError for a cell outside the board.
+        """
+        if self.cells[cell_index] != 0:
+            return False
+
+        self.cells[cell_index] = player_id
+        self.free_cells -= 1
+        self.scores[player_id] = self.scores.get(player_id, 0) + 1
+        return True
+
+    def winner(self):
+        """
+        player_id with the most cells (None on an empty board).
+        """
+        if not self.scores:
+            return None
+        return max(self.scores, key=self.scores.get)
@@ -0,0 +1,81 @@
+"""
+Tile layout of the GridClash board.
+Used by both server and client.
+
+The grid_size x grid_size board is cut into tile_size x tile_size tiles,
+numbered row-major. Tiles on the right / bottom edge are smaller when
+grid_size is not a multiple of tile_size. Cells inside a tile are also
+row-major, so a tile body is just its rows concatenated.
+"""
+
+
+class TileLayout:
+
+    def __init__(self, grid_size, tile_size):
+        self.grid_size = grid_size
+        self.tile_size = tile_size
+
+        self.tiles_per_side = -(-grid_size // tile_size)
+        self.tile_count = self.tiles_per_side * self.tiles_per_side
+
+    def tile_of(self, cell_index):
+        row, col = divmod(cell_index, self.grid_size)
+        return (row // self.tile_size) * self.tiles_per_side + col // self.tile_size
+
+    def bounds(self, tile_index):
+        """
+        (row0, col0, row1, col1) of a tile, end exclusive.
+        """
+        tile_row, tile_col = divmod(tile_index, self.tiles_per_side)
+
+        row0 = tile_row * self.tile_size
+        col0 = tile_col * self.tile_size
+        row1 = min(row0 + self.tile_size, self.grid_size)
+        col1 = min(col0 + self.tile_size, self.grid_size)
+        return row0, col0, row1, col1
+
+    def tiles_in_rect(self, row0, col0, row1, col1):
+        """
+        Every tile intersecting the cell rectangle [row0, row1) x [col0, col1),
+        clamped to the board.
+        """
+        row0, col0 = max(row0, 0), max(col0, 0)
+        row1, col1 = min(row1, self.grid_size), min(col1, self.grid_size)
+        if row0 >= row1 or col0 >= col1:
+            return []
+
+        ts = self.tile_size
+        return [
+            tile_row * self.tiles_per_side + tile_col
+            for tile_row in range(row0 // ts, (row1 - 1) // ts + 1)
+            for tile_col in range(col0 // ts, (col1 - 1) // ts + 1)
+        ]
+
+    def cell_count(self, tile_index):
+        row0, col0, row1, col1 = self.bounds(tile_index)
+        return (row1 - row0) * (col1 - col0)
+
+    def extract(self, cells, tile_index):
+        """
+        Copy one tile out of a flat grid (list / array of owners).
+        """
+        row0, col0, row1, col1 = self.bounds(tile_index)
+        n = self.grid_size
+
+        out = []
+        for row in range(row0, row1):
+            out.extend(cells[row * n + col0:row * n + col1])
+        return out
+
+    def store(self, cells, tile_index, values):
+        """
+        Write a tile body (as returned by extract) back into a flat grid.
+        """
+        row0, col0, row1, col1 = self.bounds(tile_index)
+        n = self.grid_size
+        width = col1 - col0
+
+        offset = 0
+        for row in range(row0, row1):
+            cells[row * n + col0:row * n + col1] = values[offset:offset + width]
+            offset += width
@@ -0,0 +1,139 @@
+"""
+GridClash inbound datagram journal.
+Written by the server (GameServer(journal_file=...)), read by
+replay_journal.py, which feeds it back through the server's handlers.
+
+Only accepted datagrams are journaled (right protocol / version, known
+message type, not STATS), together with their arrival time.
+
+File layout (little-endian):
+
+    header   16 bytes
+        magic        4 bytes   b"GSJR"
+        version      1 byte
+        (padding)    1 byte
+        grid_size    2 bytes
+        tile_size    2 bytes
+        (padding)    6 bytes
+
+    record   JOURNAL_RECORD_SIZE + length
+        arrival_us   8 bytes   microseconds since the server started
+        client       2 bytes   index into the address table
+        length       2 bytes
+        data         length bytes
+
+Client addresses are not repeated in every record: the first time an
+address shows up an address record (arrival_us = ADDRESS_RECORD, data =
+"host:port") gives it the next index.
+"""
+
+import struct
+
+JOURNAL_MAGIC = b"GSJR"
+JOURNAL_VERSION = 1
+
+JOURNAL_HEADER_FORMAT = "<4s B x H H 6x"
+JOURNAL_HEADER_SIZE = struct.calcsize(JOURNAL_HEADER_FORMAT)
+
+JOURNAL_RECORD = struct.Struct("<Q H H")    # arrival_us, client, length
+JOURNAL_RECORD_SIZE = JOURNAL_RECORD.size
+
+ADDRESS_RECORD = 0xFFFFFFFFFFFFFFFF
+MAX_CLIENTS = 0xFFFF
+
+
+def format_addr(addr):
+    return f"{addr[0]}:{addr[1]}".encode("ascii")
+
+
+def parse_addr(raw):
+    host, _, port = raw.decode("ascii").rpartition(":")
+    return (host, int(port))
+
+
+class JournalSink:
+    """
+    BackgroundLogger sink (server side).
+    Queued records are (arrival_us, client_addr, data).
+    """
+
+    def __init__(self, path, grid_size, tile_size):
+        self.file = open(path, "wb")
+        self.file.write(struct.pack(JOURNAL_HEADER_FORMAT, JOURNAL_MAGIC, JOURNAL_VERSION, grid_size, tile_size))
+        self.clients = {}    # addr -> index
+
+    def client_index(self, addr, out):
+        index = self.clients.get(addr)
+        if index is None:
+            index = len(self.clients)
+            if index >= MAX_CLIENTS:
+                raise ValueError("journal address table full")
+            self.clients[addr] = index
+            raw = format_addr(addr)
+            out.append(JOURNAL_RECORD.pack(ADDRESS_RECORD, index, len(raw)))
+            out.append(raw)
+        return index
+
+    def write_batch(self, records):
+        out = []
+        pack = JOURNAL_RECORD.pack
+        for arrival_us, addr, data in records:
+            out.append(pack(arrival_us, self.client_index(addr, out), len(data)))
+            out.append(data)
+        self.file.write(b"".join(out))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_journal_header(path):
+    """
+    (grid_size, tile_size) of a journal.
+    """
+    with open(path, "rb") as f:
+        header = f.read(JOURNAL_HEADER_SIZE)
+
+    if len(header) < JOURNAL_HEADER_SIZE:
+        raise ValueError(f"{path}: file too short for a journal header")
+
+    magic, version, grid_size, tile_size = struct.unpack(JOURNAL_HEADER_FORMAT, header)
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+        raise ValueError(f"{path}: not a GridClash journal (v{JOURNAL_VERSION})")
+    return grid_size, tile_size
+
+
+def load_journal(path):
+    """
+    Every datagram of a journal as a list of (arrival_us, client_addr, data),
+    read up front so a replay measures the server and not the disk.
+    A truncated trailing record (server killed mid-write) is ignored.
+    """
+    read_journal_header(path)
+    with open(path, "rb") as f:
+        blob = f.read()
+
+    view = memoryview(blob)
+    unpack_from = JOURNAL_RECORD.unpack_from
+    addrs = []
+    records = []
+    offset = JOURNAL_HEADER_SIZE
+    end = len(blob)
+
+    while offset + JOURNAL_RECORD_SIZE <= end:
+        arrival_us, client, length = unpack_from(blob, offset)
+        start = offset + JOURNAL_RECORD_SIZE
+        offset = start + length
+        if offset > end:
+            break
+
+        if arrival_us == ADDRESS_RECORD:
+            if client != len(addrs):
+                raise ValueError(f"{path}: address record {client} out of order")
+            addrs.append(parse_addr(view[start:offset].tobytes()))
+            continue
+        records.append((arrival_us, addrs[client], view[start:offset].tobytes()))
+
+    return records
@@ -0,0 +1,428 @@
+"""
+GridClash network impairment proxy (netem-style, for the automated tests).
+
+Sits between the clients and the server and impairs the UDP traffic in both
+directions: loss, fixed delay, jitter, reordering, duplication and a
+bandwidth cap. run_all_tests.sh starts one per scenario and points the
+clients at it instead of the server.
+
+Every client address gets its own upstream socket, so the server still sees
+one address per player. Replies are sent on from wherever the server answers
+(room_server.py answers JOIN from the room's own port, the client then keeps
+talking to the proxy and the proxy follows the room).
+
+Per packet, per direction:
+1. loss          dropped with probability --loss
+2. bandwidth     --rate kbit/s per client and direction; the packet waits
+                 until the link is free, tail dropped if that takes longer
+                 than --queue-ms
+3. delay         --delay ms plus a --jitter sample from --jitter-dist
+                 (jitter alone reorders packets, like netem)
+4. reorder       with probability --reorder held back another --reorder-gap ms
+5. duplicate     with probability --duplicate a second copy with its own
+                 delay / jitter
+
+All delayed packets of the proxy sit in one DelayLine (a heap ordered by
+due time) behind a single loop timer, so tens of thousands of packets per
+second cost one heap push / pop each instead of a call_later handle each.
+
+Run with:
+python netem_proxy.py --listen 127.0.0.1:5006 --server 127.0.0.1:5005 --loss 0.05
+python netem_proxy.py --delay 100 --jitter 20 --jitter-dist normal --reorder 0.01
+"""
+
+import argparse
+import asyncio
+import heapq
+import random
+import signal
+import socket
+from itertools import count
+
+from server import SERVER_IP, SERVER_PORT
+
+PROXY_PORT = 5006
+SESSION_IDLE_TIMEOUT = 30.0    # seconds without traffic before a client's upstream socket is closed
+DEFAULT_QUEUE_MS = 200         # longest wait for the bandwidth cap before tail drop
+DEFAULT_REORDER_GAP_MS = 20
+SOCKET_BUFFER_BYTES = 1 << 21  # kernel buffers of the proxy's sockets, absorb send bursts
+STATS_INTERVAL = 5.0           # seconds between [PROXY] counter lines (0 = only at exit)
+
+UP = "up"          # client -> server
+DOWN = "down"      # server -> client
+
+
+# ---------------------------------------------------------
+# Jitter distributions
+# ---------------------------------------------------------
+# sample(jitter_ms, rng) -> ms added to the fixed delay (may be negative,
+# the total is clamped at 0)
+
+def jitter_uniform(jitter, rng):
+    return rng.uniform(-jitter, jitter)
+
+
+def jitter_normal(jitter, rng):
+    return rng.gauss(0.0, jitter)
+
+
+def jitter_exponential(jitter, rng):
+    # only ever late, mean = jitter
+    return rng.expovariate(1.0 / jitter)
+
+
+def jitter_pareto(jitter, rng):
+    # heavy tail: mostly small, now and then very late; mean = jitter
+    return jitter * (rng.paretovariate(3.0) - 1.0) * 2.0
+
+
+JITTER_DISTRIBUTIONS = {
+    "uniform": jitter_uniform,
+    "normal": jitter_normal,
+    "exponential": jitter_exponential,
+    "pareto": jitter_pareto,
+}
+
+
+# ---------------------------------------------------------
+# Delay line (timer heap)
+# ---------------------------------------------------------
+class DelayLine:
+    """
+    Packets waiting to be sent, ordered by due time (loop.time() seconds).
+
+    Only the earliest entry has a loop timer; when it fires everything that
+    is due goes out and the timer is re-armed for the new head. Entries with
+    the same due time keep their push order.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.heap = []
+        self.order = count()
+        self.timer = None
+        self.timer_at = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, due, transport, data, addr):
+        heap = self.heap
+        if due <= self.loop.time() and (not heap or heap[0][0] > due):
+            # nothing pending ahead of it, no need to go through the heap
+            if not transport.is_closing():
+                transport.sendto(data, addr)
+            return
+
+        heapq.heappush(heap, (due, next(self.order), transport, data, addr))
+        if self.timer_at is None or due < self.timer_at:
+            self._arm(due)
+
+    def _arm(self, due):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer_at = due
+        self.timer = self.loop.call_at(due, self._fire)
+
+    def _fire(self):
+        self.timer = None
+        self.timer_at = None
+        heap = self.heap
+        now = self.loop.time()
+
+        while heap and heap[0][0] <= now:
+            _due, _order, transport, data, addr = heapq.heappop(heap)
+            if not transport.is_closing():
+                transport.sendto(data, addr)
+
+        if heap:
+            self._arm(heap[0][0])
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = None
+        self.timer_at = None
+        self.heap.clear()
+
+
+# ---------------------------------------------------------
+# Impairment
+# ---------------------------------------------------------
+class Impairment:
+    """
+    What happens to the packets of one direction. Counters are shared by all
+    clients of that direction.
+    """
+
+    def __init__(self, loss=0.0, delay_ms=0.0, jitter_ms=0.0, jitter_dist="uniform",
+                 reorder=0.0, reorder_gap_ms=DEFAULT_REORDER_GAP_MS, duplicate=0.0,
+                 rate_kbit=0.0, queue_ms=DEFAULT_QUEUE_MS, rng=None):
+        self.loss = loss
+        self.delay = delay_ms / 1000
+        self.jitter_ms = jitter_ms
+        self.jitter = JITTER_DISTRIBUTIONS[jitter_dist]
+        self.reorder = reorder
+        self.reorder_gap = reorder_gap_ms / 1000
+        self.duplicate = duplicate
+        self.byte_time = 8 / (rate_kbit * 1000) if rate_kbit > 0 else 0.0   # seconds per byte
+        self.queue_limit = queue_ms / 1000
+        self.rng = rng or random.Random()
+
+        self.received = 0
+        self.sent = 0
+        self.lost = 0
+        self.queue_drops = 0
+        self.reordered = 0
+        self.duplicated = 0
+
+    @property
+    def passthrough(self):
+        return not (self.loss or self.delay or self.jitter_ms or self.reorder
+                    or self.duplicate or self.byte_time)
+
+    def latency(self):
+        delay = self.delay
+        if self.jitter_ms:
+            delay += self.jitter(self.jitter_ms, self.rng) / 1000
+        if self.reorder and self.rng.random() < self.reorder:
+            self.reordered += 1
+            delay += self.reorder_gap
+        return delay if delay > 0 else 0.0
+
+    def forward(self, link, line, transport, data, addr):
+        """
+        Impair one packet of `link` (the client's Link for this direction)
+        and hand it to the delay line.
+        """
+        self.received += 1
+        rng = self.rng
+
+        if self.loss and rng.random() < self.loss:
+            self.lost += 1
+            return
+
+        now = line.loop.time()
+        if self.byte_time:
+            start = link.free_at if link.free_at > now else now
+            if start - now > self.queue_limit:
+                self.queue_drops += 1
+                return
+            link.free_at = start + len(data) * self.byte_time
+            now = link.free_at    # leaves the bottleneck once serialized
+
+        copies = 2 if self.duplicate and rng.random() < self.duplicate else 1
+        if copies == 2:
+            self.duplicated += 1
+
+        for _ in range(copies):
+            self.sent += 1
+            line.push(now + self.latency(), transport, data, addr)
+
+    def summary(self):
+        return (f"{self.received} in, {self.sent} out, {self.lost} lost, {self.queue_drops} queue drops, "
+                f"{self.reordered} reordered, {self.duplicated} duplicated")
+
+
+class Link:
+    """
+    Bandwidth-cap state of one client in one direction.
+    """
+
+    __slots__ = ("free_at",)
+
+    def __init__(self):
+        self.free_at = 0.0
+
+
+# ---------------------------------------------------------
+# Proxy
+# ---------------------------------------------------------
+class Upstream(asyncio.DatagramProtocol):
+    """
+    The socket the proxy uses towards the server on behalf of one client.
+    """
+
+    def __init__(self, proxy, session):
+        self.proxy = proxy
+        self.session = session
+
+    def datagram_received(self, data, addr):
+        session = self.session
+        session.server_addr = addr    # follow the server to a room's port
+        session.last_seen = self.proxy.loop.time()
+        self.proxy.to_client(session, data)
+
+
+class Session:
+
+    __slots__ = ("client_addr", "server_addr", "transport", "pending", "up", "down", "last_seen")
+
+    def __init__(self, client_addr, server_addr, now):
+        self.client_addr = client_addr
+        self.server_addr = server_addr
+        self.transport = None    # upstream socket, set once it is open
+        self.pending = []        # client datagrams that arrived before that
+        self.up = Link()
+        self.down = Link()
+        self.last_seen = now
+
+
+class ImpairmentProxy(asyncio.DatagramProtocol):
+
+    def __init__(self, server_addr, up, down, bind_host="0.0.0.0"):
+        self.server_addr = server_addr
+        self.up = up
+        self.down = down
+        self.bind_host = bind_host
+        self.loop = None
+        self.transport = None
+        self.line = None
+        self.sessions = {}    # client addr -> Session
+
+    def connection_made(self, transport):
+        self.transport = transport
+        grow_buffers(transport)
+        self.loop = asyncio.get_running_loop()
+        self.line = DelayLine(self.loop)
+
+    def datagram_received(self, data, addr):
+        session = self.sessions.get(addr)
+        if session is None:
+            session = self.sessions[addr] = Session(addr, self.server_addr, self.loop.time())
+            print(f"[PROXY] New client {addr}")
+            self.loop.create_task(self.open_upstream(session))
+
+        session.last_seen = self.loop.time()
+        if session.transport is None:
+            session.pending.append(data)
+            return
+        self.up.forward(session.up, self.line, session.transport, data, session.server_addr)
+
+    def to_client(self, session, data):
+        self.down.forward(session.down, self.line, self.transport, data, session.client_addr)
+
+    async def open_upstream(self, session):
+        transport, _ = await self.loop.create_datagram_endpoint(
+            lambda: Upstream(self, session), local_addr=(self.bind_host, 0)
+        )
+        if self.sessions.get(session.client_addr) is not session:
+            transport.close()    # expired while the socket was opening
+            return
+
+        grow_buffers(transport)
+        session.transport = transport
+        for data in session.pending:
+            self.up.forward(session.up, self.line, transport, data, session.server_addr)
+        session.pending = []
+
+    def expire_sessions(self):
+        now = self.loop.time()
+        for addr, session in list(self.sessions.items()):
+            if now - session.last_seen > SESSION_IDLE_TIMEOUT:
+                print(f"[PROXY] Client {addr} idle, closing its upstream socket")
+                del self.sessions[addr]
+                if session.transport is not None:
+                    session.transport.close()
+
+    def print_stats(self):
+        print(f"[PROXY] up   (client -> server): {self.up.summary()}")
+        print(f"[PROXY] down (server -> client): {self.down.summary()}")
+        print(f"[PROXY] {len(self.sessions)} clients, {len(self.line)} packets in flight")
+
+    def close(self):
+        for session in self.sessions.values():
+            if session.transport is not None:
+                session.transport.close()
+        self.sessions.clear()
+        if self.line is not None:
+            self.line.close()
+        if self.transport is not None:
+            self.transport.close()
+
+
+def grow_buffers(transport):
+    sock = transport.get_extra_info("socket")
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_BYTES)
+        except OSError:
+            pass    # keep the OS default
+
+
+def parse_addr(text, default_host):
+    """
+    "host:port", ":port" or "port" -> (host, port).
+    """
+    host, _, port = text.rpartition(":")
+    return (host or default_host, int(port))
+
+
+async def run_proxy(listen, server, up, down, stats_interval=STATS_INTERVAL):
+    loop = asyncio.get_running_loop()
+    proxy = ImpairmentProxy(server, up, down, bind_host=listen[0])
+    await loop.create_datagram_endpoint(lambda: proxy, local_addr=listen)
+    print(f"[PROXY] Listening on {listen}, forwarding to {server}")
+
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass  # Windows
+
+    last_stats = loop.time()
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            proxy.expire_sessions()
+            if stats_interval > 0 and loop.time() - last_stats >= stats_interval:
+                last_stats = loop.time()
+                proxy.print_stats()
+    finally:
+        proxy.print_stats()
+        proxy.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GridClash UDP impairment proxy")
+    parser.add_argument("--listen", default=f"{SERVER_IP}:{PROXY_PORT}", help="host:port the clients connect to")
+    parser.add_argument("--server", default=f"{SERVER_IP}:{SERVER_PORT}", help="host:port of the real server")
+    parser.add_argument("--loss", type=float, default=0.0, help="drop probability (0..1)")
+    parser.add_argument("--delay", type=float, default=0.0, help="fixed one-way delay in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="jitter in ms (spread of --jitter-dist)")
+    parser.add_argument("--jitter-dist", choices=sorted(JITTER_DISTRIBUTIONS), default="uniform")
+    parser.add_argument("--reorder", type=float, default=0.0, help="probability a packet is held back")
+    parser.add_argument("--reorder-gap", type=float, default=DEFAULT_REORDER_GAP_MS, help="ms a reordered packet is held back")
+    parser.add_argument("--duplicate", type=float, default=0.0, help="probability a packet is sent twice")
+    parser.add_argument("--rate", type=float, default=0.0, help="bandwidth cap in kbit/s per client and direction (0 = none)")
+    parser.add_argument("--queue-ms", type=float, default=DEFAULT_QUEUE_MS, help="tail drop once the cap queues a packet this long")
+    parser.add_argument("--direction", choices=("both", UP, DOWN), default="both", help="which direction to impair")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--stats-interval", type=float, default=STATS_INTERVAL)
+    args = parser.parse_args()
+
+    listen = parse_addr(args.listen, SERVER_IP)
+    server = parse_addr(args.server, SERVER_IP)
+
+    rng = random.Random(args.seed)
+    settings = dict(
+        loss=args.loss, delay_ms=args.delay, jitter_ms=args.jitter, jitter_dist=args.jitter_dist,
+        reorder=args.reorder, reorder_gap_ms=args.reorder_gap, duplicate=args.duplicate,
+        rate_kbit=args.rate, queue_ms=args.queue_ms, rng=rng,
+    )
+    up = Impairment(**settings) if args.direction in ("both", UP) else Impairment(rng=rng)
+    down = Impairment(**settings) if args.direction in ("both", DOWN) else Impairment(rng=rng)
+    if up.passthrough and down.passthrough:
+        print("[PROXY] No impairment configured, forwarding unchanged")
+
+    try:
+        asyncio.run(run_proxy(listen, server, up, down, args.stats_interval))
+    except KeyboardInterrupt:
+        print("\n[PROXY] Shutting down...")
+
+
+if __name__ == "__main__":
+    main()
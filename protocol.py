@@ -9,6 +9,7 @@ This file defines:
 - Struct packing formats
 """
 
+import json
 import struct
 from enum import IntEnum
 
@@ -17,7 +18,7 @@ from enum import IntEnum
 # ---------------------------------------------------------
 
 PROTOCOL_ID = b"GSCP"   # 4 bytes (Grid Sync Clash)
-VERSION = 7             # 1 byte protocol version
+VERSION = 16            # 1 byte protocol version
 
 # ---------------------------------------------------------
 # Message Types
@@ -35,6 +36,11 @@ class MsgType(IntEnum):
     PLAYER_COLOR = 8
     PLAYER_COLOR_ACK = 9 
     HEARTBEAT = 10
+    SNAPSHOT_ACK = 11 # Client → Server
+    VIEWPORT = 12     # Client → Server
+    STATS = 13        # Operator tool ↔ Server
+    MULTICAST = 14    # Client → Server
+    JOIN_NACK = 15    # Server → Client
 
 # ---------------------------------------------------------
 # Header Structure
@@ -50,6 +56,7 @@ class MsgType(IntEnum):
 
 HEADER_FORMAT = "!4s B B I I Q H"
 HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+HEADER_MSG_TYPE_OFFSET = 5    # msg_type byte, to peek at without unpacking
 
 # ---------------------------------------------------------
 # EVENT Payload Structure (Client → Server)
@@ -58,30 +65,135 @@ HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 class EventType(IntEnum):
     CLICK = 0    # Click on cell
 
-# Payload layout:
+# One EVENT datagram carries a batch of events, oldest first:
 #   player_id         2 bytes
+#   event_count       1 byte
+# followed by event_count records:
 #   client_msg_seq    2 bytes
 #   event_type        1 byte
-#   cell_index        2 bytes   (0–399 for 20×20)
+#   cell_index        4 bytes   (row * grid_size + col)
 #   client_timestamp  8 bytes   (ms)
+#
+# The client puts every unacknowledged event in each batch (see
+# event_batch.py), the server applies them in order and drops duplicates.
+# The header's seq_num is the client's oldest pending seq: the client got
+# acks for or gave up on everything before it, and the server's ack window
+# (EVENT_ACK_BITS wide) moves up to it.
+
+EVENT_HEADER_FORMAT = "!H B"
+EVENT_HEADER_SIZE = struct.calcsize(EVENT_HEADER_FORMAT)
 
-EVENT_FORMAT = "!H H B H Q"
+EVENT_FORMAT = "!H B I Q"
 EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
 
+# ---------------------------------------------------------
+# EVENT acknowledgements (Server → Client)
+# ---------------------------------------------------------
+# Carried in every SNAPSHOT chunk header, and as a standalone EVENT_ACK
+# payload when no snapshot is due soon:
+#   ack_seq    2 bytes   every event up to and including this seq arrived
+#   ack_bits   4 bytes   bit i set: event ack_seq + 1 + i arrived too
+#
+# client_msg_seq wraps at 16 bits, comparisons are modulo EVENT_SEQ_MOD.
+
+EVENT_ACK_FORMAT = "!H I"
+EVENT_ACK_SIZE = struct.calcsize(EVENT_ACK_FORMAT)
+
+EVENT_SEQ_MOD = 1 << 16
+EVENT_ACK_BITS = 32
+
+# ack_seq before the first event (= seq -1)
+NO_EVENTS_ACKED = EVENT_SEQ_MOD - 1
+
+
+def event_acked(seq, ack_seq, ack_bits):
+    """
+    True if (ack_seq, ack_bits) covers event seq.
+    """
+    offset = (seq - ack_seq) % EVENT_SEQ_MOD
+    if offset == 0 or offset >= EVENT_SEQ_MOD // 2:
+        return True     # at or before ack_seq
+    return offset <= EVENT_ACK_BITS and bool(ack_bits >> (offset - 1) & 1)
+
+# ---------------------------------------------------------
+# SNAPSHOT codecs (negotiated in JOIN / JOIN_ACK)
+# ---------------------------------------------------------
+# see snapshot_codec.py for the body layouts
+
+class SnapshotCodec(IntEnum):
+    RAW = 0        # two bytes per cell
+    BITPACK = 1    # ceil(log2(max_owner + 1)) bits per cell
+    RLE = 2        # (run_length, owner) pairs
+
+
+def codec_mask(codecs):
+    mask = 0
+    for codec in codecs:
+        mask |= 1 << codec
+    return mask
+
+
+# every peer must understand RAW
+ALL_CODECS_MASK = codec_mask(SnapshotCodec)
+
+# ---------------------------------------------------------
+# JOIN Payload Structure (Client → Server)
+# ---------------------------------------------------------
+#   codecs       1 byte    bitmask of SnapshotCodec the client can decode
+#   room_id      4 bytes   game to join, 0 = any room with a free seat
+#                          (see room_server.py, ignored by a single-room server)
+
+JOIN_FORMAT = "!B I"
+JOIN_SIZE = struct.calcsize(JOIN_FORMAT)
+
 # ---------------------------------------------------------
 # JOIN_ACK Payload Structure (Server → Client)
 # ---------------------------------------------------------
 #   player_id    2 bytes
-#   grid_size    1 byte
+#   grid_size    2 bytes   (grid is grid_size x grid_size)
 #   tick_rate    1 byte
 #   color_r      1 byte
 #   color_g      1 byte
 #   color_b      1 byte
+#   codecs       1 byte    bitmask of SnapshotCodec the server will use
+#   tile_size    1 byte    snapshot tiles are tile_size x tile_size cells
+#   room_id      4 bytes   the game we were placed in
+#   mcast_group  4 bytes   IPv4 multicast group SNAPSHOTs are published to,
+#   mcast_port   2 bytes   0.0.0.0 / 0 = unicast only (see MULTICAST below)
+#
+# JOIN_ACK comes from the socket of the room that hosts the game, every
+# later message goes to the address it came from.
 
-
-JOIN_ACK_FORMAT = "!H B B B B B"
+JOIN_ACK_FORMAT = "!H H B B B B B B I 4s H"
 JOIN_ACK_SIZE = struct.calcsize(JOIN_ACK_FORMAT)
 
+NO_MULTICAST_GROUP = bytes(4)
+
+# ---------------------------------------------------------
+# JOIN_NACK Payload Structure (Server → Client)
+# ---------------------------------------------------------
+#   room_id      4 bytes   the room the JOIN was routed to
+#
+# Sent by room_server.py instead of JOIN_ACK when that room could not be
+# opened; the client stops retrying its JOIN.
+
+JOIN_NACK_FORMAT = "!I"
+JOIN_NACK_SIZE = struct.calcsize(JOIN_NACK_FORMAT)
+
+# ---------------------------------------------------------
+# MULTICAST Payload Structure (Client → Server)
+# ---------------------------------------------------------
+#   receiving    1 byte    1 = joined the group from JOIN_ACK, stop sending
+#                          me unicast SNAPSHOTs; 0 = back to unicast
+#
+# Repeated with every heartbeat, like VIEWPORT. Group SNAPSHOTs carry no
+# EVENT acks (ack_seq = NO_EVENTS_ACKED), members get a standalone EVENT_ACK
+# for every EVENT instead. Everything else (JOIN_ACK, PLAYER_COLOR,
+# GAME_OVER, ...) stays unicast.
+
+MULTICAST_FORMAT = "!B"
+MULTICAST_SIZE = struct.calcsize(MULTICAST_FORMAT)
+
 # ---------------------------------------------------------
 # PLAYER_COLOR Payload Structure (Server → Client)
 # ---------------------------------------------------------
@@ -96,22 +208,83 @@ PLAYER_COLOR_SIZE = struct.calcsize(PLAYER_COLOR_FORMAT)
 # ---------------------------------------------------------
 # SNAPSHOT Payload Structure (Server → Client)
 # ---------------------------------------------------------
-# Phase 1: Full grid snapshot
-# 400 bytes = 20x20 grid, each cell 1 byte
+# A snapshot is split into MTU-sized chunk packets, each carrying one
+# tile_size x tile_size tile of the grid (edge tiles may be smaller).
+# Tiles are numbered row-major, see grid_tiles.py.
+#
+# Every SNAPSHOT payload starts with a 20 byte chunk header:
+#   kind          1 byte    (SnapshotKind)
+#   codec         1 byte    (SnapshotCodec of the tile body)
+#   baseline_id   4 bytes   (snapshot_id a DELTA is based on, 0 for FULL)
+#   chunk_index   2 bytes   (0 .. chunk_count-1)
+#   chunk_count   2 bytes   (chunks in this snapshot, 0 = nothing changed)
+#   tile_index    4 bytes
+#   ack_seq       2 bytes   EVENT acks for the receiving client,
+#   ack_bits      4 bytes   see EVENT_ACK_FORMAT
+#
+# body: the tile's cells (row-major, 16-bit owners) encoded with `codec`
 #
-# IMPORTANT: SNAPSHOT payload size = grid_size * grid_size
+# FULL snapshots carry every tile of the client's area of interest, DELTA
+# snapshots only the ones changed since baseline_id. The client applies each
+# tile as soon as it arrives, and acks a snapshot (SNAPSHOT_ACK) once it has
+# every chunk of it.
+#
+# OVERVIEW snapshots are a coarse map of the whole board, one cell per tile
+# (the tile's most common owner), sent at a low rate to clients that only
+# see part of the board. They are chunked the same way, tile_index refers
+# to a tile of the overview grid, and they are never acked.
 
-# Define SNAPSHOT grid size here so server/client import same value:
+# Default board: GRID_SIZE x GRID_SIZE cells, the server may pick another
+# size and announces it in JOIN_ACK.
 GRID_SIZE = 20
 SNAPSHOT_GRID_CELLS = GRID_SIZE * GRID_SIZE
 
-# Full snapshot payload = one byte per cell
-SNAPSHOT_SIZE = SNAPSHOT_GRID_CELLS  # 400 bytes
-REDUNDANT_SNAPHOT_SIZE = SNAPSHOT_SIZE * 2
+# Cell owners are 16-bit player ids (0 = unclaimed)
+CELL_BYTES = 2
+
+# Keep every datagram below a typical path MTU (1500 minus IP/UDP headers,
+# with margin for tunnels)
+MAX_DATAGRAM_SIZE = 1200
+
+# events per EVENT datagram
+MAX_EVENTS_PER_BATCH = min(255, (MAX_DATAGRAM_SIZE - HEADER_SIZE - EVENT_HEADER_SIZE) // EVENT_SIZE)
+
+# 16x16 tile, RAW = 512 bytes of body -> always fits MAX_DATAGRAM_SIZE
+TILE_SIZE = 16
+
+
+class SnapshotKind(IntEnum):
+    FULL = 0     # keyframe, every tile in the area of interest
+    DELTA = 1    # only tiles changed since baseline_id
+    OVERVIEW = 2 # one cell per tile, whole board
+
+
+SNAPSHOT_HEADER_FORMAT = "!B B I H H I H I"
+SNAPSHOT_HEADER_SIZE = struct.calcsize(SNAPSHOT_HEADER_FORMAT)
+
+# where ack_seq / ack_bits start inside the chunk header
+SNAPSHOT_EVENT_ACK_OFFSET = SNAPSHOT_HEADER_SIZE - EVENT_ACK_SIZE
+
+# SNAPSHOT_ACK (Client → Server): last snapshot_id the client applied
+SNAPSHOT_ACK_FORMAT = "!I"
+SNAPSHOT_ACK_SIZE = struct.calcsize(SNAPSHOT_ACK_FORMAT)
+
+# VIEWPORT (Client → Server): the part of the board the client looks at
+#   row0, col0   2 bytes each   top-left cell
+#   rows, cols   2 bytes each   size of the visible area
+VIEWPORT_FORMAT = "!HHHH"
+VIEWPORT_SIZE = struct.calcsize(VIEWPORT_FORMAT)
 
 # GAME_OVER message format:
-# winner_id (H) + num_players(B) + repeating pairs of (player_id H, score H)
-GAME_OVER_HEADER = "!HB"
+# winner_id (H) + num_players(H) + repeating pairs of (player_id H, score I)
+GAME_OVER_HEADER = "!HH"
+GAME_OVER_HEADER_SIZE = struct.calcsize(GAME_OVER_HEADER)
+GAME_OVER_SCORE_FORMAT = "!HI"
+GAME_OVER_SCORE_SIZE = struct.calcsize(GAME_OVER_SCORE_FORMAT)
+
+# more scores than this don't fit one UDP datagram (IPv4), the server only
+# sends the highest ones
+MAX_GAME_OVER_SCORES = (65507 - HEADER_SIZE - GAME_OVER_HEADER_SIZE) // GAME_OVER_SCORE_SIZE
 
 GAME_OVER_ACK_FORMAT = "!H"   # player_id
 GAME_OVER_ACK_SIZE = 2
@@ -124,3 +297,259 @@ PLAYER_COLOR_SIZE = struct.calcsize(PLAYER_COLOR_FORMAT)
 PLAYER_COLOR_ACK_FORMAT = "!H"
 PLAYER_COLOR_ACK_SIZE = struct.calcsize(PLAYER_COLOR_ACK_FORMAT)
 
+# STATS: a request has no payload, the server answers with the same seq_num
+# and a UTF-8 JSON object of its live counters (see server_stats.py).
+# Only answered for local (loopback) senders by default.
+STATS_ENCODING = "utf-8"
+MAX_STATS_PAYLOAD = 65507 - HEADER_SIZE   # largest UDP datagram over IPv4
+
+
+# ---------------------------------------------------------
+# Codec (shared by server and client)
+# ---------------------------------------------------------
+# Every format above precompiled once. Outgoing packets are packed with
+# pack_into() into a preallocated PacketBuffer, incoming ones are read with
+# unpack_from() straight out of the datagram, so the hot paths neither
+# parse format strings nor slice / concatenate bytes per packet.
+
+HEADER_STRUCT = struct.Struct(HEADER_FORMAT)
+JOIN_STRUCT = struct.Struct(JOIN_FORMAT)
+JOIN_ACK_STRUCT = struct.Struct(JOIN_ACK_FORMAT)
+JOIN_NACK_STRUCT = struct.Struct(JOIN_NACK_FORMAT)
+EVENT_HEADER_STRUCT = struct.Struct(EVENT_HEADER_FORMAT)
+EVENT_STRUCT = struct.Struct(EVENT_FORMAT)
+EVENT_ACK_STRUCT = struct.Struct(EVENT_ACK_FORMAT)
+SNAPSHOT_HEADER_STRUCT = struct.Struct(SNAPSHOT_HEADER_FORMAT)
+SNAPSHOT_ACK_STRUCT = struct.Struct(SNAPSHOT_ACK_FORMAT)
+VIEWPORT_STRUCT = struct.Struct(VIEWPORT_FORMAT)
+PLAYER_COLOR_STRUCT = struct.Struct(PLAYER_COLOR_FORMAT)
+PLAYER_COLOR_ACK_STRUCT = struct.Struct(PLAYER_COLOR_ACK_FORMAT)
+GAME_OVER_HEADER_STRUCT = struct.Struct(GAME_OVER_HEADER)
+GAME_OVER_SCORE_STRUCT = struct.Struct(GAME_OVER_SCORE_FORMAT)
+GAME_OVER_ACK_STRUCT = struct.Struct(GAME_OVER_ACK_FORMAT)
+MULTICAST_STRUCT = struct.Struct(MULTICAST_FORMAT)
+
+# fixed-size payload of each message type (READY / HEARTBEAT have none;
+# EVENT, SNAPSHOT and GAME_OVER are variable-size, see their helpers)
+PAYLOAD_STRUCTS = {
+    MsgType.JOIN: JOIN_STRUCT,
+    MsgType.JOIN_ACK: JOIN_ACK_STRUCT,
+    MsgType.JOIN_NACK: JOIN_NACK_STRUCT,
+    MsgType.EVENT_ACK: EVENT_ACK_STRUCT,
+    MsgType.SNAPSHOT_ACK: SNAPSHOT_ACK_STRUCT,
+    MsgType.VIEWPORT: VIEWPORT_STRUCT,
+    MsgType.PLAYER_COLOR: PLAYER_COLOR_STRUCT,
+    MsgType.PLAYER_COLOR_ACK: PLAYER_COLOR_ACK_STRUCT,
+    MsgType.GAME_OVER_ACK: GAME_OVER_ACK_STRUCT,
+    MsgType.MULTICAST: MULTICAST_STRUCT,
+}
+
+
+def pack_header(msg_type, snapshot_id, seq_num, timestamp_ms, payload_len):
+    return HEADER_STRUCT.pack(
+        PROTOCOL_ID, VERSION, msg_type,
+        snapshot_id, seq_num, timestamp_ms, payload_len,
+    )
+
+
+def pack_header_into(buf, offset, msg_type, snapshot_id, seq_num, timestamp_ms, payload_len):
+    HEADER_STRUCT.pack_into(
+        buf, offset,
+        PROTOCOL_ID, VERSION, msg_type,
+        snapshot_id, seq_num, timestamp_ms, payload_len,
+    )
+
+
+def pack_message(msg_type, *fields, snapshot_id=0, seq_num=0, timestamp_ms=0):
+    """
+    One fixed-size message as a new bytearray, for packets that are kept
+    around (e.g. for retransmission). Use PacketBuffer for send-and-forget.
+    """
+    payload = PAYLOAD_STRUCTS.get(msg_type)
+    payload_len = 0 if payload is None else payload.size
+
+    packet = bytearray(HEADER_SIZE + payload_len)
+    pack_header_into(packet, 0, msg_type, snapshot_id, seq_num, timestamp_ms, payload_len)
+    if payload is not None:
+        payload.pack_into(packet, HEADER_SIZE, *fields)
+    return packet
+
+
+def unpack_header(data):
+    """
+    (protocol_id, version, msg_type, snapshot_id, seq_num, timestamp_ms,
+    payload_len), or None if data is too short.
+    """
+    if len(data) < HEADER_SIZE:
+        return None
+    return HEADER_STRUCT.unpack_from(data)
+
+
+def unpack_payload(msg_type, data):
+    """
+    Fields of a fixed-size message, or None if data is too short.
+    """
+    payload = PAYLOAD_STRUCTS[msg_type]
+    if len(data) < HEADER_SIZE + payload.size:
+        return None
+    return payload.unpack_from(data, HEADER_SIZE)
+
+
+def unpack_event_batch(data):
+    """
+    (player_id, iterator of (seq, event_type, cell_index, timestamp_ms)),
+    or None if the batch is truncated.
+    """
+    if len(data) < HEADER_SIZE + EVENT_HEADER_SIZE:
+        return None
+
+    player_id, count = EVENT_HEADER_STRUCT.unpack_from(data, HEADER_SIZE)
+    start = HEADER_SIZE + EVENT_HEADER_SIZE
+    end = start + count * EVENT_SIZE
+    if len(data) < end:
+        return None
+
+    return player_id, EVENT_STRUCT.iter_unpack(memoryview(data)[start:end])
+
+
+def unpack_snapshot_header(data):
+    """
+    (kind, codec, baseline_id, chunk_index, chunk_count, tile_index,
+    ack_seq, ack_bits), or None if data is too short.
+    """
+    if len(data) < HEADER_SIZE + SNAPSHOT_HEADER_SIZE:
+        return None
+    return SNAPSHOT_HEADER_STRUCT.unpack_from(data, HEADER_SIZE)
+
+
+def unpack_game_over(data):
+    """
+    (winner_id, {player_id: score}), or None if data is too short.
+    A truncated score list keeps the scores that arrived.
+    """
+    if len(data) < HEADER_SIZE + GAME_OVER_HEADER_SIZE:
+        return None
+
+    winner_id, num_players = GAME_OVER_HEADER_STRUCT.unpack_from(data, HEADER_SIZE)
+    offset = HEADER_SIZE + GAME_OVER_HEADER_SIZE
+
+    scores = {}
+    for _ in range(num_players):
+        if offset + GAME_OVER_SCORE_SIZE > len(data):
+            break
+        pid, score = GAME_OVER_SCORE_STRUCT.unpack_from(data, offset)
+        scores[pid] = score
+        offset += GAME_OVER_SCORE_SIZE
+
+    return winner_id, scores
+
+
+class PacketBuffer:
+    """
+    A preallocated outgoing datagram.
+
+    Every method packs a whole packet into the same buffer and returns a
+    memoryview of it that is only valid until the next call, so send it
+    right away (socket.sendto / transport.sendto copy what they keep).
+    Not thread-safe: one PacketBuffer per sending thread.
+    """
+
+    def __init__(self, size=MAX_DATAGRAM_SIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+
+    def message(self, msg_type, *fields, snapshot_id=0, seq_num=0, timestamp_ms=0):
+        """
+        Any fixed-size message (see PAYLOAD_STRUCTS), or a header-only one.
+        """
+        payload = PAYLOAD_STRUCTS.get(msg_type)
+        payload_len = 0 if payload is None else payload.size
+
+        pack_header_into(self.buf, 0, msg_type, snapshot_id, seq_num, timestamp_ms, payload_len)
+        if payload is not None:
+            payload.pack_into(self.buf, HEADER_SIZE, *fields)
+        return self.view[:HEADER_SIZE + payload_len]
+
+    def event_batch(self, player_id, events, seq_num=0, timestamp_ms=0):
+        """
+        EVENT with events = [(seq, event_type, cell_index, timestamp_ms), ...].
+        """
+        offset = HEADER_SIZE + EVENT_HEADER_SIZE
+        for event in events:
+            EVENT_STRUCT.pack_into(self.buf, offset, *event)
+            offset += EVENT_SIZE
+
+        EVENT_HEADER_STRUCT.pack_into(self.buf, HEADER_SIZE, player_id, len(events))
+        pack_header_into(self.buf, 0, MsgType.EVENT, 0, seq_num, timestamp_ms, offset - HEADER_SIZE)
+        return self.view[:offset]
+
+    def game_over(self, winner_id, scores, timestamp_ms=0):
+        """
+        GAME_OVER with scores = {player_id: cells owned}, at most
+        MAX_GAME_OVER_SCORES of them.
+        """
+        size = HEADER_SIZE + GAME_OVER_HEADER_SIZE + len(scores) * GAME_OVER_SCORE_SIZE
+        # too many players for the buffer: a packet of its own
+        buf = self.buf if size <= len(self.buf) else bytearray(size)
+
+        GAME_OVER_HEADER_STRUCT.pack_into(buf, HEADER_SIZE, winner_id, len(scores))
+
+        offset = HEADER_SIZE + GAME_OVER_HEADER_SIZE
+        for pid, score in scores.items():
+            GAME_OVER_SCORE_STRUCT.pack_into(buf, offset, pid, score)
+            offset += GAME_OVER_SCORE_SIZE
+
+        pack_header_into(buf, 0, MsgType.GAME_OVER, 0, 0, timestamp_ms, offset - HEADER_SIZE)
+        return self.view[:offset] if buf is self.buf else buf
+
+    def snapshot_chunk(self, packet, ack_seq, ack_bits):
+        """
+        Copy of a prebuilt SNAPSHOT chunk with one client's EVENT acks.
+        """
+        size = len(packet)
+        if size > len(self.buf):
+            # only with a tile_size too big for one datagram, copy instead
+            out = bytearray(packet)
+            EVENT_ACK_STRUCT.pack_into(out, HEADER_SIZE + SNAPSHOT_EVENT_ACK_OFFSET, ack_seq, ack_bits)
+            return out
+
+        self.view[:size] = packet
+        EVENT_ACK_STRUCT.pack_into(self.buf, HEADER_SIZE + SNAPSHOT_EVENT_ACK_OFFSET, ack_seq, ack_bits)
+        return self.view[:size]
+
+
+def pack_stats(stats, seq_num=0, timestamp_ms=0):
+    """
+    STATS response for the dict stats, or None if it doesn't fit a datagram.
+    """
+    payload = json.dumps(stats, separators=(",", ":")).encode(STATS_ENCODING)
+    if len(payload) > MAX_STATS_PAYLOAD:
+        return None
+    return pack_header(MsgType.STATS, 0, seq_num, timestamp_ms, len(payload)) + payload
+
+
+def unpack_stats(data):
+    """
+    The dict of a STATS response (raises ValueError if it is malformed).
+    """
+    return json.loads(bytes(data[HEADER_SIZE:]).decode(STATS_ENCODING))
+
+
+def build_snapshot_chunk(snapshot_id, timestamp_ms, kind, codec, baseline_id,
+                         chunk_index, chunk_count, tile, body):
+    """
+    One SNAPSHOT chunk packet (no EVENT acks yet, see PacketBuffer.snapshot_chunk).
+    Built once per tick and shared between clients.
+    """
+    payload_len = SNAPSHOT_HEADER_SIZE + len(body)
+
+    packet = bytearray(HEADER_SIZE + payload_len)
+    pack_header_into(packet, 0, MsgType.SNAPSHOT, snapshot_id, snapshot_id, timestamp_ms, payload_len)
+    SNAPSHOT_HEADER_STRUCT.pack_into(
+        packet, HEADER_SIZE,
+        kind, codec, baseline_id,
+        chunk_index, chunk_count, tile,
+        NO_EVENTS_ACKED, 0,
+    )
+    packet[HEADER_SIZE + SNAPSHOT_HEADER_SIZE:] = body
+    return packet
@@ -0,0 +1,166 @@
+"""
+GridClash binary grid recordings.
+Written by the server (server_positions.bin) and the clients
+(client_positions.bin), read by compute_positional_error.py.
+
+File layout (little-endian, fixed-size records):
+
+    header   16 bytes
+        magic        4 bytes   b"GSRC"
+        version      1 byte
+        cell_bytes   1 byte    bytes per cell (2)
+        grid_size    2 bytes
+        (padding)    8 bytes
+
+    record   RECORD_PREFIX_SIZE + grid_size * grid_size * cell_bytes
+        snapshot_id  4 bytes
+        timestamp_ms 8 bytes
+        player_id    2 bytes   (0 for the server)
+        cells        2 bytes per cell (16-bit owner, UNKNOWN_CELL for
+                     cells outside a client's viewport)
+
+Because every record has the same size the analyzers can map the whole
+file with numpy.memmap instead of parsing it.
+"""
+
+import os
+import struct
+import sys
+from array import array
+
+RECORDING_MAGIC = b"GSRC"
+RECORDING_VERSION = 2
+
+RECORDING_HEADER_FORMAT = "<4s B B H 8x"
+RECORDING_HEADER_SIZE = struct.calcsize(RECORDING_HEADER_FORMAT)
+
+RECORD_PREFIX_FORMAT = "<I Q H"   # snapshot_id, timestamp_ms, player_id
+RECORD_PREFIX_SIZE = struct.calcsize(RECORD_PREFIX_FORMAT)
+
+CELL_BYTES = 2
+
+# clients with a viewport only get the tiles under it; the rest of their
+# board is stale and recorded as this, the analyzers skip it
+UNKNOWN_CELL = 0xFFFF
+
+
+def pack_cells(cells):
+    cells = array("H", cells)
+    if sys.byteorder == "big":
+        cells.byteswap()
+    return cells.tobytes()
+
+
+def pack_record(snapshot_id, timestamp_ms, player_id, cells):
+    return struct.pack(RECORD_PREFIX_FORMAT, snapshot_id, timestamp_ms, player_id) + pack_cells(cells)
+
+
+def read_recording_header(path):
+    """
+    (cell_bytes, grid_size) of a recording.
+    """
+    with open(path, "rb") as f:
+        header = f.read(RECORDING_HEADER_SIZE)
+
+    if len(header) < RECORDING_HEADER_SIZE:
+        raise ValueError(f"{path}: file too short for a recording header")
+
+    magic, version, cell_bytes, grid_size = struct.unpack(RECORDING_HEADER_FORMAT, header)
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+        raise ValueError(f"{path}: not a GridClash recording (v{RECORDING_VERSION})")
+    return cell_bytes, grid_size
+
+
+def open_for_append(path, grid_size):
+    """
+    Open a recording for appending, writing the header if we created it.
+    Several clients may share one file: O_EXCL makes sure exactly one of
+    them writes the header, O_APPEND keeps whole records from interleaving.
+    Raises ValueError if an existing file was recorded on another board.
+    """
+    flags = os.O_WRONLY | os.O_APPEND | getattr(os, "O_BINARY", 0)
+    try:
+        fd = os.open(path, flags | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        # empty: another client created it and is about to write the header
+        if os.path.getsize(path) > 0:
+            cell_bytes, recorded_size = read_recording_header(path)
+            if (cell_bytes, recorded_size) != (CELL_BYTES, grid_size):
+                raise ValueError(
+                    f"{path}: recorded on a {recorded_size}x{recorded_size} board, "
+                    f"this one is {grid_size}x{grid_size} (move the old recording away)"
+                )
+        return os.open(path, flags)
+
+    os.write(fd, struct.pack(
+        RECORDING_HEADER_FORMAT,
+        RECORDING_MAGIC,
+        RECORDING_VERSION,
+        CELL_BYTES,
+        grid_size,
+    ))
+    return fd
+
+
+class RecordingWriter:
+    """
+    Synchronous writer, one os.write() per record (client side).
+    """
+
+    def __init__(self, path, grid_size):
+        self.fd = open_for_append(path, grid_size)
+
+    def write(self, snapshot_id, timestamp_ms, player_id, cells):
+        os.write(self.fd, pack_record(snapshot_id, timestamp_ms, player_id, cells))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RecordingSink:
+    """
+    BackgroundLogger sink (server side).
+    Queued records are (snapshot_id, timestamp_ms, cells).
+    """
+
+    def __init__(self, path, grid_size, player_id=0):
+        self.fd = open_for_append(path, grid_size)
+        self.player_id = player_id
+
+    def write_batch(self, records):
+        os.write(self.fd, b"".join(
+            pack_record(snapshot_id, timestamp_ms, self.player_id, cells)
+            for snapshot_id, timestamp_ms, cells in records
+        ))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+def load_recording(path):
+    """
+    Map a recording into memory.
+    Returns a numpy record array with fields
+    snapshot_id, timestamp_ms, player_id and cells (n_records x n_cells).
+    A truncated trailing record (process killed mid-write) is ignored.
+    """
+    # numpy is only needed by the analyzers, not by server/client
+    import numpy as np
+
+    cell_bytes, grid_size = read_recording_header(path)
+
+    dtype = np.dtype([
+        ("snapshot_id", "<u4"),
+        ("timestamp_ms", "<u8"),
+        ("player_id", "<u2"),
+        ("cells", f"<u{cell_bytes}", (grid_size * grid_size,)),
+    ])
+
+    count = (os.path.getsize(path) - RECORDING_HEADER_SIZE) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode="r", offset=RECORDING_HEADER_SIZE, shape=(count,))
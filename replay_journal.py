@@ -0,0 +1,161 @@
+"""
+GridClash journal replay (server benchmarking / profiling).
+
+Feeds a journal written by the server (GRIDCLASH_JOURNAL, see journal.py)
+back through GameServer.datagram_received, i.e. the same header checks and
+JOIN / READY / EVENT / ... handlers, on a fresh GameServer without a
+socket (replies go to a NullTransport that only counts them) and without
+log files. The same journal always gives the same board.
+
+- --speed 0 (default) replays as fast as possible, --speed N at N x the
+  recorded clock (1 = real time)
+- queued EVENT claims are applied every TICK_INTERVAL of journal time, as
+  the server's tick does; --ticks runs the whole send_snapshots() instead
+- --repeat N replays N times, each on a fresh server, and reports the best
+- --profile prints the cProfile top functions of one more replay
+
+Run with: python replay_journal.py server_journal.bin [--speed 0] [--ticks] [--repeat 5] [--profile]
+(record one with: GRIDCLASH_JOURNAL=server_journal.bin python server.py)
+"""
+
+import argparse
+import contextlib
+import cProfile
+import hashlib
+import os
+import pstats
+import time
+
+from journal import load_journal, read_journal_header
+from server import GameServer, TICK_INTERVAL
+from protocol import MsgType
+
+PROFILE_TOP = 25
+
+
+class NullTransport:
+    """
+    Stands in for the server's UDP socket: counts what would be sent.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def sendto(self, data, addr=None):
+        self.packets += 1
+        self.bytes += len(data)
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def close(self):
+        pass
+
+
+def wait_until(started, at_us, speed):
+    if speed <= 0:
+        return
+    delay = started + at_us / speed / 1_000_000 - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def replay(records, grid_size, tile_size, speed=0.0, ticks=False):
+    """
+    One replay of records on a fresh GameServer.
+    Returns (server, transport, elapsed seconds, ticks run).
+    """
+    server = GameServer(
+        "127.0.0.1", 0, grid_size=grid_size, tile_size=tile_size,
+        metrics_file=None, positions_file=None, journal_file=None, multicast_addr=None,
+    )
+    transport = NullTransport()
+    server.connection_made(transport)
+
+    receive = server.datagram_received
+    tick_us = int(TICK_INTERVAL * 1_000_000)
+    next_tick_us = tick_us
+    tick_count = 0
+
+    tick = server.send_snapshots if ticks else server.apply_events
+
+    started = time.perf_counter()
+    for arrival_us, addr, data in records:
+        while next_tick_us <= arrival_us:
+            wait_until(started, next_tick_us, speed)
+            tick()
+            tick_count += 1
+            next_tick_us += tick_us
+
+        wait_until(started, arrival_us, speed)
+        receive(data, addr)
+    tick()
+    elapsed = time.perf_counter() - started
+
+    server.close()
+    return server, transport, elapsed, tick_count
+
+
+def board_digest(server):
+    return hashlib.sha1(server.state.cells.tobytes()).hexdigest()[:16]
+
+
+def print_result(records, server, transport, elapsed, tick_count):
+    rate = len(records) / elapsed if elapsed > 0 else float("inf")
+    print(f"[REPLAY] {len(records)} datagrams in {elapsed * 1000:.1f} ms -> {rate:,.0f} datagrams/s")
+    if tick_count:
+        print(f"[REPLAY] {tick_count} ticks, {elapsed / tick_count * 1000:.3f} ms per tick incl. datagrams")
+
+    stats = server.stats.collect()
+    by_type = ", ".join(
+        f"{MsgType(t).name} {n}" for t, n in sorted(stats.packets_in.items())
+    )
+    print(f"[REPLAY] in: {by_type}")
+    print(f"[REPLAY] out: {transport.packets} packets, {transport.bytes} bytes")
+    if stats.drops:
+        print(f"[REPLAY] drops: {stats.drops}")
+    print(f"[REPLAY] players {len(server.sessions)}, board {board_digest(server)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a GridClash server journal")
+    parser.add_argument("journal")
+    parser.add_argument("--speed", type=float, default=0.0, help="clock scale, 0 = as fast as possible")
+    parser.add_argument("--ticks", action="store_true", help="also run the snapshot tick")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="keep the server's own prints")
+    args = parser.parse_args()
+
+    grid_size, tile_size = read_journal_header(args.journal)
+    records = load_journal(args.journal)
+    span = records[-1][0] / 1_000_000 if records else 0.0
+    print(f"[REPLAY] {args.journal}: {len(records)} datagrams over {span:.1f} s, "
+          f"{grid_size}x{grid_size} board, tile {tile_size}")
+
+    with open(os.devnull, "w") as devnull:
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+
+        best = None
+        digests = set()
+        for _ in range(max(1, args.repeat)):
+            with quiet:
+                result = replay(records, grid_size, tile_size, args.speed, args.ticks)
+            digests.add(board_digest(result[0]))
+            if best is None or result[2] < best[2]:
+                best = result
+
+        print_result(records, *best)
+        if len(digests) > 1:
+            print(f"[REPLAY] WARNING: {len(digests)} different final boards over {args.repeat} runs")
+
+        if args.profile:
+            profiler = cProfile.Profile()
+            with quiet:
+                profiler.runcall(replay, records, grid_size, tile_size, args.speed, args.ticks)
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP)
+
+
+if __name__ == "__main__":
+    main()
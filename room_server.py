@@ -0,0 +1,361 @@
+"""
+GridClash Room Server
+
+Hosts many games ("rooms") in one deployment, spread over a pool of worker
+processes so every core is used:
+
+- the dispatcher (main process) owns the public port (ADDR) and only ever
+  sees JOIN. It picks the room (room_id from JOIN, or matchmaking into a
+  room with a free seat when room_id is 0) and hands the JOIN to the worker
+  that owns the room (room_id % number of workers).
+- each worker runs its rooms on one asyncio loop. Every room is a normal
+  GameServer with its own grid, player table and tick, bound to its own
+  ephemeral UDP port; it answers the JOIN from that port and the client
+  talks to the room directly from then on, so per-tick traffic never goes
+  through the dispatcher.
+- rooms nobody has sent anything to for ROOM_IDLE_TIMEOUT seconds are
+  closed, and the dispatcher is told so it stops matchmaking into them.
+  It is also told when a room drops a player, so the seat can be taken by
+  someone else, and when a room's game is over, so nobody new is
+  matchmade into a full board.
+- a room that fails to open answers its JOINs with JOIN_NACK (sent by the
+  dispatcher) instead of leaving the clients retrying forever.
+
+Run with: python room_server.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from background_logger import BackgroundLogger
+from server import (
+    GameServer, PLAYER_COLORS,
+    SERVER_IP, SERVER_PORT, SERVER_GRID_SIZE,
+    LOG_RING_CAPACITY, LOG_FLUSH_INTERVAL, LOG_RING_MAX_BYTES,
+    JOURNAL_FILE,
+)
+
+from protocol import (
+    MsgType, PROTOCOL_ID, VERSION,
+    PacketBuffer,
+    unpack_header, unpack_payload,
+)
+
+
+NUM_WORKERS = os.cpu_count() or 1
+
+MAX_ROOM_PLAYERS = len(PLAYER_COLORS)   # matchmaking fills rooms up to this
+ROOM_GRID_SIZE = SERVER_GRID_SIZE     # GRIDCLASH_GRID_SIZE
+
+ROOM_IDLE_TIMEOUT = 10      # seconds without a datagram before a room is closed
+ROOM_REAP_INTERVAL = 5
+
+# per-room metrics (one CSV per room); positions are not recorded for rooms
+ROOM_LOG_DIR = "room_logs"
+
+# what workers report back to the dispatcher, as (report, room_id, client_addr);
+# client_addr is None except for PLAYER_LEFT
+PLAYER_LEFT = "left"          # client_addr's seat is free again
+ROOM_CLOSED = "closed"        # idle, or the worker is stopping
+ROOM_FAILED = "failed"        # could not be opened, its JOINs get JOIN_NACK
+ROOM_FINISHED = "finished"    # GAME_OVER went out, the board is full
+
+
+# ---------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------
+
+class RoomWorker:
+    """
+    Runs the rooms of one worker process.
+    JOINs arrive from the dispatcher on join_queue as (room_id, data, client_addr).
+    Players that left, rooms that closed, failed to open or finished their
+    game go back on report_queue (see PLAYER_LEFT ... ROOM_FINISHED).
+    """
+
+    def __init__(self, index, host, join_queue, report_queue):
+        self.index = index
+        self.host = host
+        self.join_queue = join_queue
+        self.report_queue = report_queue
+
+        # key = room_id, value = task that starts the room (result = GameServer)
+        self.rooms = {}
+
+        # one writer thread for every room of this worker
+        self.logger = BackgroundLogger(LOG_RING_CAPACITY, LOG_FLUSH_INTERVAL, LOG_RING_MAX_BYTES)
+        self.loop = None
+        self._stopped = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = self.loop.create_future()
+
+        os.makedirs(ROOM_LOG_DIR, exist_ok=True)
+        self.logger.start()
+
+        # multiprocessing queues block, read them from a thread
+        threading.Thread(target=self.read_joins, daemon=True).start()
+        reaper = self.loop.create_task(self.reap_loop())
+
+        print(f"[WORKER {self.index}] Started (pid {os.getpid()})")
+        try:
+            await self._stopped
+        finally:
+            reaper.cancel()
+            for room_id in list(self.rooms):
+                self.close_room(room_id)
+            self.logger.close()
+
+    def stop(self):
+        if self._stopped is not None and not self._stopped.done():
+            self._stopped.set_result(None)
+
+    def read_joins(self):
+        while True:
+            item = self.join_queue.get()
+            if item is None:
+                self.loop.call_soon_threadsafe(self.stop)
+                return
+            future = asyncio.run_coroutine_threadsafe(self.join(*item), self.loop)
+            future.add_done_callback(self.join_done)
+
+    def join_done(self, future):
+        # run_coroutine_threadsafe keeps exceptions in the future, print them
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[WORKER {self.index}] JOIN failed: {future.exception()!r}")
+
+    async def open_room(self, room_id):
+        room = GameServer(
+            self.host, 0,
+            grid_size=ROOM_GRID_SIZE,
+            room_id=room_id,
+            logger=self.logger,
+            metrics_file=os.path.join(ROOM_LOG_DIR, f"server_metrics_room{room_id}.csv"),
+            positions_file=None,
+            # one journal per room (including the JOIN the dispatcher forwards)
+            journal_file=os.path.join(ROOM_LOG_DIR, f"journal_room{room_id}.bin") if JOURNAL_FILE else None,
+            # rooms would all share the one group, keep them unicast
+            multicast_addr=None,
+            on_player_left=lambda client_addr: self.report_queue.put((PLAYER_LEFT, room_id, client_addr)),
+            on_game_over=lambda: self.report_queue.put((ROOM_FINISHED, room_id, None)),
+        )
+        await room.start()
+        print(f"[WORKER {self.index}] Room {room_id} opened on {room.address}")
+        return room
+
+    async def join(self, room_id, data, client_addr):
+        task = self.rooms.get(room_id)
+        if task is None:
+            task = self.loop.create_task(self.open_room(room_id))
+            self.rooms[room_id] = task
+
+        try:
+            room = await task
+        except Exception as e:
+            # every JOIN waiting for this room ends up here, report it once
+            if self.rooms.get(room_id) is task:
+                del self.rooms[room_id]
+                print(f"[WORKER {self.index}] Room {room_id} failed to open: {e!r}")
+                self.report_queue.put((ROOM_FAILED, room_id, None))
+            return
+
+        room.datagram_received(data, client_addr)
+
+    def close_room(self, room_id):
+        task = self.rooms.pop(room_id)
+        if task.done() and task.exception() is None:
+            task.result().close()
+        else:
+            task.cancel()
+
+        self.report_queue.put((ROOM_CLOSED, room_id, None))
+        print(f"[WORKER {self.index}] Room {room_id} closed")
+
+    async def reap_loop(self):
+        while True:
+            await asyncio.sleep(ROOM_REAP_INTERVAL)
+
+            now = time.time()
+            idle = [
+                room_id for room_id, task in self.rooms.items()
+                if task.done() and (task.exception() is not None
+                                    or now - task.result().last_activity > ROOM_IDLE_TIMEOUT)
+            ]
+            for room_id in idle:
+                self.close_room(room_id)
+
+
+def worker_main(index, host, join_queue, report_queue):
+    # Ctrl+C goes to the whole process group, let the dispatcher stop us
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    worker = RoomWorker(index, host, join_queue, report_queue)
+
+    async def run():
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, worker.stop)
+        except NotImplementedError:
+            pass  # Windows
+        await worker.run()
+
+    asyncio.run(run())
+
+
+# ---------------------------------------------------------
+# Dispatcher (main process)
+# ---------------------------------------------------------
+
+class RoomDispatcher(asyncio.DatagramProtocol):
+
+    def __init__(self, join_queues):
+        self.transport = None
+        self.join_queues = join_queues
+        self.out = PacketBuffer()
+
+        # key = room_id, value = client addresses in that room (seats taken)
+        self.room_players = {}
+        # key = client_addr, value = room_id (JOIN retransmissions go to the same room)
+        self.addr_room = {}
+        # rooms whose game is over, matchmaking skips them
+        self.finished_rooms = set()
+        self.next_room_id = 1
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        pass
+
+    def datagram_received(self, data, client_addr):
+        header = unpack_header(data)
+        if header is None:
+            return
+
+        prot_id, ver, msg_type, _sid, _seq, _ts, _plen = header
+        if prot_id != PROTOCOL_ID or ver != VERSION or msg_type != MsgType.JOIN:
+            return
+
+        room_id = 0
+        join = unpack_payload(MsgType.JOIN, data)
+        if join is not None:
+            _codecs, room_id = join
+
+        if client_addr in self.addr_room:
+            room_id = self.addr_room[client_addr]
+        elif room_id == 0:
+            room_id = self.matchmake()
+
+        self.addr_room[client_addr] = room_id
+        self.room_players.setdefault(room_id, set()).add(client_addr)
+
+        worker = room_id % len(self.join_queues)
+        self.join_queues[worker].put((room_id, data, client_addr))
+
+    def matchmake(self):
+        for room_id, players in self.room_players.items():
+            if len(players) < MAX_ROOM_PLAYERS and room_id not in self.finished_rooms:
+                return room_id
+
+        while self.next_room_id in self.room_players:
+            self.next_room_id += 1
+        room_id = self.next_room_id
+        self.next_room_id += 1
+        return room_id
+
+    def player_left(self, room_id, client_addr):
+        players = self.room_players.get(room_id)
+        if players is not None:
+            players.discard(client_addr)
+        if self.addr_room.get(client_addr) == room_id:
+            del self.addr_room[client_addr]
+
+    def room_closed(self, room_id):
+        self.finished_rooms.discard(room_id)
+        for addr in self.room_players.pop(room_id, ()):
+            if self.addr_room.get(addr) == room_id:
+                del self.addr_room[addr]
+
+    def room_failed(self, room_id):
+        players = self.room_players.get(room_id, ())
+        print(f"[ROOMS] Room {room_id} failed to open, refusing {len(players)} players")
+        for addr in players:
+            self.transport.sendto(self.out.message(MsgType.JOIN_NACK, room_id), addr)
+        self.room_closed(room_id)
+
+    def room_finished(self, room_id):
+        if room_id in self.room_players:
+            self.finished_rooms.add(room_id)
+
+    def report(self, report, room_id, client_addr):
+        if report == PLAYER_LEFT:
+            self.player_left(room_id, client_addr)
+        elif report == ROOM_CLOSED:
+            self.room_closed(room_id)
+        elif report == ROOM_FAILED:
+            self.room_failed(room_id)
+        elif report == ROOM_FINISHED:
+            self.room_finished(room_id)
+
+
+def read_reports(report_queue, dispatcher, loop):
+    while True:
+        item = report_queue.get()
+        if item is None:
+            return
+        loop.call_soon_threadsafe(dispatcher.report, *item)
+
+
+async def main(host=SERVER_IP, port=SERVER_PORT, num_workers=NUM_WORKERS):
+    loop = asyncio.get_running_loop()
+
+    join_queues = [multiprocessing.Queue() for _ in range(num_workers)]
+    report_queue = multiprocessing.Queue()
+
+    workers = [
+        multiprocessing.Process(
+            target=worker_main,
+            args=(i, host, join_queues[i], report_queue),
+            daemon=True,
+        )
+        for i in range(num_workers)
+    ]
+    for w in workers:
+        w.start()
+
+    dispatcher = RoomDispatcher(join_queues)
+    transport, _ = await loop.create_datagram_endpoint(lambda: dispatcher, local_addr=(host, port))
+    threading.Thread(target=read_reports, args=(report_queue, dispatcher, loop), daemon=True).start()
+    print(f"[ROOMS] Dispatcher listening on {(host, port)} with {num_workers} workers")
+
+    stopped = loop.create_future()
+    try:
+        loop.add_signal_handler(signal.SIGTERM, stopped.cancel)
+    except NotImplementedError:
+        pass  # Windows
+
+    try:
+        await stopped
+    except asyncio.CancelledError:
+        pass
+    finally:
+        transport.close()
+        for q in join_queues:
+            q.put(None)
+        for w in workers:
+            w.join(timeout=5)
+            if w.is_alive():
+                w.terminate()
+        report_queue.put(None)
+        print("[ROOMS] Stopped")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n[ROOMS] Shutting down...")
@@ -1,74 +1,9 @@
 #!/bin/bash
 
-SERVER_CMD="python -u server.py"
-CLIENT_CMD="python -u client.py"   # modify if your client file is different
-CLIENT_COUNT=4
-DURATION=30              # time to run each test in seconds
+# Every scenario (baseline, loss_2, loss_5, delay_100ms, jitter_10ms) x 5 runs,
+# each run on its own ports behind netem_proxy.py, as many at once as there
+# are cores; see run_matrix.py for the scenarios and options, e.g.
+#   ./run_all_tests.sh --scenarios loss_5 --runs 2 --jobs 2
 
-run_test() {
-    TEST_NAME=$1
-
-    echo "=============================="
-    echo " Running: $TEST_NAME"
-    echo "=============================="
-
-    mkdir -p results/$TEST_NAME
-
-    for i in {1..5}; do
-        echo ">>> Run $i for $TEST_NAME"
-
-        RUN_DIR="results/$TEST_NAME/run$i"
-        mkdir -p $RUN_DIR
-
-        # Cleanup old files
-        rm -f server*.csv client*.csv position_error_results.csv summary_metrics.csv *.png
-
-        # Start server
-        $SERVER_CMD > $RUN_DIR/server.log 2>&1 &
-        SERVER_PID=$!
-
-        sleep 1
-
-        # Start clients
-        for ((c=1; c<=CLIENT_COUNT; c++)); do
-            $CLIENT_CMD > $RUN_DIR/client$c.log 2>&1 &
-            CLIENT_PIDS[$c]=$!
-        done
-
-        sleep $DURATION
-
-        # Stop all processes
-        kill $SERVER_PID 2>/dev/null
-        for pid in "${CLIENT_PIDS[@]}"; do
-            kill $pid 2>/dev/null
-        done
-
-        sleep 2
-
-        echo "[INFO] Computing positional error..."
-        python compute_positional_error.py
-
-        echo "[INFO] Analyzing logs..."
-        python analyze_logs.py
-
-        # move all CSVs + plots
-        mv server*.csv client*.csv position_error_results.csv summary_metrics.csv *.png $RUN_DIR 2>/dev/null
-
-        echo "[✓] Finished run $i"
-        echo "-----------------------------------"
-    done
-
-}
-
-
-# # ========== BASELINE ==========
-run_test "baseline" 
-
-# ========== LOSS 2% ==========
-run_test "loss_2"
-
-# # ========== LOSS 5% ==========
-run_test "loss_5" 
-
-# # ========== DELAY 100ms ==========
-run_test "delay_100ms" 
+cd "$(dirname "$0")" || exit 1
+exec python -u run_matrix.py "$@"
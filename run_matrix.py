@@ -0,0 +1,228 @@
+"""
+GridClash test matrix runner.
+
+Runs every scenario x run combination of the automated test, many at once.
+Each run gets
+- its own ports: server on base_port + 2 * n, netem_proxy.py on the next one
+  (passed through GRIDCLASH_SERVER_IP / GRIDCLASH_SERVER_PORT)
+- its own output directory results/<scenario>/run<i>/, used as the working
+  directory of all its processes, so the CSV / .bin files never collide
+- its own process group (POSIX), stopped as a whole at the end of the run
+
+At most --jobs runs are in flight (default: the number of cores). Once every
+run is done compute_positional_error.py and analyze_logs.py are run in each
+run directory, again --jobs at a time.
+
+Run with: python run_matrix.py [--scenarios baseline loss_5] [--runs 5] [--jobs 4]
+(run_all_tests.sh calls this)
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PYTHON = sys.executable
+
+TEST_HOST = "127.0.0.1"
+BASE_PORT = 6000
+CLIENT_COUNT = 4
+DURATION = 30            # seconds each run is left running
+RUNS = 5
+RESULTS_DIR = "results"
+START_DELAY = 1.0        # seconds between starting server + proxy and the clients
+STOP_TIMEOUT = 5.0       # seconds after SIGTERM before the run's processes are killed
+
+# scenario -> netem_proxy.py options
+SCENARIOS = {
+    "baseline": [],
+    "loss_2": ["--loss", "0.02"],
+    "loss_5": ["--loss", "0.05"],
+    "delay_100ms": ["--delay", "100"],
+    "jitter_10ms": ["--jitter", "10", "--jitter-dist", "normal"],
+}
+
+ANALYZERS = ["compute_positional_error.py", "analyze_logs.py"]    # in this order, per run
+
+RUN_OUTPUTS = (".csv", ".bin", ".png", ".log")
+
+
+def script(name):
+    return os.path.join(HERE, name)
+
+
+def join_group(pgid):
+    """
+    preexec_fn of a run's processes: join the run's process group (0 = start
+    it), or a group of its own if the leader is already gone.
+    """
+    try:
+        os.setpgid(0, pgid)
+    except OSError:
+        os.setpgid(0, 0)
+
+
+class MatrixRun:
+    """
+    One scenario run: server, proxy and clients in one process group.
+    """
+
+    def __init__(self, scenario, index, run_dir, server_port, proxy_port, client_script="client.py"):
+        self.scenario = scenario
+        self.index = index
+        self.run_dir = run_dir
+        self.server_port = server_port
+        self.proxy_port = proxy_port
+        self.client_script = client_script
+        self.procs = []
+        self.pgid = None
+
+    @property
+    def name(self):
+        return f"{self.scenario}/run{self.index}"
+
+    def clean(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        for entry in os.listdir(self.run_dir):
+            if entry.endswith(RUN_OUTPUTS):
+                os.remove(os.path.join(self.run_dir, entry))
+
+    async def spawn(self, args, log_name, port):
+        env = dict(os.environ, GRIDCLASH_SERVER_IP=TEST_HOST, GRIDCLASH_SERVER_PORT=str(port))
+        kwargs = {}
+        if os.name == "posix":
+            pgid = self.pgid or 0    # 0: the first process leads the run's group
+            kwargs["preexec_fn"] = lambda: join_group(pgid)
+
+        with open(os.path.join(self.run_dir, log_name), "wb") as log:
+            proc = await asyncio.create_subprocess_exec(
+                PYTHON, "-u", *args, cwd=self.run_dir, env=env,
+                stdout=log, stderr=asyncio.subprocess.STDOUT, **kwargs
+            )
+        if self.pgid is None and os.name == "posix":
+            self.pgid = proc.pid
+        self.procs.append(proc)
+        return proc
+
+    async def execute(self, proxy_args, client_count, duration):
+        self.clean()
+        await self.spawn([script("server.py")], "server.log", self.server_port)
+        await self.spawn(
+            [script("netem_proxy.py"),
+             "--listen", f"{TEST_HOST}:{self.proxy_port}",
+             "--server", f"{TEST_HOST}:{self.server_port}",
+             "--seed", str(self.index), *proxy_args],
+            "proxy.log", self.server_port,
+        )
+        await asyncio.sleep(START_DELAY)
+
+        for c in range(1, client_count + 1):
+            await self.spawn([script(self.client_script)], f"client{c}.log", self.proxy_port)
+
+        await asyncio.sleep(duration)
+        await self.stop()
+
+    async def stop(self):
+        self.signal(signal.SIGTERM)
+        waits = [proc.wait() for proc in self.procs]
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout=STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"[MATRIX] {self.name}: processes still running after SIGTERM, killing them")
+            self.signal(getattr(signal, "SIGKILL", signal.SIGTERM))
+            await asyncio.gather(*[proc.wait() for proc in self.procs])
+
+    def signal(self, sig):
+        if self.pgid is not None:
+            try:
+                os.killpg(self.pgid, sig)
+            except ProcessLookupError:
+                pass
+            return
+
+        for proc in self.procs:
+            if proc.returncode is None:
+                try:
+                    proc.send_signal(sig)
+                except ProcessLookupError:
+                    pass
+
+
+async def run_one(run, proxy_args, client_count, duration, slots):
+    async with slots:
+        print(f"[MATRIX] Start {run.name} (server :{run.server_port}, proxy :{run.proxy_port})")
+        try:
+            await run.execute(proxy_args, client_count, duration)
+        except asyncio.CancelledError:
+            await run.stop()
+            raise
+        print(f"[MATRIX] Done  {run.name}")
+
+
+async def analyze_one(run, slots):
+    async with slots:
+        for name in ANALYZERS:
+            with open(os.path.join(run.run_dir, "analyze.log"), "ab") as log:
+                proc = await asyncio.create_subprocess_exec(
+                    PYTHON, script(name), cwd=run.run_dir,
+                    stdout=log, stderr=asyncio.subprocess.STDOUT,
+                )
+            if await proc.wait() != 0:
+                print(f"[MATRIX] {run.name}: {name} failed, see {run.run_dir}/analyze.log")
+                return False
+        return True
+
+
+async def run_matrix(scenarios, runs, client_count, duration, jobs, base_port, results_dir,
+                     client_script="client.py", analyze=True):
+    slots = asyncio.Semaphore(jobs)
+    matrix = []
+    port = base_port
+    for scenario in scenarios:
+        for i in range(1, runs + 1):
+            run_dir = os.path.abspath(os.path.join(results_dir, scenario, f"run{i}"))
+            matrix.append(MatrixRun(scenario, i, run_dir, port, port + 1, client_script))
+            port += 2
+
+    started = time.monotonic()
+    print(f"[MATRIX] {len(matrix)} runs, {jobs} at a time, ~{duration:.0f} s each")
+    await asyncio.gather(*[
+        run_one(run, SCENARIOS[run.scenario], client_count, duration, slots) for run in matrix
+    ])
+    print(f"[MATRIX] All runs finished in {time.monotonic() - started:.1f} s")
+
+    if not analyze:
+        return
+
+    print("[MATRIX] Analyzing ...")
+    results = await asyncio.gather(*[analyze_one(run, slots) for run in matrix])
+    print(f"[MATRIX] Analyzed {sum(results)}/{len(results)} runs, results in {os.path.abspath(results_dir)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GridClash parallel test matrix")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=RUNS, help="runs per scenario")
+    parser.add_argument("--clients", type=int, default=CLIENT_COUNT)
+    parser.add_argument("--client-script", default="client.py", help="client program (relative to this folder)")
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds per run")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="runs at once (default: cores)")
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--results", default=RESULTS_DIR)
+    parser.add_argument("--no-analyze", action="store_true", help="skip the analyzers")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_matrix(
+            args.scenarios, args.runs, args.clients, args.duration, max(1, args.jobs),
+            args.base_port, args.results, args.client_script, analyze=not args.no_analyze,
+        ))
+    except KeyboardInterrupt:
+        print("\n[MATRIX] Interrupted")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,511 +1,1388 @@
-import threading
-import time
-import socket
-import struct
-import csv
+"""
+GridClash Server
+
+GameServer runs the whole server on a single asyncio event loop:
+- datagrams are dispatched from datagram_received()
+- the snapshot tick, reliable retransmissions and heartbeat expiry
+  run as tasks on the same loop
+
+Everything touches the game state from one thread, so no locks are needed.
+
+Start it from code:
+
+    server = GameServer("127.0.0.1", 5005)
+    await server.start()
+    ...
+    server.close()
+
+or run this module directly (python server.py).
+"""
+
+import asyncio
+import heapq
+import ipaddress
+import itertools
 import os
+import signal
+import socket
+import time
+import traceback
+from collections import Counter
 import psutil
-from threading import Lock
-
 
+from timer_wheel import ReliableSender
+from background_logger import BackgroundLogger, CsvSink
+from recording import RecordingSink
+from journal import JournalSink
+from snapshot_codec import encode_smallest
+from grid_tiles import TileLayout
+from grid_state import GridState
+from tick_scheduler import TickScheduler, TickPolicy
+from server_stats import StatsRegistry, percentiles
+from sessions import Session, SessionTable
+from egress import EgressScheduler
 
 from protocol import (
-    HEADER_FORMAT, HEADER_SIZE, MsgType,
-    PROTOCOL_ID, VERSION,
-    JOIN_ACK_FORMAT, JOIN_ACK_SIZE,
-    GRID_SIZE,
-    SNAPSHOT_SIZE , 
-    REDUNDANT_SNAPHOT_SIZE,
-    EventType, EVENT_FORMAT, EVENT_SIZE,
-    PLAYER_COLOR_FORMAT, PLAYER_COLOR_ACK_FORMAT, PLAYER_COLOR_ACK_SIZE ,
-    GAME_OVER_ACK_FORMAT,GAME_OVER_ACK_SIZE
+    MsgType, PROTOCOL_ID, VERSION, HEADER_MSG_TYPE_OFFSET,
+    GRID_SIZE, TILE_SIZE,
+    SnapshotKind, SnapshotCodec, ALL_CODECS_MASK,
+    EVENT_ACK_BITS, EVENT_SEQ_MOD, NO_EVENTS_ACKED, event_acked,
+    MAX_GAME_OVER_SCORES,
+    NO_MULTICAST_GROUP,
+    PacketBuffer, pack_message, build_snapshot_chunk,
+    unpack_header, unpack_payload, unpack_event_batch,
+    pack_stats,
 )
 
 
 SERVER_CSV = "server_metrics.csv"
+POSITIONS_FILE = "server_positions.bin"   # binary recording, see recording.py
+POSITIONS_RECORD_INTERVAL = 1   # record the grid every N ticks (raise for huge boards)
+# journal of every accepted inbound datagram for replay_journal.py, see journal.py
+JOURNAL_FILE = os.environ.get("GRIDCLASH_JOURNAL")    # e.g. "server_journal.bin", None = off
 
-if not os.path.exists(SERVER_CSV):
-    with open(SERVER_CSV, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "cpu_percent" ,  "player_id", "sent_kbps", "recv_kbps"])
-
-event_lock = Lock()
-grid_lock = Lock()
+LOG_RING_CAPACITY = 8192     # records buffered before we start dropping
+# ... and bytes: a positions record is a copy of the grid (2 MB on a 1024x1024 board)
+LOG_RING_MAX_BYTES = 64 * 1024 * 1024
+LOG_FLUSH_INTERVAL = 0.5     # seconds between background batch writes
 
 PLAYER_COLORS = [
-    (255,0,0),    
-    (0,255,0),    
-    (0,0,255),    
-    (255,255,0),  
-    (255,0,255),  
-    (0,255,255),  
+    (255,0,0),
+    (0,255,0),
+    (0,0,255),
+    (255,255,0),
+    (255,0,255),
+    (0,255,255),
 ]
 
-player_color_map = {}
-
 COLOR_TIMEOUT_MS = 500  # retransmit after 0.5s if no ACK
-
-# key = (client_addr, player_id)
-# value = { "packet": bytes, "last_send": int(ms) }
-pending_color = {}
-
-# Bandwidth tracking
-bytes_sent_per_player = {}        
-bytes_recv_per_player = {}    
-last_bw_time = int(time.time())
-
-connected_players_last_seq = {}
-
-
-pending_game_over = {}
 GAME_OVER_TIMEOUT_MS = 500
+MAX_RELIABLE_RETRIES = 20  # give up on a client after ~10s without ACK
+RETRANSMIT_TICK_MS = 10    # timer wheel resolution
 
-def assign_color(player_id):
-    return PLAYER_COLORS[player_id % len(PLAYER_COLORS)]
-
-
-def send_player_color_reliable(target_addr, player_id, rgb_tuple):
-    """
-    Send PLAYER_COLOR to one client and remember it for retransmission
-    until we get PLAYER_COLOR_ACK.
-    """
-    r, g, b = rgb_tuple
-    payload = struct.pack(PLAYER_COLOR_FORMAT, player_id, r, g, b)
-
-    now_ms = int(time.time() * 1000)
-    header = pack_header(
-        MsgType.PLAYER_COLOR,
-        0,                 # snapshot_id not used here
-        0,                 # seq_num not important for this simple rdt
-        now_ms,
-        len(payload)
-    )
-
-    packet = header + payload
-    server.sendto(packet, target_addr)
-
-    pending_color[(target_addr, player_id)] = {
-        "packet": packet,
-        "last_send": now_ms,
-    }
-
-
-# Server settings
-SERVER_IP = "192.168.1.3"
-SERVER_PORT = 5005
+# Server settings (overridable from the environment, see run_all_tests.sh)
+SERVER_IP = os.environ.get("GRIDCLASH_SERVER_IP", "192.168.1.3")
+SERVER_PORT = int(os.environ.get("GRIDCLASH_SERVER_PORT", 5005))
 ADDR = (SERVER_IP, SERVER_PORT)
+# board of main()'s server and of room_server.py rooms (clients get it in JOIN_ACK)
+SERVER_GRID_SIZE = int(os.environ.get("GRIDCLASH_GRID_SIZE", GRID_SIZE))
 
-# Create UDP socket
-server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server.bind(ADDR)
-
-print(f"[SERVER] Listening on {ADDR}")
-
-#initializing snapshot
-snapshot_id = 0
-seq_num = 0
-last_snapshot_bytes = None
-
-#intialze player_id
-next_player_id = 1
-addr_to_player = {}
-
-client_last_seen = {}
 HEARTBEAT_TIMEOUT = 3 # Seconds
-
-# Game state: 20x20 grid, each byte = cell owner (0 = unclaimed)
-grid = [0] * (GRID_SIZE * GRID_SIZE)
-
-connected_players = {}
-
-print(f"[SERVER] Running snapshot broadcaster on {ADDR}")
+HEARTBEAT_CHECK_INTERVAL = 1
 
 TICK_RATE = 20          # 20 Hz → every 50 ms
 TICK_INTERVAL = 1.0 / TICK_RATE
 
-def pack_header(msg_type, snapshot_id, seq_num, timestamp_ms, payload_len):
-    return struct.pack(
-        HEADER_FORMAT,
-        PROTOCOL_ID,
-        VERSION,
-        msg_type,
-        snapshot_id,
-        seq_num,
-        timestamp_ms,
-        payload_len
-    )
-
-
-def snapshot_sender():
-    global snapshot_id , last_snapshot_bytes
-    global last_bw_time, bytes_sent_per_player, bytes_recv_per_player
+# ticks run on absolute deadlines (see tick_scheduler.py); a late tick is
+# caught up back to back, with at most MAX_CATCH_UP_TICKS owed at once
+TICK_POLICY = TickPolicy.CATCH_UP
+MAX_CATCH_UP_TICKS = 3
+TICK_REPORT_INTERVAL = 1.0   # seconds between overrun warnings
+
+# STATS requests (stats_tool.py) are only answered from loopback addresses
+STATS_ALLOW_REMOTE = False
+
+# Delta snapshots: server remembers which tiles changed in each of the last
+# SNAPSHOT_HISTORY_SIZE ticks and sends each client only the tiles changed
+# since the snapshot it last acked.
+# Both are minimums: with a per-client egress cap, boards whose keyframe
+# takes longer than a few ticks to drain get a longer history and rarer
+# periodic keyframes (see keyframe_drain_ticks), otherwise the client's
+# baseline is forgotten before its ack arrives and it only gets keyframes.
+DELTA_SNAPSHOTS = True
+SNAPSHOT_HISTORY_SIZE = 32
+KEYFRAME_INTERVAL = 40   # full snapshot every 40 ticks (2s) as a fallback
+
+MAX_CHUNKS = 0xFFFF      # chunk_count is 2 bytes
+
+# Area of interest: once a client sends VIEWPORT it only gets the tiles
+# under its viewport (plus AOI_MARGIN_TILES around it, so panning a little
+# doesn't wait for a tile), and a coarse OVERVIEW of the whole board every
+# OVERVIEW_INTERVAL ticks. Clients that never send VIEWPORT get everything.
+AOI_MARGIN_TILES = 1
+OVERVIEW_INTERVAL = 20   # 1s
+
+# EVENT acks ride on the next SNAPSHOT; a standalone EVENT_ACK is only sent
+# if the next snapshot is further away than this (e.g. the tick is late)
+EVENT_ACK_MAX_DELAY_MS = 60
+
+# Snapshot codecs the server is willing to use; per client this is narrowed
+# to what the client announced in JOIN and the smallest encoding wins each tick.
+SERVER_CODECS_MASK = ALL_CODECS_MASK
+RAW_CODEC_MASK = 1 << SnapshotCodec.RAW
+
+# Multicast snapshots (LAN): with a group set, SNAPSHOTs go out once per tick
+# to the group for every client that joined it (MULTICAST message) instead of
+# once per client. Everything else stays unicast, and so do clients with a
+# viewport smaller than the board (their AOI is their own). A member whose
+# SNAPSHOT_ACKs fall more than MULTICAST_MAX_LAG ticks behind is put back on
+# unicast for good.
+MULTICAST_GROUP = os.environ.get("GRIDCLASH_MULTICAST_GROUP")   # e.g. "239.255.42.1", None = off
+MULTICAST_PORT = int(os.environ.get("GRIDCLASH_MULTICAST_PORT", 5007))
+MULTICAST_ADDR = (MULTICAST_GROUP, MULTICAST_PORT) if MULTICAST_GROUP else None
+MULTICAST_TTL = 1         # don't leave the LAN
+MULTICAST_MAX_LAG = 80    # ticks (4s), dead clients hit HEARTBEAT_TIMEOUT first
+
+# Egress pacing (see egress.py): each tick's snapshot chunks are spread over
+# the first EGRESS_SPREAD of the tick instead of going out back to back, within
+# a token bucket per client and one for the whole server; control messages
+# (colors, acks, GAME_OVER, retransmissions) go ahead of queued snapshots.
+# A client whose previous snapshot is still queued skips a tick, its next
+# delta covers both.
+EGRESS_PACING = True
+EGRESS_SPREAD = 0.25          # fraction of TICK_INTERVAL, the last client waits this long
+EGRESS_SLOT_MS = 2            # pacing step
+EGRESS_CLIENT_KBPS = 8000     # per client, None = no cap
+EGRESS_TOTAL_KBPS = 200000    # whole server, None = no cap
+EGRESS_BURST_MS = 10          # how much unused rate a bucket saves up
 
-    print("[SERVER] Snapshot thread started ...")
 
-    while True :
-        now_ms = int(time.time() * 1000)
-
-        current_payload = bytes(grid)
+def assign_color(player_id):
+    return PLAYER_COLORS[player_id % len(PLAYER_COLORS)]
 
-        if last_snapshot_bytes is None:
-            combined_payload = current_payload + current_payload
-        else:
-            combined_payload = current_payload + last_snapshot_bytes
-        last_snapshot_bytes = current_payload
 
+def kbps_to_bytes(kbps):
+    return None if kbps is None else kbps * 1000 / 8
 
 
-        header = pack_header(
-            MsgType.SNAPSHOT,
-            snapshot_id,
-            snapshot_id,
-            now_ms,
-            len(combined_payload)
+def keyframe_drain_ticks(grid_size, client_kbps):
+    """
+    Whole ticks a keyframe of the board (RAW, the biggest encoding) takes
+    to go out at client_kbps; 0 without a cap.
+    """
+    if client_kbps is None:
+        return 0
+    return int(grid_size * grid_size * 2 / kbps_to_bytes(client_kbps) * TICK_RATE)
+
+
+class GameServer(asyncio.DatagramProtocol):
+
+    # numbers the servers of a process, so ones sharing a logger never share
+    # a sink name (a room that is reopened gets fresh sinks)
+    _instances = itertools.count(1)
+
+    def __init__(self, host=SERVER_IP, port=SERVER_PORT, grid_size=GRID_SIZE, tile_size=TILE_SIZE,
+                 room_id=0, logger=None, metrics_file=SERVER_CSV, positions_file=POSITIONS_FILE,
+                 journal_file=JOURNAL_FILE, multicast_addr=MULTICAST_ADDR, pacing=EGRESS_PACING,
+                 on_player_left=None, on_game_over=None):
+        """
+        room_id is echoed in JOIN_ACK (see room_server.py).
+        logger: share one BackgroundLogger between several servers (the
+        caller starts and closes it); by default the server has its own.
+        on_player_left(client_addr) is called when a session is dropped,
+        on_game_over() once the board is full and GAME_OVER went out.
+        metrics_file / positions_file / journal_file = None turns that log off.
+        multicast_addr: (group, port) to publish SNAPSHOTs to, None = unicast only.
+        pacing = False sends everything straight away (see EGRESS_PACING).
+        """
+        self.address = (host, port)
+        self.transport = None
+        # send-and-forget packets are packed here (the loop is single-threaded)
+        self.out = PacketBuffer()
+        self._tasks = []
+        self._closed = None
+        self._reliable_wakeup = None
+        self._egress_wakeup = None
+        self.ticks = TickScheduler(TICK_INTERVAL, TICK_POLICY, MAX_CATCH_UP_TICKS)
+        self.next_snapshot_at = 0.0     # time.monotonic()
+        self.tick_errors = 0
+
+        self.room_id = room_id
+        self.on_player_left = on_player_left
+        self.on_game_over = on_game_over
+        self.last_activity = time.time()
+        self.started_at = time.time()
+
+        # live counters for STATS; the loop thread writes self.counters
+        self.stats = StatsRegistry()
+        self.counters = self.stats.counters()
+
+        self.grid_size = grid_size
+        self.layout = TileLayout(grid_size, tile_size)
+        if self.layout.tile_count > MAX_CHUNKS:
+            raise ValueError(f"grid_size {grid_size} needs {self.layout.tile_count} tiles, "
+                             f"more than {MAX_CHUNKS}: use a bigger tile_size")
+
+        # Game state: grid_size x grid_size, each cell = 16-bit owner (0 = unclaimed),
+        # plus free-cell / per-player score counters
+        self.state = GridState(grid_size)
+
+        #initializing snapshot
+        self.snapshot_id = 0
+
+        # tiles changed since the last snapshot went out
+        self.dirty_tiles = set()
+
+        # (player_id, cell_index) claims accepted since the last tick, applied
+        # in one batch at the start of the next one (apply_events)
+        self.event_inbox = []
+        self.events_applied = 0
+        self.max_event_batch = 0
+
+        # key = snapshot_id, value = set of tiles changed in that tick
+        self.tile_changes = {}
+        drain = keyframe_drain_ticks(grid_size, EGRESS_CLIENT_KBPS) if pacing else 0
+        self.history_size = SNAPSHOT_HISTORY_SIZE + 2 * drain
+        self.keyframe_interval = max(KEYFRAME_INTERVAL, 4 * drain)
+
+        # key = tile_index, value = snapshot_id of its last change
+        self.tile_version = [0] * self.layout.tile_count
+
+        # key = (tile_index, codecs mask), value = (tile_version, codec, body)
+        self.tile_cache = {}
+
+        # coarse overview grid, one cell per tile
+        self.overview_layout = TileLayout(self.layout.tiles_per_side, tile_size)
+
+        # key = tile_index, value = (tile_version, most common owner)
+        self.overview_cache = {}
+
+        #intialze player_id
+        self.next_player_id = 1
+        # everything per client, by address and player_id (see sessions.py)
+        self.sessions = SessionTable()
+        # key = player_id, value = rgb; outlives the session, the player's
+        # cells stay on the board after it leaves
+        self.player_color_map = {}
+
+        # all reliable messages (PLAYER_COLOR, GAME_OVER) share one timer wheel
+        # key = (MsgType.PLAYER_COLOR, client_addr, player_id)
+        #     | (MsgType.GAME_OVER, player_id)
+        self.reliable = ReliableSender(
+            self.sendto,
+            max_retries=MAX_RELIABLE_RETRIES,
+            tick_ms=RETRANSMIT_TICK_MS,
+            on_give_up=self.on_reliable_give_up,
         )
+        self.game_over_sent = False
+
+        # Bandwidth tracking (per session, reset every second)
+        self.last_bw_time = int(time.time())
+
+        # metrics + positions are written by a background thread
+        self.owns_logger = logger is None
+        self.logger = BackgroundLogger(LOG_RING_CAPACITY, LOG_FLUSH_INTERVAL, LOG_RING_MAX_BYTES) if logger is None else logger
+        self.metrics_file = metrics_file
+        self.positions_file = positions_file
+        instance = next(GameServer._instances)
+        self.metrics_sink = f"metrics.{room_id}.{instance}"
+        self.positions_sink = f"positions.{room_id}.{instance}"
+        self.journal_file = journal_file
+        self.journal_sink = f"journal.{room_id}.{instance}"
+        self.journal_started = time.monotonic()
+
+        if multicast_addr is not None and not ipaddress.ip_address(multicast_addr[0]).is_multicast:
+            raise ValueError(f"{multicast_addr[0]} is not a multicast group")
+        self.multicast_addr = multicast_addr
+        self.multicast_packets = 0
+        self.multicast_bytes = 0
+        self.multicast_fallbacks = 0
+
+        # outgoing packets once start() runs the pacing task, see egress.py
+        self.egress = None
+        if pacing:
+            self.egress = EgressScheduler(
+                self.transmit, time.monotonic(),
+                rate=kbps_to_bytes(EGRESS_TOTAL_KBPS),
+                client_rate=kbps_to_bytes(EGRESS_CLIENT_KBPS),
+                burst_s=EGRESS_BURST_MS / 1000,
+                spread=EGRESS_SPREAD * TICK_INTERVAL,
+                slot=EGRESS_SLOT_MS / 1000,
+            )
+        self.snapshots_deferred = 0
+
+        self.handlers = {
+            MsgType.JOIN: self.handle_join,
+            MsgType.READY: self.handle_ready,
+            MsgType.EVENT: self.handle_event,
+            MsgType.HEARTBEAT: self.handle_heartbeat,
+            MsgType.SNAPSHOT_ACK: self.handle_snapshot_ack,
+            MsgType.VIEWPORT: self.handle_viewport,
+            MsgType.PLAYER_COLOR_ACK: self.handle_player_color_ack,
+            MsgType.GAME_OVER_ACK: self.handle_game_over_ack,
+            MsgType.STATS: self.handle_stats,
+            MsgType.MULTICAST: self.handle_multicast,
+        }
 
-        packet = header + combined_payload
+    # ---------------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------------
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+
+        if self.metrics_file is not None:
+            self.logger.add_sink(self.metrics_sink, CsvSink(
+                self.metrics_file,
+                header=["timestamp", "cpu_percent" ,  "player_id", "sent_kbps", "recv_kbps"],
+            ))
+        if self.positions_file is not None:
+            self.logger.add_sink(self.positions_sink, RecordingSink(self.positions_file, self.grid_size))
+        if self.journal_file is not None:
+            self.logger.add_sink(self.journal_sink, JournalSink(
+                self.journal_file, self.grid_size, self.layout.tile_size
+            ))
+            self.journal_started = time.monotonic()
+        if self.owns_logger:
+            self.logger.start()
+
+        self._reliable_wakeup = asyncio.Event()
+        if self.egress is not None:
+            self._egress_wakeup = asyncio.Event()
+
+        await loop.create_datagram_endpoint(lambda: self, local_addr=self.address)
+        # port 0 → pick up the port the OS actually assigned
+        self.address = self.transport.get_extra_info("sockname")[:2]
+        print(f"[SERVER] Listening on {self.address}")
+        if self.multicast_addr is not None:
+            self.setup_multicast()
+
+        self._closed = loop.create_future()
+        self._tasks = [
+            loop.create_task(self.snapshot_loop()),
+            loop.create_task(self.retransmit_loop()),
+            loop.create_task(self.heartbeat_loop()),
+        ]
+        if self.egress is not None:
+            self._tasks.append(loop.create_task(self.egress_loop()))
+
+    async def serve_forever(self):
+        if self.transport is None:
+            await self.start()
+        await self._closed
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+        if self.transport is not None:
+            self.transport.close()
+
+        if self.owns_logger:
+            self.logger.close()
+        elif self._closed is not None and not self._closed.done():
+            if self.metrics_file is not None:
+                self.logger.remove_sink(self.metrics_sink)
+            if self.positions_file is not None:
+                self.logger.remove_sink(self.positions_sink)
+            if self.journal_file is not None:
+                self.logger.remove_sink(self.journal_sink)
+
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
+
+    def setup_multicast(self):
+        """
+        Publish group SNAPSHOTs from our own socket, on the interface we are
+        bound to. If the OS won't let us, run unicast only.
+        """
+        sock = self.transport.get_extra_info("socket")
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+            # clients on this machine get the group too
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            if self.address[0] not in ("", "0.0.0.0"):
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.address[0]))
+        except OSError as e:
+            print(f"[SERVER] Can't send to multicast group {self.multicast_addr}: {e} -> unicast only")
+            self.multicast_addr = None
+            return
+        print(f"[SERVER] Publishing SNAPSHOTs to multicast group {self.multicast_addr}")
+
+    def sendto(self, packet, addr):
+        """
+        Control messages: ahead of any queued snapshot.
+        """
+        if self._egress_wakeup is None:
+            self.transmit(packet, addr)
+        elif self.egress.send_control(packet, addr, time.monotonic()):
+            self._egress_wakeup.set()
+
+    def send_snapshot(self, packet, addr):
+        if self._egress_wakeup is None:
+            self.transmit(packet, addr)
+        else:
+            self.egress.queue_snapshot(packet, addr, time.monotonic())
+
+    def transmit(self, packet, addr):
+        session = self.sessions.get(addr)
+        pid = session.player_id if session is not None else 0
+        self.counters.packet_out(packet[HEADER_MSG_TYPE_OFFSET], pid, len(packet))
+        self.transport.sendto(packet, addr)
+
+    # ---------------------------------------------------------
+    # asyncio.DatagramProtocol callbacks
+    # ---------------------------------------------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def error_received(self, exc):
+        # e.g. ConnectionResetError on Windows when a client went away
+        pass
+
+    def datagram_received(self, data, client_addr):
+        self.last_activity = time.time()
+
+        session = self.sessions.get(client_addr)
+        pid = 0
+        if session is not None:
+            pid = session.player_id
+            session.bytes_recv += len(data)
+            self.sessions.touch(session, time.monotonic())
+
+        header = unpack_header(data)
+        if header is None:
+            self.counters.drop("short_packet")
+            print(f"[WARN] Short packet from {client_addr}, ignoring")
+            return
 
-        for pid , player_addr in connected_players.items():
-            server.sendto(packet , player_addr)
-            bytes_sent_per_player[pid] = bytes_sent_per_player.get(pid, 0) + len(packet)
+        prot_id, ver, msg_type_val, recv_snapshot_id, recv_seq_num, ts, payload_len = header
+        self.counters.packet_in(msg_type_val, pid, len(data))
 
-        snapshot_id += 1
+        if prot_id != PROTOCOL_ID or ver != VERSION:
+            self.counters.drop("bad_version")
+            print(f"[WARN] Invalid protocol/version from {client_addr}")
+            return
+
+        try:
+            msg_type = MsgType(msg_type_val)
+        except ValueError:
+            self.counters.drop("unknown_msg_type")
+            print(f"[WARN] Unknown msg_type {msg_type_val} from {client_addr}")
+            return
+
+        if self.journal_file is not None and msg_type != MsgType.STATS:
+            arrival_us = int((time.monotonic() - self.journal_started) * 1_000_000)
+            self.logger.log(self.journal_sink, (arrival_us, client_addr, data), len(data))
+
+        handler = self.handlers.get(msg_type)
+        if handler is not None:
+            handler(data, client_addr, session)
+
+    # ---------------------------------------------------------
+    # Message handlers
+    # ---------------------------------------------------------
+
+    def handle_join(self, data, client_addr, session):
+        # clients that don't announce codecs only get RAW
+        # (room_id was already used by the room dispatcher, if any)
+        client_codecs = RAW_CODEC_MASK
+        join = unpack_payload(MsgType.JOIN, data)
+        if join is not None:
+            client_codecs, _room_id = join
+        codecs = (client_codecs & SERVER_CODECS_MASK) | RAW_CODEC_MASK
+
+        if session is None:
+            session = Session(self.next_player_id, client_addr, codecs, time.monotonic())
+            self.next_player_id += 1
+            self.sessions.add(session)
+        else:
+            session.codecs = codecs
+        player_id = session.player_id
 
-        now_sec = int(time.time())
+        print(f"[SERVER] JOIN from {client_addr} -> assigned player_id {player_id}")
 
-        if now_sec > last_bw_time:
-            cpu = psutil.cpu_percent(interval=None)
+        color_r, color_g, color_b = assign_color(player_id)
 
-            with open(SERVER_CSV, "a" , newline="") as f:
-                writer = csv.writer(f)
+        self.player_color_map[player_id] = (color_r, color_g, color_b)
 
-                for pid in connected_players.keys():
-                    sent_bps = bytes_sent_per_player.get(pid , 0) * 8
-                    recv_bps = bytes_recv_per_player.get(pid , 0) * 8
 
-                    sent_kbps = sent_bps / 1000
-                    recv_kbps = recv_bps / 1000
+        timestamp_ms = int(time.time() * 1000)
+        seq_out = 1  # simple for now — later we'll track it
 
-                    writer.writerow([
-                        now_ms,
-                        cpu,
-                        pid,
-                        sent_kbps,
-                        recv_kbps
-                    ])
-        bytes_sent_per_player = {}
-        bytes_recv_per_player = {}
-        last_bw_time = now_sec
-        
-        with open("server_positions.csv", "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                snapshot_id,
-                now_ms
-            ] + list(grid))
-            
-
-        time.sleep(TICK_INTERVAL)
-
-def color_retransmit_worker():
-    while True:
-        now_ms = int(time.time() * 1000)
-        # copy keys list to avoid RuntimeError while modifying dict
-        for key in list(pending_color.keys()):
-            state = pending_color.get(key)
-            if not state:
-                continue
+        if self.multicast_addr is not None:
+            group, group_port = socket.inet_aton(self.multicast_addr[0]), self.multicast_addr[1]
+        else:
+            group, group_port = NO_MULTICAST_GROUP, 0
+
+        packet = self.out.message(
+            MsgType.JOIN_ACK,
+            player_id, self.grid_size, TICK_RATE,
+            color_r, color_g, color_b,
+            codecs, self.layout.tile_size,
+            self.room_id,
+            group, group_port,
+            seq_num=seq_out,
+            timestamp_ms=timestamp_ms,
+        )
 
-            if now_ms - state["last_send"] >= COLOR_TIMEOUT_MS:
-                # timeout: resend packet
-                packet = state["packet"]
-                target_addr, _pid = key
-                server.sendto(packet, target_addr)
-                state["last_send"] = now_ms
-        time.sleep(0.05)  # 50ms granularity is enough
-
-# start worker
-threading.Thread(target=color_retransmit_worker, daemon=True).start()
-
-
-def send_game_over():
-    print("[SERVER] Computing winner...")
-
-    scores = {}
-    for cell in grid:
-        if cell != 0:
-            scores[cell] = scores.get(cell, 0) + 1
-
-    winner_id = max(scores, key=scores.get)
-    num_players = len(scores)
-
-    payload = struct.pack("!HB", winner_id, num_players)
-    for pid, score in scores.items():
-        payload += struct.pack("!HH", pid, score)
-
-    timestamp_ms = int(time.time() * 1000)
-    header = pack_header(
-        MsgType.GAME_OVER,
-        0,
-        0,
-        timestamp_ms,
-        len(payload)
-    )
-
-    packet = header + payload
-
-    # Send once immediately + register for RDT
-    for pid, addr in connected_players.items():
-        server.sendto(packet, addr)
-        pending_game_over[pid] = {
-            "packet": packet,
-            "addr": addr,
-            "last_send": timestamp_ms
-        }
+        self.sendto(packet, client_addr)
+        print(f"[SERVER] Sent JOIN_ACK to {client_addr}")
 
-    print("[SERVER] GAME_OVER SENT")
 
-def game_over_retransmit_worker():
-    while True:
-        now_ms = int(time.time() * 1000)
-
-        for pid in list(pending_game_over.keys()):
-            entry = pending_game_over.get(pid)
-            if not entry:
+        # 1) Tell the new player about existing players' colors
+        for existing in self.sessions.live:
+            if existing is session:
                 continue
 
-            if now_ms - entry["last_send"] >= GAME_OVER_TIMEOUT_MS:
-                server.sendto(entry["packet"], entry["addr"])
-                entry["last_send"] = now_ms
-
-        time.sleep(0.05)
-
-threading.Thread(target=game_over_retransmit_worker, daemon=True).start()
+            cr, cg, cb = assign_color(existing.player_id)
+            self.send_player_color_reliable(session, existing.player_id, (cr, cg, cb))
 
+        # 2) Tell everyone about the new player's color
+        for existing in self.sessions.live:
+            self.send_player_color_reliable(existing, player_id, (color_r, color_g, color_b))
 
+    def handle_ready(self, data, client_addr, session):
+        if session is None:
+            self.counters.drop("unknown_client")
+            print("[SERVER] READY from unknown client, ignoring", client_addr)
+            return
 
-snapshot_thread = threading.Thread(target=snapshot_sender , daemon=True)
-snapshot_thread.start()
+        # add to snapshot list
+        self.sessions.connect(session)
+        # (re)joining client has no baseline yet -> start from a keyframe
+        session.acked_snapshot = None
+        session.aoi_pending = None
+        print("[SERVER] Player added to snapshot list with id:", session.player_id)
 
-def heartbeat_monitor():
-    global HEARTBEAT_TIMEOUT , connected_players
-    while True:
-        now = time.time()
-        dead = []
-
-        for addr, last in list(client_last_seen.items()):
-            if now - last > HEARTBEAT_TIMEOUT:
-                dead.append(addr)
-
-        for d in dead:
-            print(f"[SERVER] Client {d} disconnected (heartbeat timeout)")
-            del client_last_seen[d]
-            connected_players.pop(d , None)
-
-        time.sleep(1)
+        #send ALL known player colors to this client
+        now_ms = int(time.time() * 1000)
+        for pid, (r, g, b) in self.player_color_map.items():
+            packet = self.out.message(MsgType.PLAYER_COLOR, pid, r, g, b, timestamp_ms=now_ms)
+            self.sendto(packet, client_addr)
+
+    def handle_event(self, data, client_addr, session):
+        batch = unpack_event_batch(data)
+        if batch is None:
+            self.counters.drop("short_payload")
+            print("[SERVER] Truncated EVENT batch, ignoring")
+            return
+
+        player_id, events = batch
+
+        mapped_pid = session.player_id if session is not None else None
+        if mapped_pid != player_id:
+            self.counters.drop("player_mismatch")
+            print(f"[WARN] EVENT from {client_addr} with mismatched player_id {player_id} (mapped {mapped_pid}) -> ignoring")
+            return
+
+        # seq_num = the client's oldest pending event, it gave up on or got
+        # acks for everything before it
+        self.skip_events_before(session, unpack_header(data)[4] % EVENT_SEQ_MOD)
+
+        # oldest first, so claims happen in the order the player clicked
+        for seq, event_type, cell_index, event_ts in events:
+            self.accept_event(session, seq, cell_index)
+
+        # one ack for the whole batch (also when it was all duplicates,
+        # our last ack probably got lost)
+        self.ack_events(session)
+
+    def skip_events_before(self, session, oldest_pending):
+        """
+        Move the ack window up to oldest_pending, so an event the client
+        gave up on doesn't hold it back forever. Older / reordered batches
+        (oldest_pending at or before the window) change nothing.
+        """
+        last_seq = session.last_seq
+        skip = (oldest_pending - 1 - last_seq) % EVENT_SEQ_MOD
+        if skip == 0 or skip >= EVENT_SEQ_MOD // 2:
+            return
+
+        ack_bits = session.ack_bits
+        arrived = bin(ack_bits & ((1 << skip) - 1)).count("1")
+        if skip > arrived:
+            self.counters.drop("event_given_up", skip - arrived)
+
+        ack_bits >>= skip
+        last_seq = (last_seq + skip) % EVENT_SEQ_MOD
+        while ack_bits & 1:
+            ack_bits >>= 1
+            last_seq = (last_seq + 1) % EVENT_SEQ_MOD
+        session.last_seq = last_seq
+        session.ack_bits = ack_bits
+
+    def accept_event(self, session, seq, cell_index):
+        """
+        Ack bookkeeping for one event and queue its claim for the next tick,
+        unless it is a duplicate.
+        """
+        last_seq = session.last_seq
+        ack_bits = session.ack_bits
+        if event_acked(seq, last_seq, ack_bits):
+            self.counters.drop("duplicate_event")
+            return
+
+        offset = (seq - last_seq) % EVENT_SEQ_MOD
+        if offset > EVENT_ACK_BITS:
+            # too far ahead to ack selectively, the client will retransmit
+            self.counters.drop("event_out_of_window")
+            return
+
+        # mark it received, then slide last_seq over everything contiguous
+        ack_bits |= 1 << (offset - 1)
+        while ack_bits & 1:
+            ack_bits >>= 1
+            last_seq = (last_seq + 1) % EVENT_SEQ_MOD
+        session.last_seq = last_seq
+        session.ack_bits = ack_bits
+
+        if 0 <= cell_index < len(self.state):
+            self.event_inbox.append((session.player_id, cell_index))
+        else:
+            # invalid cell index, still acked to stop the client's retransmit
+            self.counters.drop("invalid_cell")
+            print("[SERVER] Invalid cell_index in event:", cell_index)
+
+    def apply_events(self):
+        """
+        Apply every claim queued since the last tick, in arrival order.
+        Only the tick calls this, so a snapshot always sees whole batches.
+        Returns the number of claims applied.
+        """
+        inbox = self.event_inbox
+        if not inbox:
+            return 0
+        self.event_inbox = []
+
+        claim = self.state.claim
+        tile_of = self.layout.tile_of
+        tile_version = self.tile_version
+        dirty_tiles = self.dirty_tiles
+        snapshot_id = self.snapshot_id
+
+        taken = 0
+        for player_id, cell_index in inbox:
+            if claim(cell_index, player_id):
+                tile = tile_of(cell_index)
+                tile_version[tile] = snapshot_id
+                dirty_tiles.add(tile)
+            else:
+                taken += 1
+
+        if taken:
+            self.counters.drop("cell_taken", taken)
+        self.events_applied += len(inbox)
+        self.max_event_batch = max(self.max_event_batch, len(inbox))
+
+        if self.state.is_full() and not self.game_over_sent:
+            self.send_game_over()
+        return len(inbox)
+
+    def handle_heartbeat(self, data, client_addr, session):
+        # datagram_received already marked the session as seen
+        pass
+
+    def handle_snapshot_ack(self, data, client_addr, session):
+        ack = unpack_payload(MsgType.SNAPSHOT_ACK, data)
+        if ack is None:
+            self.counters.drop("short_payload")
+            return
+
+        ack_snapshot_id, = ack
+
+        if session is None:
+            return
+
+        # acks can arrive out of order, only move the baseline forward
+        if session.acked_snapshot is None or ack_snapshot_id > session.acked_snapshot:
+            session.acked_snapshot = ack_snapshot_id
+
+    def handle_viewport(self, data, client_addr, session):
+        rect = unpack_payload(MsgType.VIEWPORT, data)
+        if rect is None:
+            self.counters.drop("short_payload")
+            return
+
+        if session is None:
+            return
+
+        # clients resend their viewport with every heartbeat
+        old = session.aoi
+        if old is not None and old[0] == rect:
+            return
+
+        row0, col0, rows, cols = rect
+        margin = AOI_MARGIN_TILES * self.layout.tile_size
+        tiles = tuple(self.layout.tiles_in_rect(
+            row0 - margin, col0 - margin,
+            row0 + rows + margin, col0 + cols + margin,
+        ))
+        # a viewport that covers the whole board is the same as none
+        # (and lets the client stay on multicast)
+        session.aoi = None if len(tiles) == self.layout.tile_count else (rect, tiles)
+
+        # tiles the client hasn't been kept up to date on: send them with
+        # every delta until it acks a snapshot that contains them
+        # (no viewport yet means it was getting the whole board)
+        entered = set(tiles) - set(old[1]) if old is not None else set()
+        if entered:
+            pending = session.aoi_pending[1] if session.aoi_pending is not None else set()
+            session.aoi_pending = (self.snapshot_id, pending | entered)
+
+    def handle_multicast(self, data, client_addr, session):
+        request = unpack_payload(MsgType.MULTICAST, data)
+        if request is None:
+            self.counters.drop("short_payload")
+            return
+
+        if session is None:
+            return
+
+        receiving, = request
+        if not receiving:
+            # the client hears nothing from the group
+            if session.multicast is not None or not session.unicast_only:
+                print(f"[SERVER] Player {session.player_id} can't receive multicast -> unicast")
+                self.leave_multicast(session)
+            return
+
+        # clients repeat it with every heartbeat
+        if self.multicast_addr is None or session.unicast_only or session.multicast is not None:
+            return
+
+        session.multicast = self.snapshot_id
+        print(f"[SERVER] Player {session.player_id} gets SNAPSHOTs from multicast group {self.multicast_addr}")
+
+    def leave_multicast(self, session):
+        """
+        Back to unicast SNAPSHOTs, for good. Its acked snapshot is still a
+        valid baseline, the next unicast delta starts from there.
+        """
+        if session.multicast is not None:
+            self.multicast_fallbacks += 1
+        session.multicast = None
+        session.unicast_only = True
+
+    def handle_player_color_ack(self, data, client_addr, session):
+        # payload: player_id (2 bytes)
+        ack = unpack_payload(MsgType.PLAYER_COLOR_ACK, data)
+        if ack is None:
+            self.counters.drop("short_payload")
+            print("[SERVER] Short PLAYER_COLOR_ACK, ignoring")
+            return
+
+        ack_pid, = ack
+
+        # rdt3.0 "stop_timer" for this color
+        key = (MsgType.PLAYER_COLOR, client_addr, ack_pid)
+        if self.reliable.ack(key):
+            if session is not None:
+                session.reliable_keys.discard(key)
+            print(f"[SERVER] Got PLAYER_COLOR_ACK for player {ack_pid} from {client_addr}")
+
+    def handle_game_over_ack(self, data, client_addr, session):
+        ack = unpack_payload(MsgType.GAME_OVER_ACK, data)
+        if ack is None:
+            self.counters.drop("short_payload")
+            return
+
+        ack_pid, = ack
+
+        key = (MsgType.GAME_OVER, ack_pid)
+        if self.reliable.ack(key):
+            if session is not None:
+                session.reliable_keys.discard(key)
+            print(f"[SERVER] Got GAME_OVER_ACK from player {ack_pid}")
+
+    def handle_stats(self, data, client_addr, session):
+        if not STATS_ALLOW_REMOTE and not ipaddress.ip_address(client_addr[0]).is_loopback:
+            self.counters.drop("stats_denied")
+            return
+
+        seq_num = unpack_header(data)[4]
+        packet = pack_stats(self.collect_stats(), seq_num, int(time.time() * 1000))
+        if packet is None:
+            # too many players to list per client in one datagram
+            packet = pack_stats(self.collect_stats(per_client=False), seq_num, int(time.time() * 1000))
+        if packet is None:
+            packet = pack_stats({"room_id": self.room_id, "error": "stats don't fit one datagram"},
+                                seq_num, int(time.time() * 1000))
+        self.sendto(packet, client_addr)
+
+    def collect_stats(self, per_client=True):
+        """
+        Everything STATS reports, as a JSON-friendly dict.
+        """
+        counters = self.stats.collect()
+
+        def by_type(counts):
+            named = {}
+            for msg_type, n in sorted(counts.items()):
+                try:
+                    named[MsgType(msg_type).name] = n
+                except ValueError:
+                    named[str(msg_type)] = n
+            return named
+
+        tick = self.ticks.stats()
+        tick["errors"] = self.tick_errors
+        tick.update({
+            f"duration_ms_{name}": 1000 * value
+            for name, value in percentiles(self.ticks.durations).items()
+        })
+
+        stats = {
+            "room_id": self.room_id,
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "snapshot_id": self.snapshot_id,
+            "sessions": {
+                "connected": len(self.sessions.live),
+                "known": len(self.sessions),
+            },
+            "packets_in": by_type(counters.packets_in),
+            "packets_out": by_type(counters.packets_out),
+            "bytes_in_total": sum(counters.bytes_in.values()),
+            "bytes_out_total": sum(counters.bytes_out.values()),
+            "tick": tick,
+            "events": {
+                "queued": len(self.event_inbox),
+                "applied": self.events_applied,
+                "max_batch": self.max_event_batch,
+            },
+            "egress": None if self.egress is None else {
+                "control_sent": self.egress.control_sent,
+                "control_delayed": self.egress.control_delayed,
+                "snapshots_sent": self.egress.snapshots_sent,
+                "queued_bytes": self.egress.queued_bytes,
+                "throttled": self.egress.throttled,
+                "snapshots_deferred": self.snapshots_deferred,
+            },
+            "multicast": {
+                "group": None if self.multicast_addr is None else "%s:%d" % self.multicast_addr,
+                "members": sum(1 for session in self.sessions.live if session.multicast is not None),
+                "packets": self.multicast_packets,
+                "bytes": self.multicast_bytes,
+                "fallbacks": self.multicast_fallbacks,
+            },
+            "reliable": {
+                "pending": len(self.reliable),
+                "retransmits": by_type(self.reliable.retransmits),
+                "give_ups": by_type(self.reliable.give_ups),
+            },
+            "drops": dict(sorted(counters.drops.items())),
+            "log_records_dropped": self.logger.dropped,
+            "log_bytes_queued": self.logger.queued_bytes(),
+        }
+        if per_client:
+            # player 0 = addresses that haven't joined
+            stats["bytes_in"] = {str(pid): n for pid, n in sorted(counters.bytes_in.items())}
+            stats["bytes_out"] = {str(pid): n for pid, n in sorted(counters.bytes_out.items())}
+        return stats
+
+    # ---------------------------------------------------------
+    # Outgoing messages
+    # ---------------------------------------------------------
+
+    def send_player_color_reliable(self, target, player_id, rgb_tuple):
+        """
+        Send PLAYER_COLOR to one client (Session) and remember it for
+        retransmission until we get PLAYER_COLOR_ACK.
+        """
+        r, g, b = rgb_tuple
+        now_ms = int(time.time() * 1000)
 
-threading.Thread(target=heartbeat_monitor, daemon=True).start()
+        # kept for retransmission, so it gets its own buffer
+        packet = pack_message(MsgType.PLAYER_COLOR, player_id, r, g, b, timestamp_ms=now_ms)
+        key = (MsgType.PLAYER_COLOR, target.addr, player_id)
+        self.reliable.send(
+            key,
+            MsgType.PLAYER_COLOR,
+            packet,
+            target.addr,
+            now_ms,
+            timeout_ms=COLOR_TIMEOUT_MS,
+        )
+        target.reliable_keys.add(key)
+        self.wake_retransmits()
 
+    def wake_retransmits(self):
+        # created in start(), handlers may run without a loop (e.g. from code)
+        if self._reliable_wakeup is not None:
+            self._reliable_wakeup.set()
 
-def send_event_ack(addr, seq):
-    payload = struct.pack("!H", seq)
+    def on_reliable_give_up(self, key, msg_type):
+        if msg_type == MsgType.PLAYER_COLOR:
+            session = self.sessions.get(key[1])
+        else:
+            session = self.sessions.player(key[1])
+        if session is not None:
+            session.reliable_keys.discard(key)
+        print(f"[SERVER] No ACK for {msg_type.name} {key[1:]} after {MAX_RELIABLE_RETRIES} retries -> giving up")
+
+    def ack_events(self, session):
+        """
+        Make sure the client hears about its events: the next SNAPSHOT
+        carries the acks anyway, so only send EVENT_ACK if that's too far off.
+        Multicast members always get one, group SNAPSHOTs carry no acks.
+        """
+        if session.live and session.multicast is None:
+            # (far overdue = the snapshot task is stalled or not running)
+            due_in_ms = (self.next_snapshot_at - time.monotonic()) * 1000
+            if -EVENT_ACK_MAX_DELAY_MS <= due_in_ms <= EVENT_ACK_MAX_DELAY_MS:
+                return
+
+        self.send_event_ack(session)
+
+    def send_event_ack(self, session):
+        packet = self.out.message(
+            MsgType.EVENT_ACK, session.last_seq, session.ack_bits,
+            seq_num=session.last_seq,
+            timestamp_ms=int(time.time() * 1000),
+        )
+        self.sendto(packet, session.addr)
+
+    def send_game_over(self):
+        print("[SERVER] Computing winner...")
+
+        scores = self.state.scores
+        winner_id = self.state.winner()
+        if len(scores) > MAX_GAME_OVER_SCORES:
+            # one datagram can't list everyone, keep the best (the winner first)
+            scores = dict(heapq.nlargest(MAX_GAME_OVER_SCORES, scores.items(), key=lambda item: item[1]))
+
+        timestamp_ms = int(time.time() * 1000)
+        # kept for retransmission, so copy it out of the shared buffer
+        packet = bytes(self.out.game_over(winner_id, scores, timestamp_ms))
+
+        # Send once immediately + register for RDT
+        for session in self.sessions.live:
+            key = (MsgType.GAME_OVER, session.player_id)
+            self.reliable.send(
+                key,
+                MsgType.GAME_OVER,
+                packet,
+                session.addr,
+                timestamp_ms,
+                timeout_ms=GAME_OVER_TIMEOUT_MS,
+            )
+            session.reliable_keys.add(key)
+        self.wake_retransmits()
+        self.game_over_sent = True
+
+        print("[SERVER] GAME_OVER SENT")
+        if self.on_game_over is not None:
+            self.on_game_over()
+
+    def build_snapshot_packet(self, kind, codec, baseline_id, chunk_index, chunk_count, tile, body, now_ms):
+        # EVENT acks are filled in per client, see send_snapshot_packets
+        return build_snapshot_chunk(
+            self.snapshot_id, now_ms,
+            kind, codec, baseline_id,
+            chunk_index, chunk_count, tile,
+            body,
+        )
 
-    header = pack_header(
-        MsgType.EVENT_ACK,
-        0,
-        seq,
-        int(time.time() * 1000),
-        len(payload)
-    )
+    def send_snapshot_packets(self, session, packets):
+        """
+        Send shared snapshot chunks to one client, with its EVENT acks
+        written into every chunk header.
+        """
+        ack_seq, ack_bits = session.last_seq, session.ack_bits
+        addr = session.addr
+
+        sent = 0
+        for packet in packets:
+            self.send_snapshot(self.out.snapshot_chunk(packet, ack_seq, ack_bits), addr)
+            sent += len(packet)
+        session.bytes_sent += sent
+
+    def encode_tile(self, tile, codecs):
+        """
+        Smallest encoding of one tile, cached until the tile changes.
+        """
+        key = (tile, codecs)
+        version = self.tile_version[tile]
+
+        cached = self.tile_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1], cached[2]
+
+        codec, body = encode_smallest(self.layout.extract(self.state.cells, tile), codecs)
+        self.tile_cache[key] = (version, codec, body)
+        return codec, body
+
+    def overview_cell(self, tile):
+        """
+        Most common owner of one tile, cached until the tile changes.
+        """
+        version = self.tile_version[tile]
+
+        cached = self.overview_cache.get(tile)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        owner = Counter(self.layout.extract(self.state.cells, tile)).most_common(1)[0][0]
+        self.overview_cache[tile] = (version, owner)
+        return owner
+
+    def encode_overview_tile(self, overview, tile, codecs):
+        return encode_smallest(self.overview_layout.extract(overview, tile), codecs)
+
+    def build_snapshot_chunks(self, kind, baseline_id, tiles, codecs, now_ms, encode=None):
+        """
+        One chunk packet per tile. A snapshot with nothing to send is still
+        one (empty) packet so the client can ack it and keep its metrics.
+        encode(tile, codecs) defaults to encode_tile.
+        """
+        if not tiles:
+            return [self.build_snapshot_packet(kind, SnapshotCodec.RAW, baseline_id, 0, 0, 0, b"", now_ms)]
+
+        if encode is None:
+            encode = self.encode_tile
+
+        packets = []
+        for chunk_index, tile in enumerate(tiles):
+            codec, body = encode(tile, codecs)
+            packets.append(self.build_snapshot_packet(
+                kind, codec, baseline_id,
+                chunk_index, len(tiles), tile,
+                body, now_ms,
+            ))
+        return packets
+
+    def tiles_changed_since(self, baseline_id):
+        tiles = set()
+        for sid in range(baseline_id + 1, self.snapshot_id + 1):
+            tiles |= self.tile_changes[sid]
+        return tiles
+
+    def delta_tiles(self, session, baseline_id, changed):
+        """
+        Tiles to send session in a delta against baseline_id: what changed
+        inside its AOI, plus tiles that entered the AOI after baseline_id.
+        """
+        aoi = session.aoi
+        pending = session.aoi_pending
+        if aoi is None and pending is None:
+            return tuple(sorted(changed))
+
+        tiles = set(changed) if aoi is None else changed.intersection(aoi[1])
+
+        if pending is not None:
+            since, entered = pending
+            if baseline_id >= since:
+                # the client acked a snapshot that had them all
+                session.aoi_pending = None
+            else:
+                tiles |= entered if aoi is None else entered.intersection(aoi[1])
 
-    server.sendto(header + payload, addr)
+        return tuple(sorted(tiles))
 
+    def send_overview(self, now_ms):
+        """
+        Coarse whole-board map for every client that only sees part of it.
+        """
+        overview = None
+        frames = {}
 
+        for session in self.sessions.live:
+            aoi = session.aoi
+            if aoi is None or len(aoi[1]) == self.layout.tile_count:
+                continue
 
-while True:
-    try:
-        # Receive data from client
-        data, client_addr = server.recvfrom(1024)
-
-        if client_addr in addr_to_player:
-            pid = addr_to_player[client_addr]
-            bytes_recv_per_player[pid] = bytes_recv_per_player.get(pid, 0) + len(data)
-        
-        if len(data) < HEADER_SIZE:
-            print(f"[WARN] Short packet from {client_addr}, ignoring")
-            continue
-        
-        prot_id, ver, msg_type_val, recv_snapshot_id, recv_seq_num, ts, payload_len = \
-            struct.unpack(HEADER_FORMAT, data[:HEADER_SIZE])
-        
-        msg_type = MsgType(msg_type_val)
+            if overview is None:
+                overview = [self.overview_cell(tile) for tile in range(self.layout.tile_count)]
 
-        if prot_id != PROTOCOL_ID or ver != VERSION:
-            print(f"[WARN] Invalid protocol/version from {client_addr}")
-            continue
+            codecs = session.codecs
+            packets = frames.get(codecs)
+            if packets is None:
+                packets = self.build_snapshot_chunks(
+                    SnapshotKind.OVERVIEW, 0,
+                    range(self.overview_layout.tile_count), codecs, now_ms,
+                    encode=lambda tile, codecs: self.encode_overview_tile(overview, tile, codecs),
+                )
+                frames[codecs] = packets
 
+            self.send_snapshot_packets(session, packets)
 
-        if msg_type == MsgType.JOIN:
-            if client_addr not in addr_to_player:
-                player_id = next_player_id
-                next_player_id += 1
-                addr_to_player[client_addr] = player_id
-            else:
-                player_id = addr_to_player[client_addr]
-            
-            print(f"[SERVER] JOIN from {client_addr} -> assigned player_id {player_id}")
+    def send_snapshots(self):
+        now_ms = int(time.time() * 1000)
 
-            color_r, color_g, color_b = assign_color(player_id)
+        # claims first: the snapshot is built from the post-batch board
+        self.apply_events()
 
-            player_color_map[player_id] = (color_r, color_g, color_b)
+        self.tile_changes[self.snapshot_id] = self.dirty_tiles
+        self.tile_changes.pop(self.snapshot_id - self.history_size, None)
+        self.dirty_tiles = set()
 
+        try:
+            self.send_snapshot_frames(now_ms)
+        finally:
+            # the history slot is written, so this snapshot_id is used up even
+            # if sending failed part way (clients that missed it recover as
+            # from a lost snapshot)
+            self.snapshot_id += 1
 
-            payload = struct.pack(JOIN_ACK_FORMAT, player_id, GRID_SIZE, TICK_RATE , color_r, color_g, color_b)
+        now_sec = int(time.time())
 
-            # Build response header
-            timestamp_ms = int(time.time() * 1000)
-            seq_out = 1  # simple for now — later we'll track it
+        if now_sec > self.last_bw_time:
+            if self.metrics_file is not None:
+                cpu = psutil.cpu_percent(interval=None)
 
-            header = pack_header(
-                MsgType.JOIN_ACK,  
-                0,                 
-                seq_out,            
-                timestamp_ms,
-                len(payload)
-            )
+                for session in self.sessions.live:
+                    sent_bps = session.bytes_sent * 8
+                    recv_bps = session.bytes_recv * 8
 
-            server.sendto(header + payload, client_addr)
-            print(f"[SERVER] Sent JOIN_ACK to {client_addr}")
+                    sent_kbps = sent_bps / 1000
+                    recv_kbps = recv_bps / 1000
 
-            
-            # 1) Tell the new player about existing players' colors
-            for existing_pid, addr in connected_players.items():
-                if existing_pid == player_id:
-                    continue
+                    self.logger.log(self.metrics_sink, (
+                        now_ms,
+                        cpu,
+                        session.player_id,
+                        sent_kbps,
+                        recv_kbps
+                    ))
 
-                cr, cg, cb = assign_color(existing_pid)
-                send_player_color_reliable(client_addr, existing_pid, (cr, cg, cb))
+            for session in self.sessions.by_addr.values():
+                session.bytes_sent = 0
+                session.bytes_recv = 0
+            self.last_bw_time = now_sec
 
-            # 2) Tell everyone about the new player's color
-            for pid, addr in connected_players.items():
-                send_player_color_reliable(addr, player_id, (color_r, color_g, color_b))
+        if self.positions_file is not None and self.snapshot_id % POSITIONS_RECORD_INTERVAL == 0:
+            cells = self.state.cells
+            self.logger.log(self.positions_sink, (self.snapshot_id, now_ms, cells[:]), cells.itemsize * len(cells))
 
+    def send_snapshot_frames(self, now_ms):
+        """
+        Send snapshot self.snapshot_id to every live client (its tile
+        changes are already in self.tile_changes).
+        """
+        # oldest baseline whose tile changes we still remember
+        oldest_baseline = self.snapshot_id - self.history_size
 
-        elif msg_type == MsgType.READY:
-                player_id = addr_to_player.get(client_addr)
+        # clients with the same baseline, codecs and tiles share the same chunks
+        frames = {}
 
-                if not player_id:
-                    print("[SERVER] READY from unknown client, ignoring", client_addr)
-                    continue
+        # key = baseline_id, value = tiles changed since then
+        changed_since = {}
 
-                # add to snapshot list
-                connected_players[player_id] = client_addr
-                print("[SERVER] Player added to snapshot list with id:", player_id)
+        # whole-board clients that get this tick from the multicast group
+        members = []
 
-                #send ALL known player colors to this client
-                now_ms = int(time.time() * 1000)
-                for pid, (r, g, b) in player_color_map.items():
-                    payload = struct.pack(PLAYER_COLOR_FORMAT, pid, r, g, b)
-                    header = pack_header(
-                        MsgType.PLAYER_COLOR,
-                        0,
-                        0,
-                        now_ms,
-                        len(payload),
-                    )
-                    server.sendto(header + payload, client_addr)
+        # still sending them the last one (egress rate cap), skip this tick
+        egress = self.egress if self._egress_wakeup is not None else None
 
+        for session in self.sessions.live:
+            # (once it has caught up on tiles its viewport widened to)
+            if session.multicast is not None and session.aoi is None and session.aoi_pending is None:
+                members.append(session)
                 continue
 
-        
-        elif msg_type == MsgType.EVENT:
-
-            payload = data[HEADER_SIZE:]
-
-            if len(payload) < EVENT_SIZE:
-                print("[SERVER] Bad EVENT payload length, ignoring")
+            if egress is not None and egress.backlog(session.addr):
+                self.snapshots_deferred += 1
                 continue
 
-            try:
-                player_id, seq, event_type, cell_index, event_ts = struct.unpack(EVENT_FORMAT, payload)
-            except struct.error:
-                print("[SERVER] Failed to unpack EVENT payload, ignoring")
-                continue
+            codecs = session.codecs
+            baseline_id = session.acked_snapshot
 
-            mapped_pid = addr_to_player.get(client_addr)
-            if mapped_pid is None or mapped_pid != player_id:
-                print(f"[WARN] EVENT from {client_addr} with mismatched player_id {player_id} (mapped {mapped_pid}) -> ignoring")
-                continue
+            # keyframes are staggered per player so they don't all go out
+            # in the same tick
+            keyframe = (
+                not DELTA_SNAPSHOTS
+                or baseline_id is None
+                or not oldest_baseline <= baseline_id <= self.snapshot_id
+                or (self.snapshot_id + session.player_id) % self.keyframe_interval == 0
+            )
 
-            with event_lock:
-                last_seq = connected_players_last_seq.get(player_id, -1)
-                if seq <= last_seq:
-                    send_event_ack(client_addr, seq)
-                    continue
-
-                connected_players_last_seq[player_id] = seq
-
-                acquired = False
-                with grid_lock:
-                    if 0 <= cell_index < GRID_SIZE * GRID_SIZE:
-                        if grid[cell_index] == 0:
-                            grid[cell_index] = player_id
-                            acquired = True
-                        else:
-                            acquired = False
-                    else:
-                        # invalid cell index
-                        print("[SERVER] Invalid cell_index in event:", cell_index)
-                        # we'll still ACK to stop client's retransmit
-                        send_event_ack(client_addr, seq)
-                        continue
-
-            send_event_ack(client_addr, seq)
-
-            if 0 not in grid and not pending_game_over:
-                send_game_over()
-
-            # Track bandwidth
-            bytes_recv_per_player[player_id] = bytes_recv_per_player.get(player_id, 0) + len(data)
-
-            continue
-
-        elif msg_type == MsgType.HEARTBEAT:
-            client_last_seen[client_addr] = time.time()
-
-        elif msg_type == MsgType.PLAYER_COLOR_ACK:
-            # payload: player_id (2 bytes)
-            if len(data) < HEADER_SIZE + PLAYER_COLOR_ACK_SIZE:
-                print("[SERVER] Short PLAYER_COLOR_ACK, ignoring")
+            if keyframe:
+                aoi = session.aoi
+                tiles = range(self.layout.tile_count) if aoi is None else aoi[1]
+                key = (SnapshotKind.FULL, 0, codecs, tiles)
+            else:
+                changed = changed_since.get(baseline_id)
+                if changed is None:
+                    changed = self.tiles_changed_since(baseline_id)
+                    changed_since[baseline_id] = changed
+                tiles = self.delta_tiles(session, baseline_id, changed)
+                key = (SnapshotKind.DELTA, baseline_id, codecs, tiles)
+
+            packets = frames.get(key)
+            if packets is None:
+                packets = self.build_snapshot_chunks(key[0], key[1], tiles, codecs, now_ms)
+                frames[key] = packets
+
+            self.send_snapshot_packets(session, packets)
+
+        if members:
+            if egress is not None and egress.backlog(self.multicast_addr):
+                self.snapshots_deferred += 1
+            else:
+                self.send_multicast_snapshot(members, frames, changed_since, oldest_baseline, now_ms)
+
+        if self.snapshot_id % OVERVIEW_INTERVAL == 0:
+            self.send_overview(now_ms)
+
+        if egress is not None:
+            egress.begin_tick(time.monotonic())
+            self._egress_wakeup.set()
+
+    def send_multicast_snapshot(self, members, frames, changed_since, oldest_baseline, now_ms):
+        """
+        One snapshot for all multicast members, sent once to the group: a
+        delta against the oldest snapshot any of them acked (or a keyframe),
+        in the codecs all of them decode. Members that fell too far behind
+        go back to unicast from the next tick.
+        """
+        codecs = ALL_CODECS_MASK
+        baseline_id = self.snapshot_id
+        keeping_up = 0
+
+        for session in members:
+            acked = session.acked_snapshot
+            last = session.multicast if acked is None else max(acked, session.multicast)
+            if self.snapshot_id - last > MULTICAST_MAX_LAG:
+                print(f"[SERVER] Player {session.player_id} is not getting multicast SNAPSHOTs -> unicast")
+                self.leave_multicast(session)
                 continue
 
-            ack_payload = data[HEADER_SIZE:HEADER_SIZE+PLAYER_COLOR_ACK_SIZE]
-            ack_pid, = struct.unpack(PLAYER_COLOR_ACK_FORMAT, ack_payload)
-
-            key = (client_addr, ack_pid)
-            if key in pending_color:
-                del pending_color[key]
-                # rdt3.0 "stop_timer" for this color
-                print(f"[SERVER] Got PLAYER_COLOR_ACK for player {ack_pid} from {client_addr}")
-            continue
-        elif msg_type == MsgType.GAME_OVER_ACK:
-            if len(data) < HEADER_SIZE + GAME_OVER_ACK_SIZE:
-                continue
+            keeping_up += 1
+            codecs &= session.codecs
+            if acked is None or acked < oldest_baseline:
+                baseline_id = None
+            elif baseline_id is not None:
+                baseline_id = min(baseline_id, acked)
 
-            ack_payload = data[HEADER_SIZE:HEADER_SIZE + GAME_OVER_ACK_SIZE]
-            ack_pid, = struct.unpack(GAME_OVER_ACK_FORMAT, ack_payload)
+        if not keeping_up:
+            return
 
-            if ack_pid in pending_game_over:
-                del pending_game_over[ack_pid]
-                print(f"[SERVER] Got GAME_OVER_ACK from player {ack_pid}")
-            continue
-            
+        if not DELTA_SNAPSHOTS or baseline_id is None or self.snapshot_id % self.keyframe_interval == 0:
+            tiles = range(self.layout.tile_count)
+            key = (SnapshotKind.FULL, 0, codecs, tiles)
+        else:
+            changed = changed_since.get(baseline_id)
+            if changed is None:
+                changed = self.tiles_changed_since(baseline_id)
+                changed_since[baseline_id] = changed
+            tiles = tuple(sorted(changed))
+            key = (SnapshotKind.DELTA, baseline_id, codecs, tiles)
+
+        packets = frames.get(key)
+        if packets is None:
+            packets = self.build_snapshot_chunks(key[0], key[1], tiles, codecs, now_ms)
+            frames[key] = packets
+
+        group = self.multicast_addr
+        for packet in packets:
+            self.send_snapshot(self.out.snapshot_chunk(packet, NO_EVENTS_ACKED, 0), group)
+            self.multicast_bytes += len(packet)
+        self.multicast_packets += len(packets)
+
+    # ---------------------------------------------------------
+    # Periodic tasks
+    # ---------------------------------------------------------
+
+    async def snapshot_loop(self):
+        print("[SERVER] Snapshot task started ...")
+
+        ticks = self.ticks
+        ticks.start()
+        self.next_snapshot_at = ticks.next_deadline
+
+        reported = (0, 0)
+        last_report = 0.0
+
+        while True:
+            await asyncio.sleep(ticks.delay())
+
+            ticks.begin()
+            try:
+                self.send_snapshots()
+            except Exception:
+                # one bad tick must not stop the game
+                self.tick_errors += 1
+                print(f"[SERVER] Tick {self.snapshot_id} failed:")
+                traceback.print_exc()
+            ticks.end()
+            self.next_snapshot_at = ticks.next_deadline
+
+            now = time.monotonic()
+            if (ticks.overruns, ticks.skipped) != reported and now - last_report >= TICK_REPORT_INTERVAL:
+                stats = ticks.stats()
+                print(
+                    f"[SERVER] Tick overrun: {ticks.overruns - reported[0]} overruns, "
+                    f"{ticks.skipped - reported[1]} skipped ticks "
+                    f"(max {stats['duration_ms_max']:.1f} ms per tick)"
+                )
+                reported = (ticks.overruns, ticks.skipped)
+                last_report = now
+
+    async def retransmit_loop(self):
+        while True:
+            if not self.reliable:
+                # nothing to retransmit: sleep until the next reliable send
+                # instead of waking up every RETRANSMIT_TICK_MS (matters
+                # when many rooms share one process)
+                self._reliable_wakeup.clear()
+                await self._reliable_wakeup.wait()
+
+            self.reliable.poll(int(time.time() * 1000))
+            await asyncio.sleep(RETRANSMIT_TICK_MS / 1000)
+
+    async def egress_loop(self):
+        egress = self.egress
+        while True:
+            if not egress:
+                # nothing queued: sleep until the next tick or delayed control message
+                self._egress_wakeup.clear()
+                await self._egress_wakeup.wait()
+
+            await asyncio.sleep(egress.pump(time.monotonic()))
+
+    def drop_session(self, session):
+        """
+        Forget a client: no more snapshots or retransmissions to it.
+        """
+        for key in session.reliable_keys:
+            self.reliable.ack(key)
+        session.reliable_keys.clear()
+        if self.egress is not None:
+            self.egress.forget(session.addr)
+        self.stats.forget_player(session.player_id)
+        self.sessions.remove(session)
+        if self.on_player_left is not None:
+            self.on_player_left(session.addr)
+
+    async def heartbeat_loop(self):
+        while True:
+            for session in self.sessions.expired(time.monotonic() - HEARTBEAT_TIMEOUT):
+                print(f"[SERVER] Client {session.addr} disconnected (heartbeat timeout)")
+                self.drop_session(session)
+
+            await asyncio.sleep(HEARTBEAT_CHECK_INTERVAL)
+
+
+async def main():
+    game_server = GameServer(SERVER_IP, SERVER_PORT, grid_size=SERVER_GRID_SIZE)
+
+    # run_all_tests.sh stops the server with SIGTERM, close cleanly so the
+    # background logger gets to flush
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, game_server.close)
+    except NotImplementedError:
+        pass  # Windows
 
-    except ConnectionResetError:
-        continue
+    try:
+        await game_server.serve_forever()
+    finally:
+        game_server.close()
 
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\n[SERVER] Shutting down...")
-        break
-
-server.close()
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""
+Live performance counters of a GameServer, read with the STATS message
+(see stats_tool.py).
+
+Every thread that counts gets its own Counters object from
+StatsRegistry.counters() and only ever writes to that one, so counting is a
+plain dict increment without a lock. collect() adds all of them up when
+somebody asks; the lock is only taken when a thread registers its Counters
+and when collecting.
+
+Counters:
+- packets_in / packets_out   msg_type -> datagrams
+- bytes_in / bytes_out       player_id -> bytes (0 = not joined yet,
+                             PLAYERS_LEFT = everyone who left, see forget_player)
+- drops                      reason -> datagrams / events thrown away
+"""
+
+import threading
+
+PLAYERS_LEFT = -1
+
+
+class Counters:
+
+    def __init__(self):
+        self.packets_in = {}
+        self.packets_out = {}
+        self.bytes_in = {}
+        self.bytes_out = {}
+        self.drops = {}
+
+    def packet_in(self, msg_type, player_id, nbytes):
+        self.packets_in[msg_type] = self.packets_in.get(msg_type, 0) + 1
+        self.bytes_in[player_id] = self.bytes_in.get(player_id, 0) + nbytes
+
+    def packet_out(self, msg_type, player_id, nbytes):
+        self.packets_out[msg_type] = self.packets_out.get(msg_type, 0) + 1
+        self.bytes_out[player_id] = self.bytes_out.get(player_id, 0) + nbytes
+
+    def drop(self, reason, count=1):
+        self.drops[reason] = self.drops.get(reason, 0) + count
+
+
+class StatsRegistry:
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+        # player_ids that left, other threads' counters for them are folded
+        # into PLAYERS_LEFT by collect()
+        self._left = set()
+
+    def counters(self):
+        """
+        The calling thread's Counters (created on first use).
+        """
+        counters = getattr(self._local, "counters", None)
+        if counters is None:
+            counters = self._local.counters = Counters()
+            with self._lock:
+                self._all.append(counters)
+        return counters
+
+    def forget_player(self, player_id):
+        """
+        Fold a player that left into PLAYERS_LEFT, so the per-player
+        counters only hold the players that are still around. Only the
+        calling thread's own Counters are changed (it's the one counting
+        that player); collect() folds what other threads counted.
+        """
+        fold_player(self.counters(), player_id)
+        with self._lock:
+            self._left.add(player_id)
+
+    def collect(self):
+        """
+        Sum of every thread's counters, as plain dicts.
+        """
+        total = Counters()
+        with self._lock:
+            registered = list(self._all)
+            left = set(self._left)
+
+        for counters in registered:
+            for name in ("packets_in", "packets_out", "bytes_in", "bytes_out", "drops"):
+                merged = getattr(total, name)
+                # dict() copies in one step under the GIL, the owner may be writing
+                for key, value in dict(getattr(counters, name)).items():
+                    merged[key] = merged.get(key, 0) + value
+
+        for player_id in left.intersection(total.bytes_in).union(left.intersection(total.bytes_out)):
+            fold_player(total, player_id)
+        return total
+
+
+def fold_player(counters, player_id):
+    """
+    Move player_id's bytes_in / bytes_out into PLAYERS_LEFT.
+    """
+    for per_player in (counters.bytes_in, counters.bytes_out):
+        nbytes = per_player.pop(player_id, 0)
+        if nbytes:
+            per_player[PLAYERS_LEFT] = per_player.get(PLAYERS_LEFT, 0) + nbytes
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    {"p50": ..., ...} of samples (nearest rank), empty samples give 0.
+    """
+    ordered = sorted(samples)
+    out = {}
+    for p in points:
+        if not ordered:
+            out[f"p{p}"] = 0.0
+            continue
+        rank = max(0, -(-len(ordered) * p // 100) - 1)
+        out[f"p{p}"] = ordered[rank]
+    return out
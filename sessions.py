@@ -0,0 +1,128 @@
+"""
+Per-client state of a GameServer.
+
+One Session per client address holds everything the server knows about
+that player (codecs, EVENT ack window, snapshot baseline, viewport,
+bandwidth counters, pending reliable messages, multicast membership). SessionTable indexes the
+sessions by address and by player_id and keeps
+
+- live: a compact list of the sessions that are READY, which is what the
+  tick fans snapshots out over (swap-remove, so no holes)
+- a least-recently-seen order, so finding expired sessions only looks at
+  the ones that actually expired
+
+Removing a session takes it out of every index at once, so nothing about
+a dead client is left behind.
+"""
+
+from collections import OrderedDict
+
+from protocol import NO_EVENTS_ACKED
+
+
+class Session:
+
+    __slots__ = (
+        "player_id", "addr", "slot", "last_seen",
+        "codecs",
+        # EVENT ack window (see protocol.event_acked)
+        "last_seq", "ack_bits",
+        # newest snapshot_id the client acked (None = needs a keyframe)
+        "acked_snapshot",
+        # (viewport rect, sorted tuple of AOI tiles), None = whole board
+        "aoi",
+        # (snapshot_id, set of tiles) that entered the AOI at snapshot_id;
+        # they go out with every delta until the client acks a snapshot >= it
+        "aoi_pending",
+        # bytes this metrics interval (server_metrics.csv)
+        "bytes_sent", "bytes_recv",
+        # ReliableSender keys still waiting for this client's ack
+        "reliable_keys",
+        # snapshot_id at which it started getting SNAPSHOTs from the
+        # multicast group (None = unicast); unicast_only = multicast failed
+        # for it, ignore further MULTICAST requests
+        "multicast", "unicast_only",
+    )
+
+    def __init__(self, player_id, addr, codecs, now):
+        self.player_id = player_id
+        self.addr = addr
+        self.slot = -1              # index in SessionTable.live, -1 = not READY
+        self.last_seen = now
+        self.codecs = codecs
+        self.last_seq = NO_EVENTS_ACKED
+        self.ack_bits = 0
+        self.acked_snapshot = None
+        self.aoi = None
+        self.aoi_pending = None
+        self.bytes_sent = 0
+        self.bytes_recv = 0
+        self.reliable_keys = set()
+        self.multicast = None
+        self.unicast_only = False
+
+    @property
+    def live(self):
+        return self.slot >= 0
+
+
+class SessionTable:
+
+    def __init__(self):
+        self.by_addr = {}
+        self.by_player = {}
+        self.live = []
+        self.by_activity = OrderedDict()    # addr -> Session, least recently seen first
+
+    def __len__(self):
+        return len(self.by_addr)
+
+    def get(self, addr):
+        return self.by_addr.get(addr)
+
+    def player(self, player_id):
+        return self.by_player.get(player_id)
+
+    def add(self, session):
+        self.by_addr[session.addr] = session
+        self.by_player[session.player_id] = session
+        self.by_activity[session.addr] = session
+
+    def touch(self, session, now):
+        session.last_seen = now
+        self.by_activity.move_to_end(session.addr)
+
+    def connect(self, session):
+        """
+        Start sending snapshots to session (READY).
+        """
+        if session.slot < 0:
+            session.slot = len(self.live)
+            self.live.append(session)
+
+    def disconnect(self, session):
+        slot = session.slot
+        if slot < 0:
+            return
+        last = self.live.pop()
+        if last is not session:
+            self.live[slot] = last
+            last.slot = slot
+        session.slot = -1
+
+    def remove(self, session):
+        self.disconnect(session)
+        del self.by_addr[session.addr]
+        del self.by_player[session.player_id]
+        del self.by_activity[session.addr]
+
+    def expired(self, deadline):
+        """
+        Sessions not seen since deadline, least recently seen first.
+        """
+        stale = []
+        for session in self.by_activity.values():
+            if session.last_seen >= deadline:
+                break
+            stale.append(session)
+        return stale
@@ -0,0 +1,160 @@
+"""
+GridClash SNAPSHOT tile codecs.
+Used by both server (encode) and client (decode).
+
+Cells are 16-bit owner ids.
+
+RAW      two bytes per cell (network byte order)
+BITPACK  bits (1 byte) + every cell packed MSB-first in `bits` bits,
+         bits = ceil(log2(max_owner + 1)), last byte zero padded
+RLE      (run_length 1 byte, owner 2 bytes) triples, runs longer than
+         255 are split
+
+Encoders take any sequence of ints. Decoders take any bytes-like body
+(memoryview included) and return an array('H') of cell_count owners, or
+None if the body is malformed.
+"""
+
+import struct
+import sys
+from array import array
+from itertools import groupby
+
+from protocol import SnapshotCodec
+
+MAX_RUN = 255
+MAX_CELL_BITS = 16
+
+RLE_RUN_FORMAT = "!BH"
+RLE_RUN_SIZE = struct.calcsize(RLE_RUN_FORMAT)
+
+NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def cell_bits(cells):
+    return max(1, max(cells, default=0).bit_length())
+
+
+def encode_raw(cells):
+    return struct.pack(f"!{len(cells)}H", *cells)
+
+
+def decode_raw(body, cell_count):
+    if len(body) != cell_count * 2:
+        return None
+    out = array("H")
+    out.frombytes(body)
+    if NATIVE_LITTLE_ENDIAN:
+        out.byteswap()
+    return out
+
+
+def encode_bitpack(cells):
+    bits = cell_bits(cells)
+    out = bytearray([bits])
+
+    acc = 0
+    acc_bits = 0
+    for value in cells:
+        acc = (acc << bits) | value
+        acc_bits += bits
+        while acc_bits >= 8:
+            acc_bits -= 8
+            out.append((acc >> acc_bits) & 0xFF)
+        acc &= (1 << acc_bits) - 1
+
+    if acc_bits:
+        out.append((acc << (8 - acc_bits)) & 0xFF)
+    return bytes(out)
+
+
+def decode_bitpack(body, cell_count):
+    if not body:
+        return None
+
+    bits = body[0]
+    if not 1 <= bits <= MAX_CELL_BITS or len(body) != 1 + (cell_count * bits + 7) // 8:
+        return None
+
+    out = array("H", bytes(2 * cell_count))
+    mask = (1 << bits) - 1
+
+    acc = 0
+    acc_bits = 0
+    i = 0
+    for byte in body[1:]:
+        acc = (acc << 8) | byte
+        acc_bits += 8
+        while acc_bits >= bits and i < cell_count:
+            acc_bits -= bits
+            out[i] = (acc >> acc_bits) & mask
+            i += 1
+        acc &= (1 << acc_bits) - 1
+
+    return out
+
+
+def encode_rle(cells):
+    out = bytearray()
+    for value, run in groupby(cells):
+        length = sum(1 for _ in run)
+        while length > 0:
+            n = min(length, MAX_RUN)
+            out += struct.pack(RLE_RUN_FORMAT, n, value)
+            length -= n
+    return bytes(out)
+
+
+def decode_rle(body, cell_count):
+    if len(body) % RLE_RUN_SIZE:
+        return None
+
+    out = array("H")
+    for run, value in struct.iter_unpack(RLE_RUN_FORMAT, body):
+        out.extend(array("H", [value]) * run)
+
+    if len(out) != cell_count:
+        return None
+    return out
+
+
+ENCODERS = {
+    SnapshotCodec.RAW: encode_raw,
+    SnapshotCodec.BITPACK: encode_bitpack,
+    SnapshotCodec.RLE: encode_rle,
+}
+
+DECODERS = {
+    SnapshotCodec.RAW: decode_raw,
+    SnapshotCodec.BITPACK: decode_bitpack,
+    SnapshotCodec.RLE: decode_rle,
+}
+
+
+def encode_cells(codec, cells):
+    return ENCODERS[codec](cells)
+
+
+def decode_cells(codec, body, cell_count):
+    decoder = DECODERS.get(codec)
+    if decoder is None:
+        return None
+    return decoder(body, cell_count)
+
+
+def encode_smallest(cells, codecs_mask):
+    """
+    Encode cells with every codec allowed by codecs_mask and return
+    (codec, body) for the smallest one. RAW is always allowed.
+    """
+    best_codec = SnapshotCodec.RAW
+    best_body = encode_raw(cells)
+
+    for codec, encoder in ENCODERS.items():
+        if codec == SnapshotCodec.RAW or not codecs_mask & (1 << codec):
+            continue
+        body = encoder(cells)
+        if len(body) < len(best_body):
+            best_codec, best_body = codec, body
+
+    return best_codec, best_body
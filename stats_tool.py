@@ -0,0 +1,162 @@
+"""
+GridClash STATS query tool (operator side).
+
+Asks a running server for its live counters (MsgType.STATS) and prints them.
+The server only answers from loopback, so run this on the server's machine.
+
+Run with: python stats_tool.py [host] [port] [watch_seconds]
+- host / port default to the server's SERVER_IP / SERVER_PORT; with
+  room_server.py query a room's own port (printed when the room opens)
+- watch_seconds > 0 repeats the query every watch_seconds
+"""
+
+import argparse
+import socket
+import time
+
+from protocol import (
+    MsgType, PROTOCOL_ID, VERSION,
+    PacketBuffer, unpack_header, unpack_stats,
+)
+from server import SERVER_IP, SERVER_PORT
+from server_stats import PLAYERS_LEFT
+
+QUERY_TIMEOUT = 1.0    # seconds
+QUERY_RETRIES = 3
+
+
+def query_stats(sock, addr, seq_num):
+    """
+    One STATS round trip; returns the stats dict or None on timeout.
+    """
+    request = PacketBuffer()
+    for _ in range(QUERY_RETRIES):
+        sock.sendto(request.message(MsgType.STATS, seq_num=seq_num, timestamp_ms=int(time.time() * 1000)), addr)
+
+        deadline = time.monotonic() + QUERY_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(65535)
+            except socket.timeout:
+                break
+
+            header = unpack_header(data)
+            if header is None:
+                continue
+            prot_id, ver, msg_type, _sid, reply_seq, _ts, _plen = header
+            if prot_id != PROTOCOL_ID or ver != VERSION or msg_type != MsgType.STATS:
+                continue
+            if reply_seq != seq_num:
+                continue    # answer to an earlier, timed out query
+            return unpack_stats(data)
+    return None
+
+
+def print_counts(title, counts):
+    print(f"{title}:")
+    if not counts:
+        print("    -")
+    for key, value in counts.items():
+        print(f"    {key:<22} {value}")
+
+
+def print_stats(stats):
+    if "error" in stats:
+        print(f"=== room {stats['room_id']} === {stats['error']}")
+        return
+
+    print(f"=== room {stats['room_id']} | up {stats['uptime_s']} s | snapshot {stats['snapshot_id']} ===")
+    sessions = stats["sessions"]
+    print(f"sessions: {sessions['connected']} connected, {sessions['known']} known")
+
+    tick = stats["tick"]
+    print(
+        f"tick: {tick['ticks']} ticks, {tick['overruns']} overruns, "
+        f"{tick['skipped']} skipped, {tick['late_ticks']} late, {tick['errors']} failed"
+    )
+    print(
+        f"    duration ms  p50={tick['duration_ms_p50']:.2f} p90={tick['duration_ms_p90']:.2f} "
+        f"p99={tick['duration_ms_p99']:.2f} max={tick['duration_ms_max']:.2f}"
+    )
+    print(f"    lateness ms  mean={tick['lateness_ms_mean']:.2f} max={tick['lateness_ms_max']:.2f}")
+    events = stats["events"]
+    print(f"events: {events['applied']} applied, {events['queued']} queued, largest tick batch {events['max_batch']}")
+
+    print(f"bytes: {stats['bytes_in_total']} in, {stats['bytes_out_total']} out")
+    print_counts("packets in", stats["packets_in"])
+    print_counts("packets out", stats["packets_out"])
+    if "bytes_out" in stats:
+        pids = sorted(set(stats["bytes_in"]) | set(stats["bytes_out"]), key=int)
+        per_client = {
+            (f"player {pid}" if pid != str(PLAYERS_LEFT) else "players that left"):
+                f"{stats['bytes_in'].get(pid, 0)} in / {stats['bytes_out'].get(pid, 0)} out"
+            for pid in pids
+        }
+        print_counts("bytes per client", per_client)
+
+    egress = stats["egress"]
+    if egress is not None:
+        print(
+            f"egress: {egress['control_sent']} control ({egress['control_delayed']} delayed), "
+            f"{egress['snapshots_sent']} snapshot packets, {egress['queued_bytes']} bytes queued, "
+            f"{egress['throttled']} throttled, {egress['snapshots_deferred']} snapshots deferred"
+        )
+    multicast = stats["multicast"]
+    if multicast["group"] is not None:
+        print(
+            f"multicast {multicast['group']}: {multicast['members']} members, "
+            f"{multicast['packets']} packets, {multicast['bytes']} bytes, "
+            f"{multicast['fallbacks']} fell back to unicast"
+        )
+
+    reliable = stats["reliable"]
+    print(f"reliable: {reliable['pending']} pending")
+    print_counts("    retransmits", reliable["retransmits"])
+    print_counts("    give-ups", reliable["give_ups"])
+    print_counts("drops", stats["drops"])
+    print(f"log records dropped: {stats['log_records_dropped']} ({stats['log_bytes_queued']} bytes queued)")
+
+
+def query_loop(host=SERVER_IP, port=SERVER_PORT, watch=0.0):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    seq_num = 0
+
+    while True:
+        seq_num += 1
+        stats = query_stats(sock, (host, port), seq_num)
+        if stats is None:
+            print(f"[STATS] No answer from {(host, port)}")
+        else:
+            print_stats(stats)
+
+        if watch <= 0:
+            return
+        time.sleep(watch)
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query a running GridClash server's STATS")
+    parser.add_argument("host", nargs="?", default=SERVER_IP)
+    parser.add_argument("port", nargs="?", type=int, default=SERVER_PORT)
+    parser.add_argument("watch", nargs="?", type=float, default=0.0,
+                        help="repeat every WATCH seconds (0 = query once)")
+    args = parser.parse_args()
+
+    try:
+        socket.getaddrinfo(args.host, args.port, socket.AF_INET, socket.SOCK_DGRAM)
+    except socket.gaierror as e:
+        parser.error(f"can't resolve host {args.host!r}: {e}")
+
+    try:
+        query_loop(args.host, args.port, args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Egress pacing: token buckets, control messages ahead of snapshots, round
+robin between clients, snapshot packets queued as arena views
+(python -m pytest). Time is passed in explicitly, nothing sleeps.
+"""
+
+import math
+
+from egress import TokenBucket, EgressScheduler, SNAPSHOT_ARENA_SIZE
+
+A = ("127.0.0.1", 1)
+B = ("127.0.0.1", 2)
+
+
+def test_bucket_refills_up_to_burst():
+    bucket = TokenBucket(1000, 100, now=0.0)
+    assert bucket.ready()
+
+    bucket.take(300)          # bigger than the burst still goes, into debt
+    assert bucket.tokens == -200
+    assert not bucket.ready()
+    assert math.isclose(bucket.wait(), 0.201)
+
+    bucket.refill(0.1)
+    assert bucket.tokens == -100
+    bucket.refill(10.0)
+    assert bucket.tokens == 100
+
+
+def test_unlimited_bucket():
+    bucket = TokenBucket(None, None, now=0.0)
+    bucket.take(10 ** 9)
+    bucket.refill(1.0)
+    assert bucket.ready()
+    assert bucket.wait() == 0.0
+
+
+def make_scheduler(**kwargs):
+    sent = []
+    egress = EgressScheduler(lambda packet, addr: sent.append((bytes(packet), addr)), 0.0, **kwargs)
+    return egress, sent
+
+
+def test_control_goes_first():
+    egress, sent = make_scheduler(rate=1000, burst_s=0.1)    # 100 byte burst
+    egress.queue_snapshot(b"s" * 80, A, 0.0)
+    egress.begin_tick(0.0)
+
+    # sent right away while the overall bucket allows
+    assert not egress.send_control(b"c1" * 60, A, 0.0)
+    # bucket in debt: queued ahead of the snapshot
+    assert egress.send_control(b"c2", B, 0.0)
+    assert [p[:2] for p, _addr in sent] == [b"c1"]
+
+    egress.pump(0.0)
+    assert len(sent) == 1
+
+    now = 0.0
+    while egress:
+        now += egress.pump(now) or 0.001
+    assert [p[:2] for p, _addr in sent] == [b"c1", b"c2", b"ss"]
+    assert egress.control_delayed == 1
+
+
+def test_client_bucket_limits_snapshots_not_control():
+    egress, sent = make_scheduler(client_rate=1000, burst_s=0.1, spread=0.0)
+    for _ in range(5):
+        egress.queue_snapshot(b"x" * 100, A, 0.0)
+    egress.begin_tick(0.0)
+
+    egress.pump(0.0)
+    assert len(sent) == 1         # 100 byte burst
+    assert not egress.send_control(b"ctl", A, 0.0)
+    assert len(sent) == 2
+
+    now = 0.0
+    while egress:
+        now += egress.pump(now)
+    # the next one goes once the control packet's debt is repaid, then one
+    # per 0.1 s (100 bytes at 1000 bytes/s)
+    assert 0.3 <= now <= 0.31
+    assert egress.throttled > 0
+
+
+def test_round_robin_between_clients():
+    egress, sent = make_scheduler(spread=0.0)
+    for i in range(3):
+        egress.queue_snapshot(bytes([i]) * 10, A, 0.0)
+    egress.queue_snapshot(b"b" * 10, B, 0.0)
+    egress.begin_tick(0.0)
+    egress.pump(0.0)
+
+    assert [addr for _packet, addr in sent] == [A, B, A, A]
+
+
+def test_tick_is_spread_over_slots():
+    egress, sent = make_scheduler(spread=0.01, slot=0.002)   # 5 slots
+    for _ in range(10):
+        egress.queue_snapshot(b"x" * 100, A, 0.0)
+    egress.begin_tick(0.0)
+
+    assert egress.pump(0.0) > 0
+    assert len(sent) == 2
+    now = 0.0
+    while egress:
+        now += egress.pump(now)
+    assert len(sent) == 10
+    assert math.isclose(now, 0.008)
+
+
+def test_forget_drops_queued_snapshots():
+    egress, sent = make_scheduler()
+    egress.queue_snapshot(b"x" * 50, A, 0.0)
+    egress.queue_snapshot(b"y" * 50, B, 0.0)
+    assert egress.backlog(A) == 50
+
+    egress.forget(A)
+    assert egress.backlog(A) == 0
+    assert egress.queued_bytes == 50
+    egress.begin_tick(0.0)
+    egress.pump(0.0)
+    assert sent == [(b"y" * 50, B)]
+
+
+def test_snapshots_are_copied_into_arenas():
+    egress, sent = make_scheduler(spread=0.0)
+    buf = bytearray(b"a" * 100)
+    egress.queue_snapshot(buf, A, 0.0)
+    buf[:] = b"b" * 100               # the caller reuses its buffer
+    egress.queue_snapshot(buf, A, 0.0)
+
+    first, second = egress.queues[A].packets
+    assert isinstance(first, memoryview) and first.obj is second.obj
+
+    # a full arena starts a new one, a packet bigger than an arena gets its own
+    egress.queue_snapshot(bytes(SNAPSHOT_ARENA_SIZE - 150), B, 0.0)
+    big = bytes(SNAPSHOT_ARENA_SIZE + 1)
+    egress.queue_snapshot(big, B, 0.0)
+    third, fourth = egress.queues[B].packets
+    assert third.obj is not first.obj and fourth.obj is not third.obj
+
+    egress.begin_tick(0.0)
+    egress.pump(0.0)
+    assert [packet for packet, addr in sent if addr == A] == [b"a" * 100, b"b" * 100]
+    assert len(sent[-1][0]) == len(big)
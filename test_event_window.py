@@ -0,0 +1,122 @@
+"""
+EVENT ack window: an event the client gave up on must not block the ones
+after it. Runs without sockets (python -m unittest test_event_window).
+"""
+
+import unittest
+
+from event_batch import EventBatcher
+from protocol import MsgType, EventType, ALL_CODECS_MASK, EVENT_ACK_BITS, pack_message
+from server import GameServer
+
+CLIENT_ADDR = ("127.0.0.1", 40000)
+TIMEOUT_MS = 100
+MAX_RETRIES = 2
+CLICKS_AFTER_LOSS = 40     # more than EVENT_ACK_BITS
+
+
+class FakeTransport:
+
+    def sendto(self, data, addr=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class EventWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = GameServer(
+            "127.0.0.1", 0, metrics_file=None, positions_file=None,
+            journal_file=None, multicast_addr=None, pacing=False,
+        )
+        self.server.connection_made(FakeTransport())
+        self.server.datagram_received(bytes(pack_message(MsgType.JOIN, ALL_CODECS_MASK, 0)), CLIENT_ADDR)
+        self.server.datagram_received(bytes(pack_message(MsgType.READY)), CLIENT_ADDR)
+        self.session = self.server.sessions.get(CLIENT_ADDR)
+
+        self.lost = True
+        self.batcher = EventBatcher(
+            self.deliver, self.session.player_id,
+            timeout_ms=TIMEOUT_MS, max_retries=MAX_RETRIES,
+        )
+
+    def deliver(self, packet, first_seq):
+        if not self.lost:
+            self.server.datagram_received(bytes(packet), CLIENT_ADDR)
+
+    def test_given_up_event_does_not_block_later_ones(self):
+        now = 0
+        self.batcher.add(EventType.CLICK, 0, now)
+
+        # every (re)transmission of the first click is lost, until it's given up
+        while self.batcher.give_ups == 0:
+            self.batcher.poll(now)
+            now += TIMEOUT_MS
+        self.assertEqual(len(self.batcher), 0)
+
+        self.lost = False
+        cells = range(1, CLICKS_AFTER_LOSS + 1)
+        for cell in cells:
+            self.batcher.add(EventType.CLICK, cell, now)
+
+        for _ in range(100):
+            if not len(self.batcher):
+                break
+            self.batcher.poll(now)
+            self.batcher.ack(self.session.last_seq, self.session.ack_bits)
+            now += TIMEOUT_MS
+        self.assertEqual(len(self.batcher), 0)
+        self.assertEqual(self.batcher.give_ups, 1)
+
+        self.server.apply_events()
+        player_id = self.session.player_id
+        self.assertEqual([self.server.state.cells[cell] for cell in cells], [player_id] * len(cells))
+        self.assertEqual(self.server.state.cells[0], 0)
+
+        drops = self.server.stats.collect().drops
+        self.assertNotIn("event_out_of_window", drops)
+        self.assertEqual(drops.get("event_given_up"), 1)
+
+    def test_claims_wait_for_the_tick(self):
+        self.lost = False
+        for cell in (3, 4, 3):
+            self.batcher.add(EventType.CLICK, cell, 0)
+        self.batcher.poll(0)
+
+        # acked right away, but the board only changes when the tick runs
+        self.assertEqual(self.batcher.ack(self.session.last_seq, self.session.ack_bits), 3)
+        self.assertEqual(len(self.server.event_inbox), 3)
+        self.assertEqual(self.server.state.cells[3], 0)
+        self.assertEqual(self.server.apply_events(), 3)
+        self.assertEqual(self.server.event_inbox, [])
+
+        player_id = self.session.player_id
+        self.assertEqual((self.server.state.cells[3], self.server.state.cells[4]), (player_id, player_id))
+        self.assertEqual(self.server.state.scores, {player_id: 2})
+        self.assertEqual(self.server.stats.collect().drops.get("cell_taken"), 1)
+
+    def test_events_behind_the_window_go_out_when_it_gives_up(self):
+        # nothing gets through: once the first EVENT_ACK_BITS events are
+        # given up the rest must still be sent (and given up in turn)
+        sent = []
+        batcher = EventBatcher(
+            lambda packet, first_seq: sent.append(first_seq), self.session.player_id,
+            timeout_ms=TIMEOUT_MS, max_retries=MAX_RETRIES,
+        )
+        for cell in range(CLICKS_AFTER_LOSS):
+            batcher.add(EventType.CLICK, cell, 0)
+
+        now = 0
+        for _ in range(400):
+            batcher.poll(now)
+            now += TIMEOUT_MS // 4
+        self.assertEqual(len(batcher), 0)
+        self.assertEqual(batcher.give_ups, CLICKS_AFTER_LOSS)
+        self.assertEqual(batcher.unsent, 0)
+        self.assertIn(EVENT_ACK_BITS, sent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+PacketBuffer: packets decode to what was packed, small ones reuse the one
+preallocated buffer, GAME_OVER is sized for any number of players
+(python -m pytest).
+"""
+
+from protocol import (
+    HEADER_SIZE, MAX_DATAGRAM_SIZE, MAX_GAME_OVER_SCORES,
+    MsgType, EventType, PacketBuffer,
+    pack_message, unpack_header, unpack_payload, unpack_event_batch,
+    unpack_game_over, unpack_snapshot_header,
+)
+
+MAX_UDP_PAYLOAD = 65507
+
+
+def test_message_matches_pack_message():
+    out = PacketBuffer()
+    packet = out.message(MsgType.VIEWPORT, 1, 2, 3, 4, seq_num=9, timestamp_ms=123)
+
+    assert bytes(packet) == bytes(pack_message(MsgType.VIEWPORT, 1, 2, 3, 4, seq_num=9, timestamp_ms=123))
+    assert unpack_payload(MsgType.VIEWPORT, packet) == (1, 2, 3, 4)
+    assert packet.obj is out.buf
+
+
+def test_event_batch_round_trip():
+    events = [(seq, EventType.CLICK, seq * 7, 1000 + seq) for seq in range(10)]
+    packet = PacketBuffer().event_batch(5, events, seq_num=0, timestamp_ms=1)
+
+    player_id, records = unpack_event_batch(packet)
+    assert player_id == 5
+    assert list(records) == events
+    assert unpack_header(packet)[6] == len(packet) - HEADER_SIZE
+
+
+def test_game_over_small_uses_the_buffer():
+    out = PacketBuffer()
+    scores = {pid: pid * 10 for pid in range(1, 6)}
+    packet = out.game_over(5, scores, timestamp_ms=1)
+
+    assert packet.obj is out.buf
+    assert unpack_game_over(packet) == (5, scores)
+    assert unpack_header(packet)[2] == MsgType.GAME_OVER
+
+
+def test_game_over_bigger_than_the_buffer():
+    out = PacketBuffer()
+    scores = {pid: pid for pid in range(1, 300)}
+    packet = out.game_over(299, scores)
+
+    assert len(packet) > MAX_DATAGRAM_SIZE
+    assert unpack_game_over(packet) == (299, scores)
+    assert unpack_header(packet)[6] == len(packet) - HEADER_SIZE
+    # the shared buffer is still good for the next packet
+    assert unpack_payload(MsgType.VIEWPORT, out.message(MsgType.VIEWPORT, 1, 1, 1, 1)) == (1, 1, 1, 1)
+
+
+def test_most_game_over_scores_fit_one_datagram():
+    scores = {pid: pid for pid in range(1, MAX_GAME_OVER_SCORES + 1)}
+    packet = PacketBuffer().game_over(1, scores)
+
+    assert len(packet) <= MAX_UDP_PAYLOAD
+    assert len(unpack_game_over(packet)[1]) == MAX_GAME_OVER_SCORES
+
+
+def test_truncated_game_over_keeps_what_arrived():
+    scores = {pid: pid for pid in range(1, 11)}
+    packet = bytes(PacketBuffer().game_over(1, scores))
+
+    winner, partial = unpack_game_over(packet[:-9])
+    assert winner == 1
+    assert partial == {pid: pid for pid in range(1, 9)}
+
+
+def test_snapshot_chunk_patches_event_acks():
+    out = PacketBuffer()
+    # a SNAPSHOT-shaped packet: header, snapshot header, body
+    prebuilt = bytearray(pack_message(MsgType.SNAPSHOT_ACK, 0)) + bytearray(40)
+    packet = out.snapshot_chunk(prebuilt, 17, 0xDEADBEEF)
+
+    assert unpack_snapshot_header(packet)[-2:] == (17, 0xDEADBEEF)
+    assert packet.obj is out.buf
+    # the prebuilt chunk is shared between clients and must stay untouched
+    assert unpack_snapshot_header(prebuilt)[-2:] == (0, 0)
+
+    big = bytearray(MAX_DATAGRAM_SIZE + 100)
+    packet = out.snapshot_chunk(big, 3, 1)
+    assert len(packet) == len(big)
+    assert unpack_snapshot_header(packet)[-2:] == (3, 1)
@@ -0,0 +1,74 @@
+"""
+Grid recordings: records load back through the memmap, appending to a
+recording from another board size is refused, and cells outside a client's
+viewport are not counted as errors (python -m pytest).
+"""
+
+from array import array
+
+import pytest
+
+from client import viewport_cells
+from recording import RecordingWriter, RecordingSink, load_recording, UNKNOWN_CELL
+
+
+def test_writer_and_sink_share_a_file(tmp_path):
+    np = pytest.importorskip("numpy")
+    path = tmp_path / "positions.bin"
+
+    writer = RecordingWriter(path, 3)
+    writer.write(1, 1000, 7, [7] * 9)
+    writer.close()
+    sink = RecordingSink(path, 3)
+    sink.write_batch([(2, 1050, list(range(9))), (3, 1100, [0xFFFF] * 9)])
+    sink.close()
+
+    records = load_recording(path)
+    assert list(records["snapshot_id"]) == [1, 2, 3]
+    assert list(records["player_id"]) == [7, 0, 0]
+    assert np.array_equal(records["cells"][1], np.arange(9))
+    assert records["cells"][2].max() == 0xFFFF
+
+
+def test_append_from_another_board_is_refused(tmp_path):
+    path = tmp_path / "positions.bin"
+    RecordingWriter(path, 3).close()
+    size = path.stat().st_size
+
+    with pytest.raises(ValueError, match="3x3"):
+        RecordingWriter(path, 4)
+    with pytest.raises(ValueError):
+        RecordingSink(path, 4)
+    assert path.stat().st_size == size
+
+    RecordingWriter(path, 3).close()
+
+
+def test_foreign_file_is_refused(tmp_path):
+    path = tmp_path / "positions.bin"
+    path.write_bytes(b"not a recording at all")
+    with pytest.raises(ValueError):
+        RecordingWriter(path, 3)
+
+
+def test_cells_outside_the_viewport_are_not_errors(tmp_path):
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("pandas")
+    from compute_positional_error import compute_positional_error
+
+    server = array("H", range(1, 17))         # 4x4 board
+    client = array("H", server)
+    client[0] = 0                             # stale, outside the viewport
+    client[5] = 0                             # wrong, inside it
+
+    recorded = viewport_cells(client, 4, 1, 1, 2, 2)
+    assert list(recorded) == [UNKNOWN_CELL] * 5 + [0, 7] + [UNKNOWN_CELL] * 2 + [10, 11] + [UNKNOWN_CELL] * 5
+
+    path = tmp_path / "positions.bin"
+    writer = RecordingWriter(path, 4)
+    writer.write(1, 1000, 1, recorded)
+    writer.write(2, 1000, 1, client)
+    writer.close()
+
+    cells = load_recording(path)["cells"]
+    assert list(compute_positional_error(np.array(server), cells)) == [1, 2]
@@ -0,0 +1,109 @@
+"""
+Room server bookkeeping: a room that fails to open answers its JOINs with
+JOIN_NACK, finished rooms are skipped by matchmaking (python -m pytest).
+No worker processes, the queues are plain lists / queue.Queue.
+"""
+
+import asyncio
+import queue
+
+from protocol import MsgType, ALL_CODECS_MASK, pack_message, unpack_header, unpack_payload
+from room_server import (
+    RoomDispatcher, RoomWorker, MAX_ROOM_PLAYERS,
+    PLAYER_LEFT, ROOM_CLOSED, ROOM_FAILED, ROOM_FINISHED,
+)
+
+
+class JoinQueue(list):
+
+    def put(self, item):
+        self.append(item)
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, packet, addr):
+        self.sent.append((bytes(packet), addr))
+
+
+def make_dispatcher():
+    dispatcher = RoomDispatcher([JoinQueue()])
+    dispatcher.connection_made(FakeTransport())
+    return dispatcher
+
+
+def join(dispatcher, port, room_id=0):
+    addr = ("127.0.0.1", port)
+    dispatcher.datagram_received(bytes(pack_message(MsgType.JOIN, ALL_CODECS_MASK, room_id)), addr)
+    return dispatcher.addr_room[addr]
+
+
+def test_matchmaking_fills_rooms_and_frees_seats():
+    dispatcher = make_dispatcher()
+    rooms = [join(dispatcher, port) for port in range(MAX_ROOM_PLAYERS + 1)]
+    assert rooms == [1] * MAX_ROOM_PLAYERS + [2]
+
+    dispatcher.report(PLAYER_LEFT, 1, ("127.0.0.1", 0))
+    assert join(dispatcher, 100) == 1
+
+
+def test_finished_rooms_are_skipped():
+    dispatcher = make_dispatcher()
+    assert join(dispatcher, 1) == 1
+
+    dispatcher.report(ROOM_FINISHED, 1, None)
+    assert join(dispatcher, 2) == 2
+    # asking for the room by id still works
+    assert join(dispatcher, 3, room_id=1) == 1
+
+    # once closed, the room id is free for a new game
+    dispatcher.report(ROOM_CLOSED, 1, None)
+    assert dispatcher.finished_rooms == set()
+    assert 1 not in dispatcher.room_players
+
+
+def test_failed_room_refuses_its_players():
+    dispatcher = make_dispatcher()
+    addrs = [("127.0.0.1", port) for port in (1, 2)]
+    for addr in addrs:
+        join(dispatcher, addr[1])
+
+    dispatcher.report(ROOM_FAILED, 1, None)
+
+    assert [addr for _packet, addr in dispatcher.transport.sent] == addrs
+    packet = dispatcher.transport.sent[0][0]
+    assert unpack_header(packet)[2] == MsgType.JOIN_NACK
+    assert unpack_payload(MsgType.JOIN_NACK, packet) == (1,)
+    assert dispatcher.room_players == {} and dispatcher.addr_room == {}
+
+
+def test_worker_reports_a_room_that_fails_to_open():
+    reports = queue.Queue()
+    worker = RoomWorker(0, "127.0.0.1", None, reports)
+    opened = []
+
+    async def open_room(room_id):
+        opened.append(room_id)
+        await asyncio.sleep(0)
+        raise OSError("no port")
+
+    worker.open_room = open_room
+    data = bytes(pack_message(MsgType.JOIN, ALL_CODECS_MASK, 7))
+
+    async def run():
+        worker.loop = asyncio.get_running_loop()
+        # two JOINs wait for the same room
+        await asyncio.gather(
+            worker.join(7, data, ("127.0.0.1", 1)),
+            worker.join(7, data, ("127.0.0.1", 2)),
+        )
+
+    asyncio.run(run())
+
+    assert opened == [7]
+    assert worker.rooms == {}
+    assert reports.get_nowait() == (ROOM_FAILED, 7, None)
+    assert reports.empty()
@@ -0,0 +1,60 @@
+"""
+StatsRegistry: per-thread counters add up, and players that left are folded
+into PLAYERS_LEFT without touching other threads' counters
+(python -m pytest).
+"""
+
+import threading
+
+from server_stats import StatsRegistry, PLAYERS_LEFT, percentiles
+
+
+def count_in_thread(stats, player_id, nbytes):
+    def run():
+        stats.counters().packet_out(1, player_id, nbytes)
+        done.append(stats.counters())
+
+    done = []
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return done[0]
+
+
+def test_threads_add_up():
+    stats = StatsRegistry()
+    stats.counters().packet_in(2, 1, 100)
+    stats.counters().drop("short_payload")
+    count_in_thread(stats, 1, 50)
+
+    total = stats.collect()
+    assert total.packets_in == {2: 1}
+    assert total.packets_out == {1: 1}
+    assert total.bytes_out == {1: 50}
+    assert total.drops == {"short_payload": 1}
+
+
+def test_forget_player_only_changes_its_own_thread():
+    stats = StatsRegistry()
+    own = stats.counters()
+    own.packet_in(2, 7, 100)
+    own.packet_out(3, 7, 40)
+    own.packet_out(3, 8, 1)
+    other = count_in_thread(stats, 7, 60)
+
+    stats.forget_player(7)
+
+    assert own.bytes_in == {PLAYERS_LEFT: 100}
+    assert own.bytes_out == {PLAYERS_LEFT: 40, 8: 1}
+    assert other.bytes_out == {7: 60}
+
+    total = stats.collect()
+    assert total.bytes_in == {PLAYERS_LEFT: 100}
+    assert total.bytes_out == {PLAYERS_LEFT: 100, 8: 1}
+    # collect() doesn't change anybody's counters either
+    assert other.bytes_out == {7: 60}
+
+
+def test_percentiles():
+    assert percentiles([]) == {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+    assert percentiles(range(1, 101)) == {"p50": 50, "p90": 90, "p99": 99}
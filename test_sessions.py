@@ -0,0 +1,76 @@
+"""
+SessionTable: swap-remove keeps `live` compact with correct slots, and
+expiry follows the least-recently-seen order (python -m pytest).
+"""
+
+from sessions import Session, SessionTable
+
+
+def make_table(count):
+    table = SessionTable()
+    sessions = []
+    for i in range(count):
+        session = Session(i + 1, ("127.0.0.1", 40000 + i), 1, now=i)
+        table.add(session)
+        table.connect(session)
+        sessions.append(session)
+    return table, sessions
+
+
+def assert_slots(table):
+    for slot, session in enumerate(table.live):
+        assert session.slot == slot
+
+
+def test_swap_remove_keeps_live_compact():
+    table, sessions = make_table(5)
+
+    table.remove(sessions[1])
+    assert [s.player_id for s in table.live] == [1, 5, 3, 4]
+    assert_slots(table)
+    assert sessions[1].slot == -1 and not sessions[1].live
+
+    table.remove(sessions[4])     # was moved into slot 1
+    assert [s.player_id for s in table.live] == [1, 4, 3]
+    assert_slots(table)
+
+    table.remove(sessions[2])     # the last one: nothing to swap
+    assert [s.player_id for s in table.live] == [1, 4]
+    assert_slots(table)
+    assert len(table) == 2
+    assert table.get(sessions[2].addr) is None
+    assert table.player(3) is None
+
+
+def test_connect_and_disconnect_are_idempotent():
+    table, sessions = make_table(3)
+    table.connect(sessions[0])
+    assert len(table.live) == 3
+
+    table.disconnect(sessions[0])
+    table.disconnect(sessions[0])
+    assert len(table.live) == 2
+    assert_slots(table)
+    # still known, just not READY
+    assert table.get(sessions[0].addr) is sessions[0]
+
+
+def test_expired_in_least_recently_seen_order():
+    table, sessions = make_table(4)      # last_seen 0, 1, 2, 3
+
+    table.touch(sessions[0], 10)
+    table.touch(sessions[2], 11)
+    assert table.expired(5) == [sessions[1], sessions[3]]
+    assert table.expired(0) == []
+    assert table.expired(100) == [sessions[1], sessions[3], sessions[0], sessions[2]]
+
+
+def test_removed_session_is_gone_everywhere():
+    table, sessions = make_table(3)
+    for session in table.expired(100):
+        table.remove(session)
+
+    assert len(table) == 0
+    assert table.live == []
+    assert table.expired(100) == []
+    assert table.by_player == {}
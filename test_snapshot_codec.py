@@ -0,0 +1,70 @@
+"""
+Snapshot codecs: every codec decodes what it encoded, malformed bodies are
+rejected, encode_smallest honours the negotiated codecs (python -m pytest).
+"""
+
+import random
+
+import pytest
+
+from protocol import SnapshotCodec, ALL_CODECS_MASK, codec_mask
+from snapshot_codec import MAX_RUN, encode_cells, decode_cells, encode_smallest
+
+RAW_CODEC_MASK = codec_mask([SnapshotCodec.RAW])
+
+rng = random.Random(7)
+
+CELLS = {
+    "empty_board": [0] * 100,
+    "one_owner": [3] * 1000,
+    "two_owners": [1, 2] * 50,
+    "max_owner": [0xFFFF, 0, 1] * 33,
+    "long_runs": [5] * (3 * MAX_RUN + 7) + [6] * (MAX_RUN + 1),
+    "random_small": [rng.randrange(8) for _ in range(400)],
+    "random_16bit": [rng.randrange(1 << 16) for _ in range(400)],
+    "single": [9],
+}
+
+
+@pytest.mark.parametrize("codec", list(SnapshotCodec))
+@pytest.mark.parametrize("name", sorted(CELLS))
+def test_round_trip(codec, name):
+    cells = CELLS[name]
+    body = encode_cells(codec, cells)
+
+    assert list(decode_cells(codec, body, len(cells))) == cells
+    # the client decodes straight out of the datagram
+    assert list(decode_cells(codec, memoryview(body), len(cells))) == cells
+
+
+@pytest.mark.parametrize("codec", list(SnapshotCodec))
+def test_wrong_cell_count_is_rejected(codec):
+    body = encode_cells(codec, [1, 2, 3, 4])
+    # (BITPACK pads to a byte, so its count is only checked to the byte)
+    assert decode_cells(codec, body, 8) is None
+    assert decode_cells(codec, body[:-1], 4) is None
+
+
+def test_bad_bitpack_width_is_rejected():
+    assert decode_cells(SnapshotCodec.BITPACK, bytes([0, 0]), 1) is None
+    assert decode_cells(SnapshotCodec.BITPACK, bytes([17, 0, 0, 0]), 1) is None
+    assert decode_cells(SnapshotCodec.BITPACK, b"", 0) is None
+
+
+def test_unknown_codec_is_rejected():
+    assert decode_cells(99, b"\x00\x01", 1) is None
+
+
+def test_encode_smallest_picks_smallest_allowed():
+    cells = CELLS["one_owner"]
+
+    assert encode_smallest(cells, RAW_CODEC_MASK)[0] == SnapshotCodec.RAW
+    codec, body = encode_smallest(cells, ALL_CODECS_MASK)
+    assert codec == SnapshotCodec.RLE
+    assert len(body) < len(encode_cells(SnapshotCodec.BITPACK, cells))
+    assert list(decode_cells(codec, body, len(cells))) == cells
+
+    noisy = CELLS["random_small"]
+    codec, body = encode_smallest(noisy, ALL_CODECS_MASK)
+    assert codec == SnapshotCodec.BITPACK
+    assert list(decode_cells(codec, body, len(noisy))) == noisy
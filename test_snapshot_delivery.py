@@ -0,0 +1,238 @@
+"""
+Tiled, delta-compressed SNAPSHOT delivery: TileLayout geometry, and a
+GameServer feeding a client's SnapshotAssembler over a lossy link (no
+sockets). After the loss stops the client's grid must match the server's.
+Runs with python -m pytest.
+"""
+
+import random
+
+from grid_tiles import TileLayout
+from protocol import (
+    MsgType, SnapshotKind, ALL_CODECS_MASK,
+    pack_message, unpack_header, unpack_snapshot_header,
+)
+from server import (
+    GameServer, KEYFRAME_INTERVAL, SNAPSHOT_HISTORY_SIZE, EGRESS_CLIENT_KBPS,
+    keyframe_drain_ticks,
+)
+from client import SnapshotAssembler
+
+GRID_SIZE = 40
+TILE_SIZE = 8
+CLIENT_ADDR = ("127.0.0.1", 40000)
+
+
+# ---------------------------------------------------------
+# TileLayout
+# ---------------------------------------------------------
+
+def test_tiles_cover_the_board_once():
+    layout = TileLayout(10, 4)     # edge tiles are 2 wide / high
+    assert layout.tiles_per_side == 3
+    assert layout.tile_count == 9
+    assert sum(layout.cell_count(t) for t in range(layout.tile_count)) == 100
+    assert layout.bounds(8) == (8, 8, 10, 10)
+
+    for cell in range(100):
+        row0, col0, row1, col1 = layout.bounds(layout.tile_of(cell))
+        row, col = divmod(cell, 10)
+        assert row0 <= row < row1 and col0 <= col < col1
+
+
+def test_extract_store_round_trip():
+    layout = TileLayout(10, 4)
+    cells = list(range(100))
+    copy = [0] * 100
+    for tile in range(layout.tile_count):
+        values = layout.extract(cells, tile)
+        assert len(values) == layout.cell_count(tile)
+        layout.store(copy, tile, values)
+    assert copy == cells
+
+
+def test_tiles_in_rect_is_clamped():
+    layout = TileLayout(10, 4)
+    assert layout.tiles_in_rect(-5, -5, 100, 100) == list(range(9))
+    assert layout.tiles_in_rect(0, 0, 4, 4) == [0]
+    assert layout.tiles_in_rect(3, 3, 5, 5) == [0, 1, 3, 4]
+    assert layout.tiles_in_rect(20, 20, 30, 30) == []
+
+
+# ---------------------------------------------------------
+# Server -> SnapshotAssembler
+# ---------------------------------------------------------
+
+class FakeTransport:
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr=None):
+        self.sent.append((bytes(data), addr))
+
+    def close(self):
+        pass
+
+
+class Link:
+    """
+    One server and one client's assembler; run() plays ticks and drops
+    every datagram (either way) with probability `loss`.
+    """
+
+    def __init__(self, viewport=None, seed=1):
+        self.rng = random.Random(seed)
+        self.server = GameServer(
+            "127.0.0.1", 0, grid_size=GRID_SIZE, tile_size=TILE_SIZE,
+            metrics_file=None, positions_file=None, journal_file=None,
+            multicast_addr=None, pacing=False,
+        )
+        self.transport = FakeTransport()
+        self.server.connection_made(self.transport)
+        self.to_server(pack_message(MsgType.JOIN, ALL_CODECS_MASK, 0))
+        self.to_server(pack_message(MsgType.READY))
+        if viewport is not None:
+            self.to_server(pack_message(MsgType.VIEWPORT, *viewport))
+        self.player_id = self.server.sessions.get(CLIENT_ADDR).player_id
+
+        self.assembler = SnapshotAssembler(GRID_SIZE, TILE_SIZE)
+        self.kinds = {SnapshotKind.FULL: 0, SnapshotKind.DELTA: 0}
+        self.free = list(range(GRID_SIZE * GRID_SIZE))
+        self.rng.shuffle(self.free)
+
+    def to_server(self, packet):
+        self.server.datagram_received(bytes(packet), CLIENT_ADDR)
+
+    def run(self, ticks, loss=0.0, claims_per_tick=5):
+        for _ in range(ticks):
+            for _ in range(min(claims_per_tick, len(self.free))):
+                self.server.event_inbox.append((self.player_id, self.free.pop()))
+
+            self.transport.sent.clear()
+            self.server.send_snapshots()
+
+            for data, addr in self.transport.sent:
+                header = unpack_header(data)
+                if addr != CLIENT_ADDR or header[2] != MsgType.SNAPSHOT:
+                    continue
+                if self.rng.random() < loss:
+                    continue
+
+                kind = unpack_snapshot_header(data)[0]
+                if kind in self.kinds:
+                    self.kinds[kind] += 1
+
+                snapshot_id = header[3]
+                _applied, complete = self.assembler.apply_chunk(snapshot_id, data)
+                if complete and self.rng.random() >= loss:
+                    self.to_server(pack_message(MsgType.SNAPSHOT_ACK, snapshot_id, snapshot_id=snapshot_id))
+
+
+def test_lossless_link_uses_deltas():
+    link = Link()
+    link.run(60)
+
+    assert link.assembler.cells == link.server.state.cells
+    assert link.kinds[SnapshotKind.DELTA] > link.kinds[SnapshotKind.FULL]
+    # only the first snapshot and the periodic keyframes are full
+    full_snapshots = link.kinds[SnapshotKind.FULL] / link.server.layout.tile_count
+    assert full_snapshots <= 1 + 60 // KEYFRAME_INTERVAL + 1
+
+
+def test_lossy_link_converges():
+    link = Link(seed=3)
+    link.run(150, loss=0.3)
+    link.run(5)
+
+    assert link.assembler.cells == link.server.state.cells
+    assert link.assembler.last_complete_id == link.server.snapshot_id - 1
+
+
+def test_lost_acks_fall_back_to_keyframes():
+    link = Link(seed=5)
+    link.run(3)
+    # nothing at all comes back for longer than the server remembers
+    link.run(80, loss=1.0)
+    link.run(KEYFRAME_INTERVAL + 5)
+
+    assert link.assembler.cells == link.server.state.cells
+
+
+def test_delta_without_baseline_is_ignored():
+    link = Link()
+    link.run(3)
+    link.transport.sent.clear()
+    link.server.event_inbox.append((link.player_id, link.free.pop()))
+    link.server.send_snapshots()
+
+    fresh = SnapshotAssembler(GRID_SIZE, TILE_SIZE)
+    for data, _addr in link.transport.sent:
+        header = unpack_header(data)
+        if header[2] == MsgType.SNAPSHOT and unpack_snapshot_header(data)[0] == SnapshotKind.DELTA:
+            assert fresh.apply_chunk(header[3], data) == (False, False)
+
+
+def test_viewport_client_gets_its_area():
+    link = Link(viewport=(0, 0, 8, 8), seed=7)
+    link.run(100, loss=0.2, claims_per_tick=10)
+    link.run(5)
+
+    aoi = link.server.sessions.get(CLIENT_ADDR).aoi
+    assert aoi is not None and len(aoi[1]) < link.server.layout.tile_count
+
+    layout = link.server.layout
+    for tile in aoi[1]:
+        assert layout.extract(link.assembler.cells, tile) == layout.extract(link.server.state.cells, tile)
+
+
+def test_panned_viewport_catches_up_on_tiles_it_missed():
+    link = Link(viewport=(0, 0, 8, 8), seed=9)
+    link.run(60, claims_per_tick=20)
+
+    # the far corner changed while the client wasn't looking
+    link.to_server(pack_message(MsgType.VIEWPORT, 32, 32, 8, 8))
+    # (short of the next keyframe, which would repair it anyway)
+    link.run(8, claims_per_tick=0)
+
+    layout = link.server.layout
+    for tile in link.server.sessions.get(CLIENT_ADDR).aoi[1]:
+        assert layout.extract(link.assembler.cells, tile) == layout.extract(link.server.state.cells, tile)
+
+
+def test_failed_tick_loses_no_changes():
+    link = Link(seed=11)
+    link.run(5)
+
+    def fail(session, packets):
+        raise RuntimeError("send failed")
+
+    # a tick that dies after the board changed, caught like snapshot_loop does
+    link.server.send_snapshot_packets = fail
+    try:
+        link.run(1, claims_per_tick=20)
+    except RuntimeError:
+        pass
+    del link.server.send_snapshot_packets
+
+    # (short of the next keyframe)
+    link.run(5, claims_per_tick=0)
+    assert link.assembler.cells == link.server.state.cells
+    assert link.kinds[SnapshotKind.FULL] == link.server.layout.tile_count
+
+
+def test_history_outlasts_a_paced_keyframe():
+    # a RAW keyframe of a 1024x1024 board is 2 MB, 2 s at 8000 kbps
+    drain = keyframe_drain_ticks(1024, EGRESS_CLIENT_KBPS)
+    assert drain >= 40
+
+    server = GameServer(
+        "127.0.0.1", 0, grid_size=1024, tile_size=32,
+        metrics_file=None, positions_file=None, journal_file=None, multicast_addr=None,
+    )
+    assert server.history_size > 2 * drain
+    assert server.keyframe_interval > server.history_size
+
+    small = Link().server
+    assert small.history_size == SNAPSHOT_HISTORY_SIZE
+    assert small.keyframe_interval == KEYFRAME_INTERVAL
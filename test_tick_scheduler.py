@@ -0,0 +1,90 @@
+"""
+TickScheduler: deadlines stay on the start + n * interval grid, and the
+CATCH_UP / SKIP policies handle overruns as documented (python -m pytest).
+Uses a fake clock, nothing sleeps.
+"""
+
+from tick_scheduler import TickScheduler, TickPolicy
+
+INTERVAL = 0.25     # exact in binary, so deadlines compare exactly
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(policy, max_catch_up=3):
+    clock = FakeClock()
+    ticks = TickScheduler(INTERVAL, policy, max_catch_up, clock=clock)
+    ticks.start()
+    return ticks, clock
+
+
+def run_tick(ticks, clock, duration):
+    """
+    Sleep until the tick is due, run it for `duration`; returns its start.
+    """
+    clock.now += ticks.delay()
+    start = clock.now
+    ticks.begin()
+    clock.now += duration
+    ticks.end()
+    return start
+
+
+def test_no_drift_with_work():
+    ticks, clock = make_scheduler(TickPolicy.CATCH_UP)
+    starts = [run_tick(ticks, clock, 0.1) for _ in range(20)]
+
+    assert starts == [n * INTERVAL for n in range(20)]
+    assert ticks.overruns == ticks.skipped == ticks.late_ticks == 0
+
+
+def test_catch_up_runs_missed_ticks_back_to_back():
+    ticks, clock = make_scheduler(TickPolicy.CATCH_UP, max_catch_up=3)
+    run_tick(ticks, clock, 0.0)
+    # one stall of 2.5 intervals: the ticks due at 0.5 and 0.75 are owed
+    run_tick(ticks, clock, 2.5 * INTERVAL)
+
+    starts = [run_tick(ticks, clock, 0.0) for _ in range(4)]
+    assert starts[:2] == [3.5 * INTERVAL] * 2      # owed, no sleep
+    assert starts[2:] == [4 * INTERVAL, 5 * INTERVAL]     # back on the grid
+    assert ticks.skipped == 0
+    assert ticks.overruns == 1
+    assert ticks.late_ticks == 2
+
+
+def test_catch_up_is_bounded():
+    ticks, clock = make_scheduler(TickPolicy.CATCH_UP, max_catch_up=3)
+    run_tick(ticks, clock, 10 * INTERVAL)    # ten ticks due
+
+    assert ticks.skipped == 7
+    starts = [run_tick(ticks, clock, 0.0) for _ in range(4)]
+    assert starts == [10 * INTERVAL] * 3 + [11 * INTERVAL]
+
+
+def test_skip_drops_missed_ticks():
+    ticks, clock = make_scheduler(TickPolicy.SKIP)
+    run_tick(ticks, clock, 2.5 * INTERVAL)
+
+    assert ticks.skipped == 2
+    starts = [run_tick(ticks, clock, 0.0) for _ in range(2)]
+    # next deadline on the original grid
+    assert starts == [3 * INTERVAL, 4 * INTERVAL]
+    assert ticks.late_ticks == 0
+
+
+def test_stats():
+    ticks, clock = make_scheduler(TickPolicy.CATCH_UP)
+    run_tick(ticks, clock, 0.1)
+    run_tick(ticks, clock, 0.2)
+
+    stats = ticks.stats()
+    assert stats["ticks"] == 2
+    assert abs(stats["duration_ms_mean"] - 150) < 1e-6
+    assert abs(stats["duration_ms_max"] - 200) < 1e-6
@@ -0,0 +1,104 @@
+"""
+TimerWheel / ReliableSender: timers fire on time, retransmit until acked,
+give up after max_retries. Runs without sockets (python -m pytest).
+"""
+
+from timer_wheel import TimerWheel, ReliableSender
+
+
+def test_timer_fires_once_never_early():
+    wheel = TimerWheel(tick_ms=10, num_slots=8)
+    wheel.arm("a", 25, 0)
+
+    assert wheel.advance(20) == []
+    assert wheel.advance(30) == ["a"]
+    assert wheel.advance(40) == []
+    assert len(wheel) == 0
+
+
+def test_timer_whole_revolutions_away():
+    # 8 slots of 10 ms: 250 ms is three revolutions out
+    wheel = TimerWheel(tick_ms=10, num_slots=8)
+    wheel.arm("far", 250, 0)
+    wheel.arm("near", 10, 0)
+
+    fired = []
+    for now in range(0, 260, 10):
+        fired += [(now, key) for key in wheel.advance(now)]
+    assert fired == [(10, "near"), (250, "far")]
+
+
+def test_timer_after_long_stall():
+    wheel = TimerWheel(tick_ms=10, num_slots=8)
+    wheel.advance(0)
+    for i in range(20):
+        wheel.arm(i, 10 * (i + 1), 0)
+
+    assert sorted(wheel.advance(10_000)) == list(range(20))
+
+
+def test_cancel_and_rearm():
+    wheel = TimerWheel(tick_ms=10)
+    wheel.arm("a", 50, 0)
+    assert wheel.cancel("a")
+    assert not wheel.cancel("a")
+    assert wheel.advance(100) == []
+
+    wheel.arm("b", 50, 100)
+    wheel.arm("b", 200, 100)      # re-arming replaces the deadline
+    assert wheel.advance(150) == []
+    assert wheel.advance(300) == ["b"]
+
+
+def make_sender(**kwargs):
+    sent = []
+    given_up = []
+    sender = ReliableSender(
+        lambda packet, addr: sent.append((packet, addr)),
+        timeout_ms=100, on_give_up=lambda key, msg_type: given_up.append((key, msg_type)),
+        **kwargs,
+    )
+    return sender, sent, given_up
+
+
+def test_retransmits_until_acked():
+    sender, sent, given_up = make_sender()
+    sender.send("color", "PLAYER_COLOR", b"p", ("h", 1), 0)
+    assert sent == [(b"p", ("h", 1))]
+
+    for now in range(0, 350, 10):
+        sender.poll(now)
+    assert len(sent) == 4                 # first send + retransmits at 100, 200, 300
+    assert sender.retransmits == {"PLAYER_COLOR": 3}
+
+    assert sender.ack("color")
+    for now in range(350, 1000, 10):
+        sender.poll(now)
+    assert len(sent) == 4
+    assert "color" not in sender
+    assert given_up == []
+
+
+def test_gives_up_after_max_retries():
+    sender, sent, given_up = make_sender(max_retries=2)
+    sender.send(1, "GAME_OVER", b"g", ("h", 1), 0)
+
+    for now in range(0, 1000, 10):
+        sender.poll(now)
+    assert len(sent) == 3                 # first send + 2 retries
+    assert given_up == [(1, "GAME_OVER")]
+    assert sender.give_ups == {"GAME_OVER": 1}
+    assert len(sender) == 0
+    assert not sender.ack(1)
+
+
+def test_per_message_timeout_and_retries():
+    sender, sent, given_up = make_sender(max_retries=5)
+    sender.send("fast", "X", b"f", None, 0, timeout_ms=20, max_retries=1)
+    sender.send("slow", "Y", b"s", None, 0)
+
+    for now in range(0, 100, 10):
+        sender.poll(now)
+    assert given_up == [("fast", "X")]
+    assert "slow" in sender
+    assert [packet for packet, _addr in sent] == [b"f", b"s", b"f"]
@@ -0,0 +1,136 @@
+"""
+Fixed-rate tick scheduler on absolute monotonic deadlines.
+
+Tick n is due at start + n * interval, no matter how long earlier ticks
+took, so the rate doesn't drift with the work done per tick (sleeping a
+fixed interval after the work runs slow by exactly that work).
+
+When a tick ends after the next deadline already passed, the policy decides
+what happens to the ticks that are due:
+
+CATCH_UP  run them back to back (no sleep) until on schedule again, with
+          at most max_catch_up of them owed; older ones are skipped
+SKIP      drop every missed tick and wait for the next deadline on the
+          original grid
+
+TickScheduler only keeps time, the caller sleeps for delay() and brackets
+the work with begin() / end(). It counts ticks, late starts, overruns
+(work longer than one interval) and skipped ticks, and keeps the duration
+and lateness of the last TICK_HISTORY ticks.
+
+Not thread-safe.
+"""
+
+import time
+from collections import deque
+from enum import IntEnum
+
+
+TICK_HISTORY = 256
+
+
+class TickPolicy(IntEnum):
+    CATCH_UP = 0
+    SKIP = 1
+
+
+class TickScheduler:
+
+    def __init__(self, interval, policy=TickPolicy.CATCH_UP, max_catch_up=3,
+                 late_tolerance=None, clock=time.monotonic):
+        """
+        interval and the returned times are in seconds on clock().
+        A tick starting more than late_tolerance after its deadline counts
+        as late (default: a tenth of the interval).
+        """
+        self.interval = interval
+        self.policy = policy
+        self.max_catch_up = max_catch_up
+        self.late_tolerance = interval / 10 if late_tolerance is None else late_tolerance
+        self.clock = clock
+
+        self.next_deadline = None
+        self.tick_start = None
+
+        # counters
+        self.ticks = 0
+        self.late_ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+
+        # last TICK_HISTORY ticks, seconds
+        self.durations = deque(maxlen=TICK_HISTORY)
+        self.lateness = deque(maxlen=TICK_HISTORY)
+
+    def start(self, now=None):
+        """
+        First tick is due right away.
+        """
+        self.next_deadline = self.clock() if now is None else now
+
+    def delay(self, now=None):
+        """
+        Seconds to sleep before the next tick is due (0 = run it now).
+        """
+        now = self.clock() if now is None else now
+        return max(0.0, self.next_deadline - now)
+
+    def begin(self, now=None):
+        now = self.clock() if now is None else now
+        self.tick_start = now
+
+        late = max(0.0, now - self.next_deadline)
+        self.lateness.append(late)
+        if late > self.late_tolerance:
+            self.late_ticks += 1
+
+    def end(self, now=None):
+        """
+        Record the tick that just ran and schedule the next one.
+        """
+        now = self.clock() if now is None else now
+        duration = now - self.tick_start
+
+        self.ticks += 1
+        self.durations.append(duration)
+        if duration > self.interval:
+            self.overruns += 1
+
+        deadline = self.next_deadline + self.interval
+        if now <= deadline:
+            self.next_deadline = deadline
+            return
+
+        # ticks whose deadline has passed, including the one at `deadline`
+        due = int((now - deadline) // self.interval) + 1
+
+        if self.policy == TickPolicy.SKIP:
+            drop = due
+        else:
+            # keep at most max_catch_up of them, they run back to back
+            drop = max(0, due - self.max_catch_up)
+
+        self.skipped += drop
+        self.next_deadline = deadline + drop * self.interval
+
+    def stats(self):
+        """
+        Counters plus mean / max duration and lateness (ms) over the history.
+        """
+        def summary(samples):
+            if not samples:
+                return 0.0, 0.0
+            return 1000 * sum(samples) / len(samples), 1000 * max(samples)
+
+        mean_duration, max_duration = summary(self.durations)
+        mean_late, max_late = summary(self.lateness)
+        return {
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "duration_ms_mean": mean_duration,
+            "duration_ms_max": max_duration,
+            "lateness_ms_mean": mean_late,
+            "lateness_ms_max": max_late,
+        }
@@ -0,0 +1,188 @@
+"""
+Hashed timer wheel + reliable message scheduler.
+TimerWheel also schedules the retransmits of batched client EVENTs (see
+event_batch.py); ReliableSender is used by the server.
+
+TimerWheel:
+- arm(key, delay) and cancel(key) are O(1)
+- advance(now) only touches the slots between the last call and now,
+  so the cost is the number of expired timers, not the number armed
+
+ReliableSender sits on top of it and implements rdt3.0 style
+retransmission for every reliable message type (PLAYER_COLOR, GAME_OVER,
+...): send() arms a timer, ack() cancels it, poll() resends what
+timed out and gives up after max_retries. It counts retransmits and
+give-ups per message type.
+
+Neither class is thread-safe; callers that share one between threads
+must hold their own lock.
+"""
+
+
+class TimerWheel:
+
+    def __init__(self, tick_ms=10, num_slots=256):
+        self.tick_ms = tick_ms
+        self.num_slots = num_slots
+
+        # each slot: key -> deadline tick (a slot holds every deadline that
+        # hashes to it, including ones that are whole revolutions away)
+        self.slots = [{} for _ in range(num_slots)]
+
+        # key -> slot index, so cancel() never has to search
+        self.timers = {}
+
+        self.current_tick = None
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def arm(self, key, delay_ms, now_ms):
+        """
+        (Re)arm the timer for key to fire delay_ms after now_ms.
+        """
+        self.cancel(key)
+
+        if self.current_tick is None:
+            self.current_tick = now_ms // self.tick_ms
+
+        # round up so a timer never fires early
+        deadline = -(-(now_ms + delay_ms) // self.tick_ms)
+        if deadline <= self.current_tick:
+            deadline = self.current_tick + 1
+
+        slot = deadline % self.num_slots
+        self.slots[slot][key] = deadline
+        self.timers[key] = slot
+
+    def cancel(self, key):
+        """
+        Disarm the timer for key. Returns False if it was not armed.
+        """
+        slot = self.timers.pop(key, None)
+        if slot is None:
+            return False
+
+        del self.slots[slot][key]
+        return True
+
+    def advance(self, now_ms):
+        """
+        Move the wheel forward to now_ms and return the keys that expired.
+        """
+        target = now_ms // self.tick_ms
+
+        if self.current_tick is None:
+            self.current_tick = target
+            return []
+
+        expired = []
+
+        # after a long stall visit every slot once instead of every tick
+        steps = min(target - self.current_tick, self.num_slots)
+        for step in range(1, steps + 1):
+            slot = self.slots[(self.current_tick + step) % self.num_slots]
+            if not slot:
+                continue
+
+            due = [key for key, deadline in slot.items() if deadline <= target]
+            for key in due:
+                del slot[key]
+                del self.timers[key]
+                expired.append(key)
+
+        if target > self.current_tick:
+            self.current_tick = target
+
+        return expired
+
+
+class ReliableSender:
+
+    def __init__(self, send, timeout_ms=500, max_retries=None,
+                 tick_ms=10, num_slots=256, on_give_up=None):
+        """
+        send(packet, addr) puts one datagram on the wire.
+        max_retries=None retransmits until acked.
+        on_give_up(key, msg_type) is called when a message runs out of retries.
+        """
+        self.send_packet = send
+        self.timeout_ms = timeout_ms
+        self.max_retries = max_retries
+        self.on_give_up = on_give_up
+
+        self.wheel = TimerWheel(tick_ms, num_slots)
+
+        # key -> { "packet", "addr", "msg_type", "retries", "timeout_ms", "max_retries" }
+        self.pending = {}
+
+        # msg_type -> count
+        self.retransmits = {}
+        self.give_ups = {}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, key):
+        return key in self.pending
+
+    def send(self, key, msg_type, packet, addr, now_ms,
+             timeout_ms=None, max_retries=None):
+        """
+        Send packet once now and keep retransmitting it until ack(key).
+        Sending again with the same key replaces the pending message.
+        """
+        if timeout_ms is None:
+            timeout_ms = self.timeout_ms
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        self.send_packet(packet, addr)
+
+        self.pending[key] = {
+            "packet": packet,
+            "addr": addr,
+            "msg_type": msg_type,
+            "retries": 0,
+            "timeout_ms": timeout_ms,
+            "max_retries": max_retries,
+        }
+        self.wheel.arm(key, timeout_ms, now_ms)
+
+    def ack(self, key):
+        """
+        Stop retransmitting key. Returns False if it was not pending.
+        """
+        if self.pending.pop(key, None) is None:
+            return False
+
+        self.wheel.cancel(key)
+        return True
+
+    def poll(self, now_ms):
+        """
+        Retransmit every message whose timer expired by now_ms.
+        """
+        for key in self.wheel.advance(now_ms):
+            entry = self.pending.get(key)
+            if entry is None:
+                continue
+
+            msg_type = entry["msg_type"]
+            max_retries = entry["max_retries"]
+
+            if max_retries is not None and entry["retries"] >= max_retries:
+                del self.pending[key]
+                self.give_ups[msg_type] = self.give_ups.get(msg_type, 0) + 1
+                if self.on_give_up is not None:
+                    self.on_give_up(key, msg_type)
+                continue
+
+            self.send_packet(entry["packet"], entry["addr"])
+            entry["retries"] += 1
+            self.retransmits[msg_type] = self.retransmits.get(msg_type, 0) + 1
+
+            self.wheel.arm(key, entry["timeout_ms"], now_ms)